@@ -0,0 +1,195 @@
+"""
+Pipeline benchmark: times every transformation stage and the warehouse loaders
+on synthetic Online Retail data at several sizes, and writes throughput and
+memory per stage so results can be compared across versions.
+
+Usage:
+    python -m benchmarks.run --sizes 100000 1000000 10000000
+    python -m benchmarks.run --sizes 100000 --no-load
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import sqlalchemy
+from loguru import logger
+from config.settings import settings
+from src.ingestion.synthetic import generate_online_retail
+from src.monitoring.metrics import RunMetrics
+from src.transformation.cleaner import DataCleaner
+from src.transformation.currency import CurrencyTransformer
+from src.transformation.rfm import RFMSegmenter
+from src.transformation.fraud import FraudDetector
+from src.quality.checks import QualityChecks
+from src.warehouse.loader import WarehouseLoader, get_engine
+from config.logging_config import setup_logging
+
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000]
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+BENCH_SCHEMA = "etl_bench"
+# Fixed rates keep the runs offline and comparable
+BENCH_RATES = {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}
+HISTORY_FIELDS = ['timestamp', 'revision', 'label', 'engine', 'rows', 'stage', 'calls',
+                  'wall_s', 'cpu_s', 'rows_in', 'rows_out', 'rows_per_s', 'peak_mem_mb']
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def bench_loader():
+    """
+    Loader for the configured WAREHOUSE_BACKEND writing to a scratch schema (PostgreSQL)
+    or a scratch file (DuckDB), so benchmark rows never reach the real warehouse.
+    Returns None if PostgreSQL is unreachable.
+    """
+    if settings.WAREHOUSE_BACKEND == 'duckdb':
+        from src.warehouse.duckdb_loader import DuckDBLoader
+        path = Path(tempfile.gettempdir()) / f"{BENCH_SCHEMA}.duckdb"
+        path.unlink(missing_ok=True)
+        return DuckDBLoader(path)
+
+    url = get_engine().url
+    admin = sqlalchemy.create_engine(url)
+    try:
+        with admin.begin() as conn:
+            conn.execute(sqlalchemy.text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+            conn.execute(sqlalchemy.text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    except Exception as e:
+        logger.warning(f"Warehouse not reachable, skipping loader benchmarks: {e}")
+        return None
+    finally:
+        admin.dispose()
+
+    loader = WarehouseLoader()
+    loader.engine = sqlalchemy.create_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        connect_args={'options': f'-csearch_path={BENCH_SCHEMA}'}
+    )
+    loader.session_factory.configure(bind=loader.engine)
+    # Key index snapshots belong to the real warehouse
+    loader.product_index.path = None
+    loader.date_index.path = None
+    return loader
+
+def run_size(n_rows, seed, load):
+    """Runs the pipeline stages once on n_rows synthetic rows and returns the RunMetrics"""
+    metrics = RunMetrics(f'bench_{n_rows}')
+    copy = not settings.COPY_FREE_PIPELINE
+
+    with metrics.stage('generate') as stage:
+        df = generate_online_retail(n_rows, seed=seed)
+        stage.rows_out = len(df)
+
+    with metrics.stage('clean', rows_in=len(df)) as stage:
+        df = DataCleaner(df, copy=copy).clean()
+        stage.rows_out = len(df)
+
+    with metrics.stage('currency', rows_in=len(df)) as stage:
+        df = CurrencyTransformer(df, BENCH_RATES, copy=copy).transform()
+        stage.rows_out = len(df)
+
+    with metrics.stage('rfm', rows_in=len(df)) as stage:
+        rfm_df = RFMSegmenter(df, copy=copy).generate_segments()
+        stage.rows_out = len(rfm_df)
+
+    with metrics.stage('fraud', rows_in=len(df)) as stage:
+        df = FraudDetector(df, copy=copy).detect()
+        stage.rows_out = len(df)
+
+    with metrics.stage('dq', rows_in=len(df)):
+        QualityChecks(df).run_checks()
+
+    loader = bench_loader() if load else None
+    if loader is not None:
+        try:
+            with metrics.stage('init_db'):
+                loader.init_db()
+            with metrics.stage('load_dimensions', rows_in=len(df)):
+                loader.load_dimensions(df, rfm_df)
+            with metrics.stage('load_facts', rows_in=len(df)):
+                loader.load_facts(df)
+        finally:
+            if isinstance(loader, WarehouseLoader):
+                loader.engine.dispose()
+
+    metrics.status = 'success'
+    return metrics
+
+def write_results(runs, label, output_dir):
+    """Writes one JSON report for this invocation and appends its summaries to history.csv"""
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    now = datetime.now()
+    revision = git_revision()
+
+    report = {
+        'timestamp': now.isoformat(timespec='seconds'),
+        'revision': revision,
+        'label': label,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'copy_free_pipeline': settings.COPY_FREE_PIPELINE,
+        'engine': settings.DATAFRAME_ENGINE,
+        'warehouse': settings.WAREHOUSE_BACKEND,
+        'runs': {n_rows: metrics.report() for n_rows, metrics in runs.items()}
+    }
+    path = output_dir / f"bench_{now:%Y%m%d_%H%M%S}_{revision}.json"
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+
+    history = output_dir / "history.csv"
+    is_new = not history.exists()
+    with open(history, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS, extrasaction='ignore')
+        if is_new:
+            writer.writeheader()
+        for n_rows, metrics in runs.items():
+            for row in metrics.summary():
+                writer.writerow({**row, 'timestamp': report['timestamp'], 'revision': revision,
+                                 'label': label, 'engine': report['engine'], 'rows': n_rows})
+    return path
+
+def print_summary(runs):
+    for n_rows, metrics in runs.items():
+        print(f"\n{n_rows:,} rows")
+        print(f"  {'stage':<16}{'wall s':>10}{'rows/s':>14}{'peak MB':>10}")
+        for row in metrics.summary():
+            rows_per_s = f"{row['rows_per_s']:,.0f}" if row['rows_per_s'] else '-'
+            print(f"  {row['stage']:<16}{row['wall_s']:>10.3f}{rows_per_s:>14}{row['peak_mem_mb']:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="FinanceETLHub - Pipeline Benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Row counts to benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Synthetic data seed')
+    parser.add_argument('--engine', type=str, choices=['pandas', 'polars'], default=None, help='Dataframe engine (default: DATAFRAME_ENGINE)')
+    parser.add_argument('--no-load', action='store_true', help='Skip the warehouse loader benchmarks')
+    parser.add_argument('--label', type=str, default='', help='Free-text label stored with the results')
+    parser.add_argument('--output', type=str, default=str(RESULTS_DIR), help='Results directory')
+    args = parser.parse_args()
+    if args.engine:
+        settings.DATAFRAME_ENGINE = args.engine
+
+    runs = {}
+    for n_rows in args.sizes:
+        logger.info(f"Benchmarking {n_rows:,} rows...")
+        runs[n_rows] = run_size(n_rows, args.seed, load=not args.no_load)
+
+    path = write_results(runs, args.label, args.output)
+    print_summary(runs)
+    print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -14,13 +14,30 @@ class Settings(BaseSettings):
     EXCHANGE_RATE_API_KEY: str = Field(default="demo_key")
     BASE_CURRENCY: str = Field(default="GBP")
     TARGET_CURRENCIES: list = Field(default=["USD", "EUR", "MAD"])
+    FX_HISTORY_ENABLED: bool = Field(default=False)  # convert each line at its invoice date's rate, not today's
+    FX_HISTORY_START: str = Field(default="2010-01-01")  # rate history range when the data's dates are unknown
+    CURRENCY_MODE: str = Field(default="materialized")  # "on_read": fact_sales keeps GBP + rate_date, fx_rates converts
+    FX_HISTORY_PATH: Path = Field(default=BASE_DIR / "data" / "cache" / "fx_rates.parquet")
+    FX_HISTORY_WORKERS: int = Field(default=8)  # concurrent per-day requests when filling the rate history
     
+    # Warehouse backend: "postgres" (server below) or "duckdb" (embedded file at DUCKDB_PATH)
+    WAREHOUSE_BACKEND: str = Field(default="postgres")
+    DUCKDB_PATH: Path = Field(default=BASE_DIR / "data" / "warehouse" / "finance_dw.duckdb")
+
     # Local DB
     POSTGRES_USER: str = Field(default="postgres")
     POSTGRES_PASSWORD: str = Field(default="postgres")
     POSTGRES_DB: str = Field(default="finance_db")
     POSTGRES_HOST: str = Field(default="localhost")
     POSTGRES_PORT: int = Field(default=5432)
+    LOAD_METHOD: str = Field(default="copy")  # "copy" (COPY FROM STDIN) or "to_sql"
+    LOAD_BATCH_SIZE: int = Field(default=100_000)
+    DB_POOL_SIZE: int = Field(default=5)
+    DB_MAX_OVERFLOW: int = Field(default=5)
+    LOAD_WORKERS: int = Field(default=4)  # concurrent warehouse writes, each on its own pooled connection
+    FACT_PARTITIONING: bool = Field(default=False)  # fact_sales range-partitioned by month of invoice_date
+    DIM_INDEX_ENABLED: bool = Field(default=True)  # persist dimension key indexes between runs
+    DIM_INDEX_PATH: Path = Field(default=BASE_DIR / "data" / "cache" / "dimensions")
     
     # GCP
     GCP_PROJECT_ID: str = Field(default="")
@@ -31,8 +48,35 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = Field(default="INFO")
     RAW_DATA_PATH: Path = Field(default=BASE_DIR / "data" / "raw")
     PROCESSED_DATA_PATH: Path = Field(default=BASE_DIR / "data" / "processed")
+    COPY_FREE_PIPELINE: bool = Field(default=False)  # opt-in: stages hand one frame along instead of copying it
+    DATAFRAME_ENGINE: str = Field(default="pandas")  # "pandas" or "polars" (lazy, multithreaded transformations)
+    DASHBOARD_QUERY_WORKERS: int = Field(default=4)  # dashboard queries run concurrently on pooled connections
     DATASET_URL: str = Field(default="https://archive.ics.uci.edu/ml/machine-learning-databases/00352/Online%20Retail.xlsx")
 
+    # Ingestion
+    RAW_CACHE_ENABLED: bool = Field(default=True)
+    RAW_CACHE_PATH: Path = Field(default=BASE_DIR / "data" / "cache" / "raw")
+    INGEST_WORKERS: int = Field(default=1)
+    DEDUP_INDEX_ENABLED: bool = Field(default=True)
+    DEDUP_INDEX_PATH: Path = Field(default=BASE_DIR / "data" / "cache" / "row_hashes.npy")
+
+    # Run metrics
+    METRICS_ENABLED: bool = Field(default=True)  # JSON run report per pipeline run
+    METRICS_PATH: Path = Field(default=BASE_DIR / "data" / "metrics")
+    METRICS_DB_ENABLED: bool = Field(default=False)  # also append stage rows to pipeline_runs
+
+    # Incremental state
+    WATERMARK_PATH: Path = Field(default=BASE_DIR / "data" / "state" / "watermarks.json")  # --step incremental
+    REPLAY_UPDATE_RATE: float = Field(default=0.05)  # --step replay: UPDATE events per inserted line
+    REPLAY_DELETE_RATE: float = Field(default=0.01)  # --step replay: DELETE events per inserted line
+    REPLAY_SNAPSHOT_RATIO: float = Field(default=0.5)  # --step replay: share of lines loaded up front; must span enough days for RFM recency quartiles
+    RFM_STATE_ENABLED: bool = Field(default=True)
+    RFM_STATE_PATH: Path = Field(default=BASE_DIR / "data" / "state" / "rfm")
+    FRAUD_STATE_ENABLED: bool = Field(default=True)
+    FRAUD_STATE_PATH: Path = Field(default=BASE_DIR / "data" / "state" / "fraud")
+    FRAUD_SKETCH_K: int = Field(default=200)  # ~1.3% rank error on the IQR quartiles
+    FRAUD_SKETCH_MIN_ROWS: int = Field(default=1_000_000)  # in-memory runs and running baselines switch to the sketch above this size
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
 settings = Settings()
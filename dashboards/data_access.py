@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from config.settings import settings
+from src.warehouse.loader import get_loader
+
+# Independent KPI and chart queries of the dashboard, all served by the rollup tables
+DASHBOARD_QUERIES = {
+    'total_sales': "SELECT SUM(revenue_gbp) FROM agg_daily_sales",
+    'total_orders': "SELECT SUM(order_count) FROM agg_daily_sales",
+    'total_customers': "SELECT SUM(customer_count) FROM agg_customer_segments",
+    'sales_by_country': """
+        SELECT country, SUM(revenue_gbp) as revenue
+        FROM agg_daily_sales
+        GROUP BY country ORDER BY revenue DESC LIMIT 10
+    """,
+    'segments': "SELECT rfm_segment, customer_count as count FROM agg_customer_segments"
+}
+
+class DashboardData:
+    """
+    Read side of the dashboard. Queries run concurrently over the warehouse's
+    pooled connections, and their results are cached until the ETL records a
+    new load watermark, so a page refresh costs one round trip while nothing
+    has been loaded and is never served numbers older than the last load.
+    """
+    def __init__(self, warehouse=None, workers=None):
+        """
+        :param warehouse: Loader to read from (default: get_loader())
+        :param workers: Concurrent queries (default: DASHBOARD_QUERY_WORKERS)
+        """
+        self.warehouse = warehouse or get_loader()
+        self.workers = workers or settings.DASHBOARD_QUERY_WORKERS
+        self._lock = threading.Lock()
+        self._watermark = None
+        self._cache = {}
+
+    def fetch(self, queries=None):
+        """
+        :param queries: name -> SQL (default: DASHBOARD_QUERIES)
+        :return: name -> DataFrame
+        """
+        queries = queries or DASHBOARD_QUERIES
+        watermark = self.warehouse.load_watermark()
+        with self._lock:
+            if watermark != self._watermark:
+                if self._watermark is not None:
+                    logger.info(f"Load watermark moved to {watermark}, refreshing dashboard queries.")
+                self._cache = {}
+                self._watermark = watermark
+            cache = self._cache
+            missing = sorted({sql for sql in queries.values() if sql not in cache})
+
+        if missing:
+            workers = max(1, min(self.workers, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = dict(zip(missing, pool.map(self.warehouse.read_sql, missing)))
+            # A load that committed meanwhile has already replaced `cache`, so these are dropped
+            with self._lock:
+                cache.update(results)
+        else:
+            results = {}
+
+        return {name: results[sql] if sql in results else cache[sql] for name, sql in queries.items()}
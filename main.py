@@ -1,24 +1,42 @@
 import argparse
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
 from loguru import logger
 from src.ingestion.csv_loader import CSVLoader
 from src.ingestion.fx_api import FXFetcher
-from src.ingestion.cdc_simulator import CDCSimulator
+from src.ingestion.cdc_simulator import CDCSimulator, REMOVED_OPERATIONS
+from src.ingestion.watermark import SourceWatermarks
 from src.transformation.cleaner import DataCleaner
 from src.transformation.currency import CurrencyTransformer
-from src.transformation.rfm import RFMSegmenter
-from src.transformation.fraud import FraudDetector
-from src.warehouse.loader import WarehouseLoader
+from src.transformation.rfm import RFMSegmenter, RFMState
+from src.transformation.fraud import FraudDetector, FraudBaseline
+from src.warehouse.loader import get_loader
 from src.warehouse.gcp_loader import GCPLoader
 from src.analytics.predictive import SalesForecaster, ChurnPredictor
 from src.quality.checks import QualityChecks
+from src.ingestion.hash_index import RowHashIndex, PartitionedRowIndex
+from src.monitoring.metrics import RunMetrics
+from config.settings import settings
 from config.logging_config import setup_logging
 
 def main():
     parser = argparse.ArgumentParser(description="FinanceETLHub - End-to-End ETL Pipeline")
-    parser.add_argument('--step', type=str, choices=['ingest', 'transform', 'load', 'full', 'cdc', 'dashboard', 'predict'], default='full', help='ETL Step to run')
+    parser.add_argument('--step', type=str, choices=['ingest', 'transform', 'load', 'full', 'cdc', 'incremental', 'replay', 'dashboard', 'predict'], default='full', help='ETL Step to run')
+    parser.add_argument('--workers', type=int, default=None, help='Processes used to parse source files (default: INGEST_WORKERS)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Stream the dataset through the pipeline in chunks of N rows')
+    parser.add_argument('--batches', type=int, default=20, help='Micro-batches emitted by --step replay')
+    parser.add_argument('--rate', type=float, default=None, help='Change events per second replayed by --step replay (default: as fast as loads allow)')
+    parser.add_argument('--engine', type=str, choices=['pandas', 'polars'], default=None, help='Dataframe engine for the transformations (default: DATAFRAME_ENGINE)')
     args = parser.parse_args()
 
+    if args.engine:
+        settings.DATAFRAME_ENGINE = args.engine
+
     if args.step == 'dashboard':
         import subprocess
         logger.info("Launching Dashboard...")
@@ -26,6 +44,42 @@ def main():
         return
 
     logger.info(f"Starting ETL Pipeline in '{args.step}' mode...")
+    metrics = RunMetrics(args.step)
+    try:
+        run_pipeline(args, metrics)
+        metrics.status = 'success'
+    except SystemExit as e:
+        # Stages stop the run with sys.exit(1) on DQ or load failures
+        metrics.status = 'failed' if e.code else 'success'
+        raise
+    except BaseException:
+        metrics.status = 'failed'
+        raise
+    finally:
+        write_run_report(metrics)
+
+def run_pipeline(args, metrics):
+    """Runs the requested step, recording every stage in `metrics`"""
+    # --- Streaming Mode: bounded-size chunks end to end ---
+    if args.chunk_size and args.step in ['transform', 'load', 'full']:
+        logger.info(f">>> Streaming mode: chunks of {args.chunk_size} rows")
+        loader = CSVLoader(workers=args.workers)
+        with metrics.stage('fx_rates'):
+            rates = fetch_rates()
+        process_stream(metrics.timed_iter('ingest', loader.iter_chunks(args.chunk_size)), rates, metrics=metrics)
+        return
+    if args.chunk_size:
+        logger.warning(f"--chunk-size is not supported for '{args.step}', processing in memory.")
+
+    # --- Incremental Mode: only rows beyond each source's watermark ---
+    if args.step == 'incremental':
+        run_incremental(args, metrics)
+        return
+
+    # --- Replay Mode: a stream of INSERT/UPDATE/DELETE micro-batches ---
+    if args.step == 'replay':
+        run_replay(args, metrics)
+        return
 
     # Shared state
     raw_df = None
@@ -33,11 +87,7 @@ def main():
     # --- Step 1: Ingestion ---
     if args.step in ['ingest', 'full', 'cdc']:
         logger.info(">>> Step 1: Data Ingestion")
-        loader = CSVLoader()
-        raw_df = loader.get_data()
-        
-        fx_fetcher = FXFetcher()
-        rates = fx_fetcher.get_rates()
+        raw_df, rates = ingest(args, metrics)
         
         if raw_df is None or rates is None:
             logger.critical("Ingestion failed. Exiting.")
@@ -52,40 +102,45 @@ def main():
         # Handle CDC Simulation
         if args.step == 'cdc':
             logger.info(">>> Simulating Change Data Capture (CDC)")
-            cdc = CDCSimulator(raw_df)
-            initial_batch = cdc.get_initial_load()
-            incremental_batch = cdc.get_incremental_load()
+            with metrics.stage('cdc_split', rows_in=len(raw_df)):
+                cdc = CDCSimulator(raw_df)
+                initial_batch = cdc.get_initial_load()
+                incremental_batch = cdc.get_incremental_load()
+            # One loader for every batch: its pooled engine and warm key indexes are reused
+            dw_loader = get_loader()
             
             # Process Initial Batch first
             logger.info("Processing Initial Batch...")
-            process_data(initial_batch, rates, is_initial=True)
+            process_data(initial_batch, rates, is_initial=True, dw_loader=dw_loader, metrics=metrics, batch='initial')
             
             # Process Incremental Batch
             logger.info("Processing Incremental Batch...")
-            process_data(incremental_batch, rates, is_initial=False)
+            process_data(incremental_batch, rates, is_initial=False, dw_loader=dw_loader,
+                         metrics=metrics, batch='incremental')
             logger.success("CDC Pipeline Simulation Completed!")
             return
 
     # --- Step 2 & 3: Standard Flow ---
     if args.step in ['transform', 'load', 'full', 'predict']:
         if raw_df is None:
-            loader = CSVLoader()
-            raw_df = loader.get_data()
-            fx_fetcher = FXFetcher()
-            rates = fx_fetcher.get_rates()
+            raw_df, rates = ingest(args, metrics)
         
         # In predict mode, we just need to run transformation to get clean data
         # but we don't necessarily need to load to DB unless specified.
         # Let's run it and then trigger AI logic.
-        processed_df, rfm_df = process_data(raw_df, rates, run_load=(args.step != 'predict'))
+        processed_df, rfm_df = process_data(raw_df, rates, run_load=(args.step != 'predict'), metrics=metrics)
 
         if args.step == 'predict':
             logger.info(">>> Step 4: AI Predictive Analytics")
-            forecaster = SalesForecaster(processed_df)
-            forecast = forecaster.forecast_revenue(days=30)
+            with metrics.stage('forecast', rows_in=len(processed_df)) as stage:
+                forecaster = SalesForecaster(processed_df)
+                forecast = forecaster.forecast_revenue(days=30)
+                stage.rows_out = len(forecast)
             
-            churn_risk = ChurnPredictor(rfm_df)
-            risky_customers = churn_risk.identify_high_risk_customers()
+            with metrics.stage('churn', rows_in=len(rfm_df)) as stage:
+                churn_risk = ChurnPredictor(rfm_df)
+                risky_customers = churn_risk.identify_high_risk_customers()
+                stage.rows_out = len(risky_customers)
             
             print("\n--- AI SALES FORECAST (Next 7 Days) ---")
             print(forecast.head(7))
@@ -97,46 +152,266 @@ def main():
             risky_customers.to_csv("data/processed/churn_risk.csv", index=False)
             logger.success("Predictive insights saved to data/processed/")
 
-def process_data(df, rates, is_initial=True, run_load=True):
-    """Encapsulates the transformation and loading logic"""
+def ingest(args, metrics):
+    """Reads the source files and fetches FX rates, one stage each"""
+    with metrics.stage('ingest') as stage:
+        raw_df = CSVLoader(workers=args.workers).get_data()
+        stage.rows_out = len(raw_df) if raw_df is not None else 0
+    with metrics.stage('fx_rates'):
+        rates = fetch_rates(raw_df)
+    return raw_df, rates
+
+def fetch_rates(df=None):
+    """
+    FX rates for a batch: today's snapshot or, with FX_HISTORY_ENABLED, the
+    daily rate history covering the batch's invoice dates (FX_HISTORY_START to
+    today when they are not known up front, as in streaming runs)
+    """
+    fetcher = FXFetcher()
+    if not settings.FX_HISTORY_ENABLED:
+        return fetcher.get_rates()
+    if df is None or df.empty:
+        return fetcher.get_rate_history()
+    # Distinct timestamps only: raw dates are still strings here
+    dates = pd.to_datetime(pd.Series(df['InvoiceDate'].unique()), errors='coerce')
+    return fetcher.get_rate_history(dates.min(), dates.max()) if dates.notna().any() else fetcher.get_rate_history()
+
+def run_incremental(args, metrics):
+    """
+    Extracts and processes only the rows added to the sources since the last
+    incremental run; the first run (no watermarks yet) is an initial load.
+    Watermarks advance only once the batch is in the warehouse.
+    """
+    watermarks = SourceWatermarks(settings.WATERMARK_PATH)
+    is_initial = not watermarks.marks
+
+    logger.info(">>> Step 1: Incremental Extraction")
+    with metrics.stage('ingest') as stage:
+        new_df, marks = CSVLoader(workers=args.workers).extract_new_rows(watermarks)
+        stage.rows_out = len(new_df)
+
+    if new_df.empty:
+        logger.info("No rows beyond the source watermarks, nothing to load.")
+    else:
+        with metrics.stage('fx_rates'):
+            rates = fetch_rates(new_df)
+        process_data(new_df, rates, is_initial=is_initial, metrics=metrics,
+                     batch='initial' if is_initial else 'incremental')
+
+    watermarks.update(marks)
+    watermarks.save()
+    logger.success("Incremental run completed.")
+
+def run_replay(args, metrics):
+    """
+    Replays the dataset as CDC micro-batches through the transformation and
+    warehouse stages, after an initial snapshot of REPLAY_SNAPSHOT_RATIO of the
+    lines. Batches are released at `args.rate` events/s; each batch's latency
+    runs from its release until its load has committed.
+    """
+    raw_df, rates = ingest(args, metrics)
+    if raw_df is None or rates is None:
+        logger.critical("Ingestion failed. Exiting.")
+        sys.exit(1)
+
+    logger.info(f">>> Replaying CDC events in {args.batches} micro-batches")
+    cdc = CDCSimulator(raw_df)
+    snapshot = settings.REPLAY_SNAPSHOT_RATIO > 0
+    batches = cdc.replay(args.batches, update_rate=settings.REPLAY_UPDATE_RATE,
+                         delete_rate=settings.REPLAY_DELETE_RATE, snapshot_ratio=settings.REPLAY_SNAPSHOT_RATIO)
+    dw_loader = get_loader()
+    if snapshot:
+        # The initial load spans enough history to score customers on; it is not part of the timed stream
+        process_data(next(batches), rates, is_initial=True, dw_loader=dw_loader, metrics=metrics, batch='snapshot')
+    latencies, events = [], 0
+    started = time.perf_counter()
+
+    for i, batch_df in enumerate(metrics.timed_iter('cdc_replay', batches)):
+        # The batch is due once the events before it have been replayed at the target rate
+        due = started + events / args.rate if args.rate else time.perf_counter()
+        time.sleep(max(0.0, due - time.perf_counter()))
+
+        process_data(batch_df, rates, is_initial=(i == 0 and not snapshot), dw_loader=dw_loader,
+                     metrics=metrics, batch=f'batch_{i + 1}')
+
+        latencies.append(time.perf_counter() - due)
+        events += len(batch_df)
+        logger.info(f"Batch {i + 1}/{args.batches}: {len(batch_df)} events, latency {latencies[-1]:.3f}s")
+
+    elapsed = time.perf_counter() - started
+    if latencies:
+        logger.success(
+            f"Replayed {events} events in {elapsed:.2f}s ({events / elapsed:,.0f} events/s sustained); "
+            f"batch latency p50 {np.percentile(latencies, 50):.3f}s, max {max(latencies):.3f}s"
+        )
+
+def write_run_report(metrics):
+    """Writes the JSON run report and, when enabled, the pipeline_runs rows"""
+    if not metrics.stages:
+        return
+    if settings.METRICS_ENABLED:
+        metrics.save(settings.METRICS_PATH)
+    if settings.METRICS_DB_ENABLED:
+        try:
+            get_loader().record_run_metrics(metrics.to_frame())
+        except Exception as e:
+            logger.warning(f"Could not record run metrics in the warehouse: {e}")
+
+def process_data(df, rates, is_initial=True, run_load=True, dw_loader=None, metrics=None, batch=None):
+    """
+    Encapsulates the transformation and loading logic. CDC batches may carry
+    removed lines (REMOVED_OPERATIONS): they are retracted from the RFM state
+    and the dedup index and deleted from fact_sales in the same pass.
+    :param dw_loader: Warehouse loader to reuse across batches (get_loader() if omitted)
+    :param metrics: RunMetrics that records each stage (a throwaway one if omitted)
+    :param batch: Label of this batch in the metrics (e.g. 'initial', 'incremental')
+    """
+    metrics = metrics or RunMetrics('process_data')
+
+    # Rows already in fact_sales are only skipped when this run loads, and only
+    # with an index saved for the warehouse as it is now
+    dw_loader = (dw_loader or get_loader()) if run_load else None
+    hash_index = None
+    if run_load and settings.DEDUP_INDEX_ENABLED:
+        try:
+            hash_index = RowHashIndex(settings.DEDUP_INDEX_PATH, token=dw_loader.load_token())
+        except Exception as e:
+            logger.critical(f"Warehouse load failed: {e}")
+            sys.exit(1)
+
+    # Copy-free mode: every stage works on the frame the previous stage returned
+    copy = not settings.COPY_FREE_PIPELINE
+
+    removed_df = None
+    if 'cdc_operation' in df.columns:
+        is_removed = df['cdc_operation'].isin(REMOVED_OPERATIONS).to_numpy()
+        if is_removed.any():
+            removed_df, df = df[is_removed], df[~is_removed]
+
     # 1. Cleaning
-    cleaner = DataCleaner(df)
-    clean_df = cleaner.clean()
+    with metrics.stage('clean', batch, rows_in=len(df)) as stage:
+        cleaner = DataCleaner(df, hash_index=hash_index, copy=copy)
+        clean_df = cleaner.clean()
+        new_rows, row_hashes = cleaner.new_rows, cleaner.row_hashes
+        stage.rows_out = len(clean_df)
+
+    # Removed lines are cleaned and converted like they were when loaded, so they
+    # hash and key the same and carry the Total_GBP to take back out of the state
+    if removed_df is not None:
+        with metrics.stage('clean_removed', batch, rows_in=len(removed_df)) as stage:
+            remover = DataCleaner(removed_df, copy=copy)
+            removed_df = CurrencyTransformer(remover.clean(), rates, copy=copy).transform()
+            removed_hashes = remover.row_hashes
+            stage.rows_out = len(removed_df)
+
+    # Incremental batches are folded into persisted state, so rows an earlier
+    # load already accounted for must not reach the stateful stages again
+    if not is_initial:
+        clean_df, row_hashes, new_rows = clean_df[new_rows], row_hashes[new_rows], new_rows[new_rows]
+        if clean_df.empty and removed_df is None:
+            logger.info("Incremental batch contains no new rows.")
+            return clean_df, None
     
     # 2. Currency Calc
-    transformer = CurrencyTransformer(clean_df, rates)
-    processed_df = transformer.transform()
+    with metrics.stage('currency', batch, rows_in=len(clean_df)) as stage:
+        transformer = CurrencyTransformer(clean_df, rates, copy=copy)
+        processed_df = transformer.transform()
+        fx_rates = transformer.rate_table()
+        stage.rows_out = len(processed_df)
     
     # 3. RFM Analysis
-    rfm = RFMSegmenter(processed_df)
-    rfm_df = rfm.generate_segments()
+    # Initial loads score the batch directly and rebuild the persisted state;
+    # incremental batches are merged into that state so RFM covers full history.
+    with metrics.stage('rfm', batch, rows_in=len(processed_df)) as stage:
+        rfm_state = None
+        if run_load and settings.RFM_STATE_ENABLED:
+            rfm_state = RFMState() if is_initial else RFMState.load(settings.RFM_STATE_PATH)
+            # An UPDATE's after image is counted here and its before image retracted
+            rfm_state.update(processed_df)
+            if removed_df is not None:
+                rfm_state.retract(removed_df)
+
+        if rfm_state is not None and not is_initial:
+            rfm_df = rfm_state.generate_segments()
+        else:
+            rfm = RFMSegmenter(processed_df, copy=copy)
+            rfm_df = rfm.generate_segments()
+        stage.rows_out = len(rfm_df)
     
     # 4. Fraud Detection
-    fraud = FraudDetector(processed_df)
-    processed_df = fraud.detect()
+    # Same idea: incremental batches are scored against the persisted baselines,
+    # while the initial batch is scored on its own and only seeds them
+    with metrics.stage('fraud', batch, rows_in=len(processed_df)) as stage:
+        fraud_baseline = None
+        if run_load and settings.FRAUD_STATE_ENABLED:
+            fraud_baseline = FraudBaseline() if is_initial else FraudBaseline.load(settings.FRAUD_STATE_PATH)
+        fraud = FraudDetector(processed_df, baseline=None if is_initial else fraud_baseline, copy=copy)
+        processed_df = fraud.detect()
+        if is_initial and fraud_baseline is not None:
+            fraud_baseline.fold(processed_df)
+        if fraud_baseline is not None and removed_df is not None:
+            fraud_baseline.retract(removed_df)
+        stage.rows_out = len(processed_df)
     
     # 5. Data Quality
-    dq = QualityChecks(processed_df)
-    if not dq.run_checks():
+    with metrics.stage('dq', batch, rows_in=len(processed_df)):
+        dq = QualityChecks(processed_df, fx_rates=fx_rates)
+        dq_passed = dq.run_checks()
+    if not dq_passed:
         logger.error("Stopping pipeline due to DQ failures.")
         sys.exit(1)
 
     # 6. Warehouse Load
     if run_load:
         logger.info(">>> Loading to Data Warehouse")
-        dw_loader = WarehouseLoader()
         gcp_loader = GCPLoader()
         
         try:
             if is_initial:
-                dw_loader.init_db()
-            dw_loader.load_dimensions(processed_df, rfm_df)
-            dw_loader.load_facts(processed_df)
-            
-            # Cloud Upload (GCP)
-            if gcp_loader.bq_client:
-                logger.info(">>> Uploading to Google Cloud BigQuery")
-                gcp_loader.load_star_schema(processed_df, rfm_df)
+                with metrics.stage('init_db', batch):
+                    dw_loader.init_db()
+            new_facts = processed_df[new_rows]
+
+            def upload_to_cloud():
+                with metrics.stage('bigquery', batch, rows_in=len(new_facts)):
+                    gcp_loader.load_star_schema(new_facts if not new_facts.empty else None, rfm_df, fx_rates=fx_rates)
+
+            # Cloud Upload (GCP) runs alongside the warehouse writes
+            with ThreadPoolExecutor(max_workers=1) as cloud:
+                cloud_upload = None
+                if gcp_loader.bq_client:
+                    logger.info(">>> Uploading to Google Cloud BigQuery")
+                    cloud_upload = cloud.submit(upload_to_cloud)
+
+                with metrics.stage('load_dimensions', batch, rows_in=len(processed_df)):
+                    country_map = rfm_state.country_map() if rfm_state is not None else None
+                    dw_loader.load_dimensions(processed_df, rfm_df, country_map=country_map, fx_rates=fx_rates)
+
+                # Facts: only rows the dedup index has not seen in a previous load
+                if not new_facts.empty:
+                    with metrics.stage('load_facts', batch, rows_in=len(new_facts)):
+                        dw_loader.load_facts(new_facts)
+                else:
+                    logger.info("No new sales records to load.")
+
+                if removed_df is not None:
+                    with metrics.stage('delete_facts', batch, rows_in=len(removed_df)) as stage:
+                        stage.rows_out = dw_loader.delete_facts(removed_df)
+
+                if cloud_upload is not None:
+                    cloud_upload.result()
+
+            with metrics.stage('save_state', batch):
+                if hash_index is not None:
+                    # Deleted lines leave the index, so they load again if they are re-sent
+                    if removed_df is not None:
+                        hash_index.remove(removed_hashes)
+                    hash_index.add(row_hashes[new_rows])
+                    hash_index.save(dw_loader.load_token())
+                if rfm_state is not None:
+                    rfm_state.save(settings.RFM_STATE_PATH)
+                if fraud_baseline is not None:
+                    fraud_baseline.save(settings.FRAUD_STATE_PATH)
                 
             logger.success("Batch Processing Successful!")
         except Exception as e:
@@ -145,5 +420,106 @@ def process_data(df, rates, is_initial=True, run_load=True):
     
     return processed_df, rfm_df
 
+def process_stream(chunks, rates, is_initial=True, run_load=True, metrics=None):
+    """
+    Streaming variant of process_data: every chunk is cleaned, converted,
+    fraud-scored, checked and loaded on its own. RFM, the fraud baselines and the
+    hashes of rows seen so far are running state partitioned by invoice month;
+    each chunk reads only its months and writes them back to disk (the persisted
+    state, or a scratch directory), so memory is bounded by the chunk size.
+    :param metrics: RunMetrics that records each stage per chunk (a throwaway one if omitted)
+    """
+    metrics = metrics or RunMetrics('process_stream')
+    scratch = tempfile.TemporaryDirectory(prefix='etl_stream_')
+    rfm_state = RFMState()
+    rfm_path = settings.RFM_STATE_PATH if run_load and settings.RFM_STATE_ENABLED else Path(scratch.name) / "rfm"
+    fraud_baseline = FraudBaseline()
+    fraud_path = settings.FRAUD_STATE_PATH if run_load and settings.FRAUD_STATE_ENABLED else Path(scratch.name) / "fraud"
+    # Rows seen earlier in this stream are dropped; rows loaded by previous runs are not reloaded
+    run_index = PartitionedRowIndex(Path(scratch.name) / "row_hashes")
+    dw_loader = get_loader() if run_load else None
+    hash_index = None
+    gcp_loader = GCPLoader() if run_load else None
+    copy = not settings.COPY_FREE_PIPELINE
+
+    try:
+        if run_load and settings.DEDUP_INDEX_ENABLED:
+            hash_index = RowHashIndex(settings.DEDUP_INDEX_PATH, token=dw_loader.load_token())
+        if run_load and is_initial:
+            with metrics.stage('init_db'):
+                dw_loader.init_db()
+
+        total_rows = 0
+        for i, chunk in enumerate(chunks, start=1):
+            logger.info(f"Processing chunk {i} ({len(chunk)} rows)...")
+            with metrics.stage('clean', i, rows_in=len(chunk)) as stage:
+                cleaner = DataCleaner(chunk, hash_index=hash_index, copy=copy)
+                clean_df = cleaner.clean()
+                unseen = run_index.add(cleaner.row_hashes, clean_df['InvoiceDate'])
+                clean_df, new_rows = clean_df[unseen], cleaner.new_rows[unseen]
+                stage.rows_out = len(clean_df)
+            run_index.save()
+            if clean_df.empty:
+                continue
+
+            with metrics.stage('currency', i, rows_in=len(clean_df)) as stage:
+                transformer = CurrencyTransformer(clean_df, rates, copy=copy)
+                processed_df = transformer.transform()
+                fx_rates = transformer.rate_table()
+                stage.rows_out = len(processed_df)
+            with metrics.stage('rfm', i, rows_in=len(processed_df)):
+                rfm_state.update(processed_df)
+            with metrics.stage('fraud', i, rows_in=len(processed_df)) as stage:
+                processed_df = FraudDetector(processed_df, baseline=fraud_baseline, copy=copy).detect()
+                stage.rows_out = len(processed_df)
+
+            with metrics.stage('dq', i, rows_in=len(processed_df)):
+                dq_passed = QualityChecks(processed_df, fx_rates=fx_rates).run_checks()
+            if not dq_passed:
+                logger.error("Stopping pipeline due to DQ failures.")
+                sys.exit(1)
+
+            new_facts = processed_df[new_rows]
+            if run_load and not new_facts.empty:
+                with metrics.stage('load_dimensions', i, rows_in=len(processed_df)):
+                    dw_loader.load_dimensions(processed_df, fx_rates=fx_rates)
+                with metrics.stage('load_facts', i, rows_in=len(new_facts)):
+                    dw_loader.load_facts(new_facts)
+                if gcp_loader.bq_client:
+                    with metrics.stage('bigquery', i, rows_in=len(new_facts)):
+                        gcp_loader.load_star_schema(new_facts, fx_rates=fx_rates)
+                if hash_index is not None:
+                    hash_index.add(cleaner.row_hashes[unseen][new_rows])
+            # The chunk's months of running state are written out instead of held for the whole stream
+            with metrics.stage('save_state', i):
+                rfm_state.save(rfm_path)
+                fraud_baseline.save(fraud_path)
+            total_rows += len(processed_df)
+
+        if rfm_state.customers is None:
+            logger.warning("Stream contained no valid rows.")
+            return None
+
+        with metrics.stage('rfm_segments', rows_in=len(rfm_state.customers)) as stage:
+            rfm_df = rfm_state.generate_segments()
+            stage.rows_out = len(rfm_df)
+        if run_load:
+            with metrics.stage('load_customers', rows_in=len(rfm_df)):
+                dw_loader.load_customers(rfm_df, rfm_state.country_map())
+            # Saved after the last load, stamped with the warehouse state it describes
+            if hash_index is not None:
+                with metrics.stage('save_state'):
+                    hash_index.save(dw_loader.load_token())
+            if gcp_loader.bq_client:
+                with metrics.stage('bigquery', rows_in=len(rfm_df)):
+                    gcp_loader.load_star_schema(None, rfm_df)
+        logger.success(f"Streaming run complete: {total_rows} rows processed.")
+        return rfm_df
+    except Exception as e:
+        logger.critical(f"Streaming pipeline failed: {e}")
+        sys.exit(1)
+    finally:
+        scratch.cleanup()
+
 if __name__ == "__main__":
     main()
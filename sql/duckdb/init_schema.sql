@@ -0,0 +1,109 @@
+-- Finance ETL Hub - Star Schema DDL
+-- Generated for DuckDB (embedded, columnar)
+
+-- Dimension: Date
+CREATE TABLE IF NOT EXISTS dim_date (
+    date_key INTEGER PRIMARY KEY,
+    full_date DATE,
+    day_name VARCHAR(20),
+    month_name VARCHAR(20),
+    month INTEGER,
+    quarter INTEGER,
+    year INTEGER,
+    is_weekend BOOLEAN
+);
+
+-- Dimension: Customer (SCD Type 2 Ready)
+CREATE TABLE IF NOT EXISTS dim_customer (
+    customer_key VARCHAR(50) PRIMARY KEY,
+    country VARCHAR(100),
+    rfm_segment VARCHAR(50),
+    rfm_score INTEGER,
+    valid_from TIMESTAMP,
+    valid_to TIMESTAMP,
+    is_current BOOLEAN
+);
+
+-- Dimension: Product
+CREATE TABLE IF NOT EXISTS dim_product (
+    product_key VARCHAR(50) PRIMARY KEY,
+    description VARCHAR(255),
+    unit_price_gbp DOUBLE
+);
+
+-- Fact: Sales
+CREATE SEQUENCE IF NOT EXISTS fact_sales_sales_id_seq;
+CREATE TABLE IF NOT EXISTS fact_sales (
+    sales_id BIGINT PRIMARY KEY DEFAULT nextval('fact_sales_sales_id_seq'),
+    -- Natural-key hash used by the loader's ON CONFLICT merge (idempotent reloads)
+    row_key VARCHAR(32) UNIQUE,
+    invoice_no VARCHAR(50),
+    invoice_date TIMESTAMP,
+    customer_key VARCHAR(50),
+    product_key VARCHAR(50),
+    quantity INTEGER,
+    unit_price DOUBLE,
+    total_gbp DOUBLE,
+    total_usd DOUBLE,
+    total_eur DOUBLE,
+    total_mad DOUBLE,
+    rate_date DATE,
+    is_fraud_suspect BOOLEAN
+);
+
+-- Rollups maintained by every fact load from the batch's deltas (dashboards read these, not fact_sales)
+CREATE TABLE IF NOT EXISTS agg_daily_sales (
+    sale_date DATE,
+    country VARCHAR(100),
+    revenue_gbp DOUBLE,
+    line_count INTEGER,
+    order_count INTEGER,
+    PRIMARY KEY (sale_date, country)
+);
+
+CREATE TABLE IF NOT EXISTS agg_orders (
+    invoice_no VARCHAR(50) PRIMARY KEY,
+    invoice_date TIMESTAMP,
+    customer_key VARCHAR(50),
+    country VARCHAR(100),
+    total_gbp DOUBLE,
+    line_count INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS agg_customer_segments (
+    rfm_segment VARCHAR(50) PRIMARY KEY,
+    customer_count INTEGER
+);
+
+-- Rates the facts were converted at, keyed by fact_sales.rate_date (v_fact_sales_fx converts on read)
+CREATE TABLE IF NOT EXISTS fx_rates (
+    rate_date DATE,
+    currency VARCHAR(3),
+    rate DOUBLE,
+    PRIMARY KEY (rate_date, currency)
+);
+
+-- Bumped by every load; the dashboard caches query results per version
+CREATE TABLE IF NOT EXISTS load_watermark (
+    id INTEGER PRIMARY KEY,
+    version BIGINT,
+    loaded_at TIMESTAMP
+);
+
+-- Per-stage run metrics (written when METRICS_DB_ENABLED is set)
+CREATE SEQUENCE IF NOT EXISTS pipeline_runs_id_seq;
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    id BIGINT PRIMARY KEY DEFAULT nextval('pipeline_runs_id_seq'),
+    run_id VARCHAR(32),
+    step VARCHAR(20),
+    stage VARCHAR(50),
+    batch VARCHAR(50),
+    status VARCHAR(20),
+    started_at TIMESTAMP,
+    wall_s DOUBLE,
+    cpu_s DOUBLE,
+    rows_in INTEGER,
+    rows_out INTEGER,
+    rows_per_s DOUBLE,
+    peak_mem_mb DOUBLE
+);
@@ -0,0 +1,74 @@
+-- Finance ETL Hub - Analytical Views
+-- DuckDB
+
+-- View: Sales Performance by Country
+-- Reads the agg_daily_sales rollup instead of joining fact_sales to dim_customer
+CREATE OR REPLACE VIEW v_sales_by_country AS
+SELECT 
+    country, 
+    CAST(SUM(order_count) AS BIGINT) as total_orders,
+    SUM(revenue_gbp) as revenue_gbp,
+    SUM(revenue_gbp) / NULLIF(SUM(line_count), 0) as avg_order_value_gbp
+FROM agg_daily_sales
+GROUP BY country
+ORDER BY revenue_gbp DESC;
+
+-- View: Customer RFM Profiles
+CREATE OR REPLACE VIEW v_customer_profiles AS
+SELECT 
+    customer_key,
+    country,
+    rfm_segment,
+    rfm_score
+FROM dim_customer
+WHERE is_current = TRUE;
+
+-- View: Fraud Suspects Report
+CREATE OR REPLACE VIEW v_fraud_report AS
+SELECT 
+    invoice_no, 
+    invoice_date, 
+    customer_key, 
+    total_gbp, 
+    is_fraud_suspect
+FROM fact_sales
+WHERE is_fraud_suspect = TRUE;
+
+-- View: Sales in every currency, one row per line and currency
+-- GBP as stored, plus every currency fx_rates holds for the line's rate_date;
+-- callers filter on currency or pivot, and a new currency only needs its fx_rates rows
+-- (dropped first: CREATE OR REPLACE cannot change the columns of the earlier wide view)
+DROP VIEW IF EXISTS v_fact_sales_fx;
+CREATE VIEW v_fact_sales_fx AS
+SELECT
+    f.sales_id,
+    f.invoice_no,
+    f.invoice_date,
+    f.customer_key,
+    f.product_key,
+    f.quantity,
+    f.unit_price,
+    f.total_gbp,
+    f.rate_date,
+    f.is_fraud_suspect,
+    'GBP' as currency,
+    1.0 as rate,
+    f.total_gbp as total
+FROM fact_sales f
+UNION ALL
+SELECT
+    f.sales_id,
+    f.invoice_no,
+    f.invoice_date,
+    f.customer_key,
+    f.product_key,
+    f.quantity,
+    f.unit_price,
+    f.total_gbp,
+    f.rate_date,
+    f.is_fraud_suspect,
+    r.currency,
+    r.rate,
+    f.total_gbp * r.rate as total
+FROM fact_sales f
+JOIN fx_rates r ON r.rate_date = f.rate_date AND r.currency <> 'GBP';
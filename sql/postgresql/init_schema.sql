@@ -34,6 +34,7 @@ CREATE TABLE IF NOT EXISTS dim_product (
 -- Fact: Sales
 CREATE TABLE IF NOT EXISTS fact_sales (
     sales_id SERIAL PRIMARY KEY,
+    row_key VARCHAR(32),
     invoice_no VARCHAR(50),
     invoice_date TIMESTAMP,
     customer_key VARCHAR(50),
@@ -44,5 +45,86 @@ CREATE TABLE IF NOT EXISTS fact_sales (
     total_usd FLOAT,
     total_eur FLOAT,
     total_mad FLOAT,
+    rate_date DATE,
     is_fraud_suspect BOOLEAN
 );
+
+-- Natural-key hash used by the loader's ON CONFLICT merge (idempotent reloads)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_sales_row_key ON fact_sales (row_key);
+
+-- Join and filter keys: BRIN for the (append-ordered) dates, B-trees for the rest
+CREATE INDEX IF NOT EXISTS ix_fact_sales_invoice_date ON fact_sales USING brin (invoice_date);
+CREATE INDEX IF NOT EXISTS ix_fact_sales_customer_key ON fact_sales (customer_key);
+CREATE INDEX IF NOT EXISTS ix_fact_sales_product_key ON fact_sales (product_key);
+CREATE INDEX IF NOT EXISTS ix_fact_sales_invoice_no ON fact_sales (invoice_no);
+CREATE INDEX IF NOT EXISTS ix_fact_sales_fraud ON fact_sales (invoice_date) WHERE is_fraud_suspect;
+
+-- With FACT_PARTITIONING=True fact_sales is instead partitioned by month, and the
+-- loader creates, attaches and detaches the monthly partitions. Unique keys must
+-- include the partition key, so invoice_date joins the primary and merge keys:
+--
+-- CREATE TABLE fact_sales (
+--     sales_id SERIAL,
+--     ... same columns ...,
+--     invoice_date TIMESTAMP NOT NULL,
+--     PRIMARY KEY (sales_id, invoice_date)
+-- ) PARTITION BY RANGE (invoice_date);
+-- CREATE UNIQUE INDEX ux_fact_sales_row_key ON fact_sales (row_key, invoice_date);
+-- CREATE TABLE fact_sales_201012 PARTITION OF fact_sales
+--     FOR VALUES FROM ('2010-12-01') TO ('2011-01-01');
+
+-- Rollups maintained by every fact load from the batch's deltas (dashboards read these, not fact_sales)
+CREATE TABLE IF NOT EXISTS agg_daily_sales (
+    sale_date DATE,
+    country VARCHAR(100),
+    revenue_gbp FLOAT,
+    line_count INTEGER,
+    order_count INTEGER,
+    PRIMARY KEY (sale_date, country)
+);
+
+CREATE TABLE IF NOT EXISTS agg_orders (
+    invoice_no VARCHAR(50) PRIMARY KEY,
+    invoice_date TIMESTAMP,
+    customer_key VARCHAR(50),
+    country VARCHAR(100),
+    total_gbp FLOAT,
+    line_count INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS agg_customer_segments (
+    rfm_segment VARCHAR(50) PRIMARY KEY,
+    customer_count INTEGER
+);
+
+-- Rates the facts were converted at, keyed by fact_sales.rate_date (v_fact_sales_fx converts on read)
+CREATE TABLE IF NOT EXISTS fx_rates (
+    rate_date DATE,
+    currency VARCHAR(3),
+    rate FLOAT,
+    PRIMARY KEY (rate_date, currency)
+);
+
+-- Bumped by every load; the dashboard caches query results per version
+CREATE TABLE IF NOT EXISTS load_watermark (
+    id INTEGER PRIMARY KEY,
+    version BIGINT,
+    loaded_at TIMESTAMP
+);
+
+-- Per-stage run metrics (written when METRICS_DB_ENABLED is set)
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    id SERIAL PRIMARY KEY,
+    run_id VARCHAR(32),
+    step VARCHAR(20),
+    stage VARCHAR(50),
+    batch VARCHAR(50),
+    status VARCHAR(20),
+    started_at TIMESTAMP,
+    wall_s FLOAT,
+    cpu_s FLOAT,
+    rows_in INTEGER,
+    rows_out INTEGER,
+    rows_per_s FLOAT,
+    peak_mem_mb FLOAT
+);
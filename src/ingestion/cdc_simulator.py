@@ -2,10 +2,14 @@ import pandas as pd
 from loguru import logger
 import numpy as np
 
+# Change events that take a line out of the warehouse (an update's before image is replaced by its after image)
+REMOVED_OPERATIONS = ('DELETE', 'UPDATE_BEFORE')
+
 class CDCSimulator:
     """
     Simulates Change Data Capture (CDC) by partitioning the dataset 
-    into 'Initial' and 'Incremental' batches based on InvoiceDate.
+    into 'Initial' and 'Incremental' batches based on InvoiceDate, or
+    by replaying it as a stream of INSERT/UPDATE/DELETE micro-batches.
     """
     def __init__(self, df):
         self.df = df
@@ -13,11 +17,12 @@ class CDCSimulator:
         self.df['InvoiceDate'] = pd.to_datetime(self.df['InvoiceDate'])
         self.min_date = self.df['InvoiceDate'].min()
         self.max_date = self.df['InvoiceDate'].max()
+        # Sorted once; both batches are slices of the same order
+        self.sorted_df = self.df.sort_values('InvoiceDate')
 
     def get_initial_load(self, split_ratio=0.8):
         """Returns the first 80% of data chronologically as initial load"""
-        # Sort by date
-        sorted_df = self.df.sort_values('InvoiceDate')
+        sorted_df = self.sorted_df
         split_idx = int(len(sorted_df) * split_ratio)
         initial_df = sorted_df.iloc[:split_idx].copy()
         
@@ -30,7 +35,7 @@ class CDCSimulator:
 
     def get_incremental_load(self, split_ratio=0.8):
         """Returns the remaining 20% of data as increment"""
-        sorted_df = self.df.sort_values('InvoiceDate')
+        sorted_df = self.sorted_df
         split_idx = int(len(sorted_df) * split_ratio)
         incremental_df = sorted_df.iloc[split_idx:].copy()
         
@@ -42,6 +47,65 @@ class CDCSimulator:
         logger.info(f"Generated incremental batch with {len(incremental_df)} records.")
         return incremental_df
 
+    def replay(self, n_batches, update_rate=0.05, delete_rate=0.01, seed=0, snapshot_ratio=0.0):
+        """
+        Replays the dataset as `n_batches` chronological micro-batches of change
+        events. Every batch inserts the next slice of sales lines and, from the
+        second batch on, re-emits lines of earlier batches as UPDATE (new
+        UnitPrice) or DELETE events. Like SQL Server CDC, an update is emitted
+        as its before image (UPDATE_BEFORE, the line as last emitted) and its
+        after image (UPDATE), and a DELETE carries the line's current values.
+        Only lines identifiable by InvoiceNo and StockCode and valid for the
+        warehouse get later events, and a deleted line gets none after its DELETE.
+        :param snapshot_ratio: Share of the lines (oldest first) emitted up front as
+                               one INSERT-only snapshot batch, before the micro-batches
+        :param update_rate: UPDATE events per inserted line
+        :param delete_rate: DELETE events per inserted line
+        :return: Generator of batches tagged with cdc_operation and cdc_timestamp
+                 (the snapshot first, if any)
+        """
+        rng = np.random.default_rng(seed)
+        sorted_df = self.sorted_df.reset_index(drop=True)
+        addressable = (
+            ~sorted_df.duplicated(['InvoiceNo', 'StockCode'], keep=False)
+            & sorted_df['CustomerID'].notna()
+            & (sorted_df['Quantity'] > 0)
+            & (sorted_df['UnitPrice'] > 0)
+        ).to_numpy()
+        live = np.zeros(len(sorted_df), dtype=bool)
+        # Current UnitPrice of every line, so later events carry what was last emitted
+        prices = sorted_df['UnitPrice'].to_numpy(dtype=float, copy=True)
+        snapshot_end = int(len(sorted_df) * snapshot_ratio)
+        bounds = np.linspace(snapshot_end, len(sorted_df), n_batches + 1).astype(int)
+        if snapshot_end:
+            # Nothing is live before the snapshot, so it is emitted as plain inserts
+            bounds = np.concatenate([[0], bounds])
+
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            inserts = sorted_df.iloc[start:end].assign(cdc_operation='INSERT')
+            candidates = np.flatnonzero(live)
+            n_updates = min(len(candidates), rng.binomial(end - start, update_rate)) if len(candidates) else 0
+            n_deletes = min(len(candidates) - n_updates, rng.binomial(end - start, delete_rate)) if len(candidates) else 0
+            picked = rng.choice(candidates, n_updates + n_deletes, replace=False)
+
+            updated = np.sort(picked[:n_updates])
+            new_prices = (prices[updated] * rng.uniform(0.8, 1.2, len(updated))).round(2)
+            # A price that rounds back to the current one is no change at all
+            updated, new_prices = updated[new_prices != prices[updated]], new_prices[new_prices != prices[updated]]
+            before = sorted_df.iloc[updated].assign(cdc_operation='UPDATE_BEFORE', UnitPrice=prices[updated])
+            after = sorted_df.iloc[updated].assign(cdc_operation='UPDATE', UnitPrice=new_prices)
+            prices[updated] = new_prices
+
+            removed = np.sort(picked[n_updates:])
+            deletes = sorted_df.iloc[removed].assign(cdc_operation='DELETE', UnitPrice=prices[removed])
+            live[start:end] = addressable[start:end]
+            live[removed] = False
+
+            batch = pd.concat([inserts, before, after, deletes], ignore_index=True)
+            batch['cdc_timestamp'] = pd.Timestamp.now()
+            logger.info(f"Replay batch: {len(inserts)} inserts, {len(after)} updates, {len(deletes)} deletes.")
+            yield batch
+
 if __name__ == "__main__":
     # Test with dummy data
     data = {'InvoiceDate': pd.date_range(start='1/1/2021', periods=100), 'val': range(100)}
@@ -1,15 +1,23 @@
 import pandas as pd
 import requests
 import os
+from concurrent.futures import ProcessPoolExecutor
 from loguru import logger
 from config.settings import settings
+from src.ingestion.raw_cache import RawFileCache, coerce_mixed_columns
 
 class CSVLoader:
-    def __init__(self):
+    def __init__(self, workers=None):
+        """
+        :param workers: Number of processes used to parse source files (1 = serial)
+        """
         self.raw_path = settings.RAW_DATA_PATH
         self.dataset_url = settings.DATASET_URL
         self.file_name = "online_retail.xlsx"
         self.csv_name = "online_retail.csv"
+        self.cache = RawFileCache() if settings.RAW_CACHE_ENABLED else None
+        self.workers = workers or settings.INGEST_WORKERS
+        self.extra_path = r"c:\Users\MSI\Desktop\FinanceETLHub\online+retail"
         
         if not os.path.exists(self.raw_path):
             os.makedirs(self.raw_path)
@@ -33,50 +41,114 @@ class CSVLoader:
             logger.error(f"Failed to download dataset: {e}")
             raise
 
+    def _read_source(self, path, reader):
+        """Parses a source file, going through the Parquet cache when enabled"""
+        if self.cache is None:
+            return coerce_mixed_columns(reader(path))
+        return self.cache.read(path, reader)
+
+    def _read_path(self, path):
+        """Parses a single Excel/CSV source file"""
+        file = os.path.basename(path)
+        if file.endswith('.xlsx'):
+            logger.info(f"Loading Excel: {file}")
+            return self._read_source(path, pd.read_excel)
+        logger.debug(f"Loading CSV: {file}")
+        return self._read_source(path, pd.read_csv)
+
+    def _list_sources(self, directory):
+        """Source files of a directory, sorted so serial and parallel modes see the same order"""
+        sources = []
+        for file in sorted(os.listdir(directory)):
+            if file.endswith('.xlsx') or (file.endswith('.csv') and file != self.csv_name):
+                sources.append(os.path.join(directory, file))
+        return sources
+
+    def _source_paths(self):
+        """Source files of every scanned directory"""
+        paths = []
+        for directory in [self.raw_path, self.extra_path]:
+            if os.path.exists(directory):
+                paths.extend(self._list_sources(directory))
+        return paths
+
     def _load_from_dir(self, directory):
         """Helper to load all Excel/CSV files from a directory"""
-        dfs = []
         if not os.path.exists(directory):
-            return dfs
-            
-        for file in os.listdir(directory):
-            path = os.path.join(directory, file)
-            if file.endswith('.xlsx'):
-                logger.info(f"Loading Excel: {file}")
-                dfs.append(pd.read_excel(path))
-            elif file.endswith('.csv') and file != "online_retail.csv":
-                logger.debug(f"Loading CSV: {file}")
-                dfs.append(pd.read_csv(path))
-        return dfs
+            return []
+
+        paths = self._list_sources(directory)
+        if self.workers > 1 and len(paths) > 1:
+            # Files are parsed concurrently; map() keeps results in input order
+            workers = min(self.workers, len(paths))
+            logger.info(f"Loading {len(paths)} files with {workers} worker processes...")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(self._read_path, paths))
+
+        return [self._read_path(path) for path in paths]
 
     def load_all_files(self):
-        """Scans multiple sources and merges them with deduplication"""
+        """
+        Scans multiple sources and merges them. Duplicates are not removed here:
+        DataCleaner drops them in one hashed pass that also checks the dedup index.
+        """
         all_dfs = []
         
         # 1. Standard raw path
         all_dfs.extend(self._load_from_dir(self.raw_path))
 
         # 2. Extra folder from user
-        extra_path = r"c:\Users\MSI\Desktop\FinanceETLHub\online+retail"
-        all_dfs.extend(self._load_from_dir(extra_path))
+        all_dfs.extend(self._load_from_dir(self.extra_path))
 
         # 3. Fallback: Download if everything is empty
         if not all_dfs:
             logger.info("No local data found. Downloading default dataset...")
             default_xlsx = self.download_dataset()
-            all_dfs.append(pd.read_excel(default_xlsx))
+            all_dfs.append(self._read_source(default_xlsx, pd.read_excel))
 
-        df = pd.concat(all_dfs, ignore_index=True)
-        
-        # Deduplicate
-        initial_count = len(df)
-        df.drop_duplicates(inplace=True)
-        dropped_count = initial_count - len(df)
-        
-        if dropped_count > 0:
-            logger.info(f"Deduplication: Removed {dropped_count} duplicate rows.")
-            
-        return df
+        return pd.concat(all_dfs, ignore_index=True)
+
+    def iter_chunks(self, chunk_size):
+        """
+        Streams the same sources as load_all_files as DataFrames of at most
+        `chunk_size` rows, without concatenating them in memory.
+        Duplicates are not removed here; the cleaner handles them per chunk.
+        """
+        paths = self._source_paths()
+        if not paths:
+            logger.info("No local data found. Downloading default dataset...")
+            paths.append(str(self.download_dataset()))
+
+        for path in paths:
+            reader = pd.read_excel if path.endswith('.xlsx') else pd.read_csv
+            logger.info(f"Streaming {os.path.basename(path)} in chunks of {chunk_size} rows")
+            if self.cache is not None:
+                yield from self.cache.iter_batches(path, reader, chunk_size)
+            elif reader is pd.read_csv:
+                yield from map(coerce_mixed_columns, pd.read_csv(path, chunksize=chunk_size))
+            else:
+                # Excel cannot be read incrementally without the Parquet cache
+                df = coerce_mixed_columns(reader(path))
+                for start in range(0, len(df), chunk_size):
+                    yield df.iloc[start:start + chunk_size]
+
+    def extract_new_rows(self, watermarks):
+        """
+        Reads only the rows of each source beyond its watermark (see SourceWatermarks.extract).
+        :return: (new rows, marks to store in `watermarks` once they are loaded)
+        """
+        frames, marks = [], {}
+        for path in self._source_paths():
+            df, mark = watermarks.extract(path, self._read_path)
+            marks.update(mark)
+            if df is not None and not df.empty:
+                frames.append(df)
+
+        if not frames:
+            return pd.DataFrame(), marks
+        df = pd.concat(frames, ignore_index=True)
+        logger.info(f"Extracted {len(df)} new rows from {len(frames)} source file(s).")
+        return df, marks
 
     def get_data(self):
         try:
@@ -1,9 +1,16 @@
 import requests
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
 from loguru import logger
 from config.settings import settings
+from src.ingestion.fx_history import FXRateStore
+
+# Per-day history requests per worker between two saves of the rate store
+HISTORY_BATCH_REQUESTS = 25
 
 class FXFetcher:
     def __init__(self):
@@ -50,6 +57,80 @@ class FXFetcher:
             logger.error(f"FX API request failed: {e}. Falling back to mock data.")
             return self._get_mock_rates()
 
+    def get_rate_history(self, start=None, end=None):
+        """
+        Daily rates from start to end (default: FX_HISTORY_START to today) from
+        the local rate store. Days the store lacks are fetched from the API's
+        history endpoint and stored. Without an API key they get the mock history,
+        which is kept in memory and never stored. Days the API fails on are
+        returned with missing rates, so their lines fail the DQ checks instead
+        of being converted at made-up rates.
+        :return: Date-sorted DataFrame with a date column and one column per currency
+        """
+        start = pd.Timestamp(start if start is not None else settings.FX_HISTORY_START)
+        end = pd.Timestamp(end if end is not None else datetime.now())
+        store = FXRateStore(settings.FX_HISTORY_PATH, self.target_currencies)
+        missing = store.missing_dates(start, end)
+        if len(missing) == 0:
+            logger.info("Using stored FX rate history.")
+            return store.between(start, end)
+
+        if self.api_key == "demo_key" or not self.api_key:
+            logger.warning(f"No API key provided or demo key used. Using mock rates for {len(missing)} days.")
+            rates = FXRateStore(currencies=self.target_currencies)
+            rates.add(self._get_mock_history(missing))
+            rates.add(store.between(start, end))
+            return rates.between(start, end)
+
+        self._fetch_history(store, missing)
+        history = store.between(start, end)
+        failed = store.missing_dates(start, end)
+        if len(failed):
+            logger.error(f"FX history unavailable for {len(failed)} days; their lines are left unconverted.")
+            gaps = pd.DataFrame({'date': failed[~failed.isin(history['date'])]}).reindex(columns=history.columns)
+            history = pd.concat([history, gaps]).sort_values('date', ignore_index=True)
+        return history
+
+    def _fetch_history(self, store, days):
+        """
+        Fetches days into the store on up to FX_HISTORY_WORKERS threads, the API
+        having no range endpoint. The store is saved after every batch, so an
+        interrupted backfill resumes where it stopped; a batch that fails for
+        every day (API down, quota spent) ends the backfill early.
+        """
+        workers = max(1, settings.FX_HISTORY_WORKERS)
+        batch_size = workers * HISTORY_BATCH_REQUESTS
+        logger.info(f"Fetching FX history from API for {len(days)} days on {workers} threads...")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in range(0, len(days), batch_size):
+                fetched = [rates for rates in pool.map(self._fetch_history_day, days[i:i + batch_size])
+                           if rates is not None]
+                remaining = len(days) - i - batch_size
+                if not fetched:
+                    if remaining > 0:
+                        logger.error(f"Every FX history request of the last batch failed, "
+                                     f"not requesting the remaining {remaining} days.")
+                    break
+                store.add(pd.DataFrame(fetched))
+                store.save()
+
+    def _fetch_history_day(self, day):
+        """One day's rates from the API's history endpoint, or None if the request fails"""
+        url = (f"https://v6.exchangerate-api.com/v6/{self.api_key}/history/"
+               f"{self.base_currency}/{day.year}/{day.month}/{day.day}")
+        try:
+            response = requests.get(url, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+            if data.get("result") != "success":
+                logger.error(f"API returned error for {day:%Y-%m-%d}: {data.get('error-type')}")
+                return None
+            all_rates = data.get("conversion_rates", {})
+            return {'date': day, **{curr: all_rates.get(curr) for curr in self.target_currencies}}
+        except Exception as e:
+            logger.error(f"FX history request for {day:%Y-%m-%d} failed: {e}")
+            return None
+
     def _load_cache(self):
         if not os.path.exists(self.cache_path):
             return None
@@ -80,3 +161,17 @@ class FXFetcher:
         return {
             "GBP": 1.0, "USD": 1.27, "EUR": 1.16, "MAD": 12.85
         }
+
+    def _get_mock_history(self, dates):
+        """
+        Deterministic mock daily rates for offline use: the mock snapshot rates
+        with a smooth yearly and monthly drift, so any date always gets the same rate.
+        """
+        dates = pd.DatetimeIndex(dates)
+        days = (dates - pd.Timestamp('2000-01-01')).days.to_numpy()
+        mock = self._get_mock_rates()
+        history = {'date': dates}
+        for phase, curr in enumerate(self.target_currencies):
+            drift = 0.04 * np.sin(2 * np.pi * days / 365.25 + phase) + 0.01 * np.sin(2 * np.pi * days / 29.5 + phase)
+            history[curr] = np.round(mock.get(curr, 1.0) * (1 + drift), 6)
+        return pd.DataFrame(history)
@@ -0,0 +1,85 @@
+import argparse
+import os
+from pathlib import Path
+import pandas as pd
+from loguru import logger
+from config.settings import settings
+
+class FXRateStore:
+    """
+    Local history of daily FX rates: one row per date, one column per target
+    currency (units per 1 base currency), persisted as Parquet. Filled from the
+    exchange-rate API or a rates file (never the mock provider), and handed to
+    CurrencyTransformer as a date-sorted frame for as-of conversion.
+    """
+    def __init__(self, path=None, currencies=None):
+        """
+        :param path: .parquet file backing the store; None keeps it in memory only
+        :param currencies: Rate columns kept (default: TARGET_CURRENCIES)
+        """
+        self.path = Path(path) if path else None
+        self.currencies = list(currencies or settings.TARGET_CURRENCIES)
+        self.rates = pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'),
+                                   **{c: pd.Series(dtype=float) for c in self.currencies}})
+        if self.path is not None and os.path.exists(self.path):
+            self.add(pd.read_parquet(self.path))
+            logger.info(f"Loaded FX history for {len(self.rates)} dates.")
+
+    def add(self, rates):
+        """
+        Merges dated rates into the store; for a date already stored, the new
+        non-null rates win. Currencies the rates lack stay missing for their dates.
+        """
+        rates = rates.assign(date=pd.to_datetime(rates['date']).dt.normalize().astype('datetime64[ns]'))
+        rates = rates.reindex(columns=['date'] + self.currencies).astype({c: float for c in self.currencies})
+        merged = pd.concat([self.rates, rates], ignore_index=True)
+        self.rates = merged.groupby('date', as_index=False, sort=True).last()
+
+    def import_file(self, path):
+        """Adds the rates of a CSV or Parquet file with a `date` column and one column per currency"""
+        rates = pd.read_parquet(path) if str(path).endswith('.parquet') else pd.read_csv(path)
+        self.add(rates)
+        logger.info(f"Imported {len(rates)} dated FX rates from {path}.")
+
+    def missing_dates(self, start, end):
+        """Calendar days between start and end (inclusive) without a stored rate for every currency"""
+        days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+        complete = self.rates['date'][self.rates[self.currencies].notna().all(axis=1)]
+        return days[~days.isin(complete)]
+
+    def between(self, start=None, end=None):
+        """
+        Rates dated from start to end, plus the last one before start, so every
+        day in the range has an as-of rate.
+        """
+        dates = self.rates['date']
+        lower = 0 if start is None else max(0, dates.searchsorted(pd.Timestamp(start).normalize(), side='right') - 1)
+        upper = len(dates) if end is None else dates.searchsorted(pd.Timestamp(end).normalize(), side='right')
+        return self.rates.iloc[lower:upper].reset_index(drop=True)
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.rates.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the local FX rate history")
+    parser.add_argument('--import', dest='import_path', type=str, default=None,
+                        help='CSV/Parquet file with a date column and one column per currency')
+    parser.add_argument('--start', type=str, default=None, help='Fetch rates the store lacks from the API from this date')
+    parser.add_argument('--end', type=str, default=None, help='... up to this date (default: today)')
+    args = parser.parse_args()
+
+    if args.import_path:
+        store = FXRateStore(settings.FX_HISTORY_PATH)
+        store.import_file(args.import_path)
+        store.save()
+    if args.start:
+        from src.ingestion.fx_api import FXFetcher
+        FXFetcher().get_rate_history(args.start, args.end)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from loguru import logger
+from src.transformation.partitions import MonthlyPartitions, concat_rows
+
+class RowHashIndex:
+    """
+    Persistent index of 64-bit row hashes for rows already loaded to the warehouse.
+    Hashes are kept as a sorted uint64 array (8 bytes per row) saved as .npy,
+    so membership is an exact binary search rather than a probabilistic filter.
+    A JSON sidecar records which warehouse state the index describes, so an
+    index outliving its warehouse (reset, or another database) is not trusted.
+    """
+    def __init__(self, path=None, token=None):
+        """
+        :param path: .npy file backing the index; None keeps it in memory only
+        :param token: Load token of the warehouse the rows go to (loader.load_token());
+                      a persisted index saved under another token is discarded
+        """
+        self.path = Path(path) if path else None
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+        if self.path is not None and os.path.exists(self.path):
+            stored = self._stored_token()
+            if stored != token:
+                logger.warning(f"Dedup index was saved for warehouse state {stored}, not {token}; starting empty.")
+            else:
+                self.hashes = np.load(self.path)
+                logger.info(f"Loaded dedup index with {len(self.hashes)} row hashes.")
+
+    @property
+    def token_path(self):
+        return self.path.with_suffix('.json')
+
+    def _stored_token(self):
+        if not os.path.exists(self.token_path):
+            return None
+        with open(self.token_path) as f:
+            return json.load(f).get('token')
+
+    @staticmethod
+    def hash_rows(df):
+        """
+        Hashes every row of df. Metadata columns (cdc_*) are ignored and datetimes
+        are normalized to ns so the same record hashes identically across runs.
+        """
+        columns = [c for c in df.columns if not c.startswith('cdc_')]
+        return combine_hashes((hash_column(df[col]) for col in columns), len(columns), len(df))
+
+    @staticmethod
+    def first_occurrences(hashes):
+        """Boolean mask keeping the first row of every distinct hash"""
+        _, first_idx = np.unique(hashes, return_index=True)
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[first_idx] = True
+        return mask
+
+    def contains(self, hashes):
+        """Boolean mask of hashes already present in the index"""
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        pos = np.searchsorted(self.hashes, hashes)
+        pos[pos == len(self.hashes)] = 0
+        return self.hashes[pos] == hashes
+
+    def add(self, hashes):
+        self.hashes = np.union1d(self.hashes, np.asarray(hashes, dtype=np.uint64))
+
+    def remove(self, hashes):
+        """Drops the hashes of rows deleted from the warehouse, so the same rows load again if re-sent"""
+        self.hashes = np.setdiff1d(self.hashes, np.asarray(hashes, dtype=np.uint64))
+
+    def save(self, token=None):
+        """
+        :param token: Load token of the warehouse once the indexed rows have committed
+        """
+        if self.path is None:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.hashes)
+        os.replace(tmp_path, self.path)
+        tmp_path = self.token_path.with_name(self.token_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({'token': token}, f)
+        os.replace(tmp_path, self.token_path)
+        logger.info(f"Dedup index saved ({len(self.hashes)} row hashes).")
+
+class PartitionedRowIndex:
+    """
+    Row hashes seen during one run (e.g. a stream of chunks), filed by the month
+    of each row's InvoiceDate like the running RFM and fraud state. A chunk only
+    reads the months its rows fall in and `save` moves them back to disk, so
+    memory and lookup time follow the chunk, not everything seen so far. Repeated
+    rows share their InvoiceDate, so they always meet in the same month.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: Directory the months are spilled to; None keeps them in memory
+        """
+        self.partitions = MonthlyPartitions(['hash', 'InvoiceDate'], 'InvoiceDate', path)
+
+    def add(self, hashes, dates):
+        """
+        Records the rows of a batch (distinct hashes, see RowHashIndex.first_occurrences)
+        :param dates: InvoiceDate of every row
+        :return: Mask of the rows not recorded before
+        """
+        batch = pd.DataFrame({'hash': np.asarray(hashes, dtype=np.uint64),
+                              'InvoiceDate': pd.to_datetime(np.asarray(dates))})
+        months = self.partitions.months_of(batch['InvoiceDate'])
+        seen = self.partitions.read(months)
+        unseen = ~np.isin(batch['hash'].to_numpy(), seen['hash'].to_numpy(dtype=np.uint64))
+        self.partitions.replace(months, concat_rows([seen, batch[unseen]], self.partitions.columns))
+        return unseen
+
+    def save(self):
+        self.partitions.save()
+
+def hash_column(col):
+    """
+    Element-wise hash of one column, equal to pd.util.hash_pandas_object(col, index=False).
+    Strings are hashed once per distinct value and expanded through their codes,
+    so no per-row Python string objects are materialized.
+    """
+    if pd.api.types.is_datetime64_any_dtype(col):
+        col = col.astype('datetime64[ns]')
+    if not pd.api.types.is_string_dtype(col) and col.dtype != object:
+        return pd.util.hash_pandas_object(col, index=False).to_numpy()
+    codes, uniques = pd.factorize(col, use_na_sentinel=False)
+    return pd.util.hash_pandas_object(pd.Series(uniques, dtype=col.dtype), index=False).to_numpy()[codes]
+
+def combine_hashes(column_hashes, num_columns, num_rows):
+    """Row hashes from per-column hashes, mixed exactly like pd.util.hash_pandas_object does for a DataFrame"""
+    out = np.full(num_rows, 0x345678, dtype=np.uint64)
+    mult = np.uint64(1000003)
+    for i, hashes in enumerate(column_hashes):
+        inverse_i = num_columns - i
+        out ^= hashes
+        out *= mult
+        mult += np.uint64(82520 + inverse_i + inverse_i)
+    out += np.uint64(97531)
+    return out
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import pandas as pd
+import pyarrow.parquet as pq
+from loguru import logger
+from config.settings import settings
+
+# What pandas reads a Parquet string column back as ('str' on pandas 3, object before)
+STRING_DTYPE = pd.Series([''], dtype=str).dtype
+
+class RawFileCache:
+    """
+    Columnar cache for raw source files.
+    Each source file is parsed once and stored as Parquet next to a small JSON
+    sidecar holding its fingerprint (path, size, mtime, content hash).
+    Later runs read the Parquet copy and only re-parse files that changed.
+    """
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir or settings.RAW_CACHE_PATH)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_paths(self, path):
+        """Cache file names are derived from the absolute source path"""
+        abs_path = os.path.abspath(path)
+        key = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:16]
+        stem = f"{Path(path).stem}-{key}"
+        return self.cache_dir / f"{stem}.parquet", self.cache_dir / f"{stem}.json"
+
+    @staticmethod
+    def _content_hash(path):
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _load_meta(self, meta_path):
+        try:
+            with open(meta_path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _save_meta(self, meta_path, meta):
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def is_fresh(self, path):
+        """
+        True if the cached copy still matches the source file.
+        Size and mtime are checked first; if only the mtime moved, the content
+        hash decides (so a `touch` or a re-copy does not force a rebuild).
+        """
+        data_path, meta_path = self._entry_paths(path)
+        meta = self._load_meta(meta_path)
+        if meta is None or not os.path.exists(data_path):
+            return False
+
+        stat = os.stat(path)
+        if meta.get("size") != stat.st_size:
+            return False
+        if meta.get("mtime_ns") == stat.st_mtime_ns:
+            return True
+
+        if meta.get("sha1") == self._content_hash(path):
+            meta["mtime_ns"] = stat.st_mtime_ns
+            self._save_meta(meta_path, meta)
+            return True
+        return False
+
+    def _build(self, path, reader):
+        """Parses the source and (re)writes its Parquet copy and fingerprint"""
+        data_path, meta_path = self._entry_paths(path)
+        logger.info(f"Raw cache miss, converting {os.path.basename(path)} to Parquet...")
+        stat = os.stat(path)
+        df = coerce_mixed_columns(reader(path))
+
+        tmp_path = data_path.with_suffix(".parquet.tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, data_path)
+        self._save_meta(meta_path, {
+            "path": os.path.abspath(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": self._content_hash(path),
+            "rows": len(df)
+        })
+        return data_path
+
+    def read(self, path, reader):
+        """
+        Returns the DataFrame for `path`, using the cache when it is fresh.
+        :param reader: Callable used to parse the source on a cache miss (e.g. pd.read_excel)
+        """
+        data_path, _ = self._entry_paths(path)
+        if self.is_fresh(path):
+            logger.debug(f"Raw cache hit: {path}")
+        else:
+            self._build(path, reader)
+
+        # A fresh build is read back so it returns exactly what later cache hits return
+        return pd.read_parquet(data_path)
+
+    def iter_batches(self, path, reader, batch_size):
+        """Yields the cached copy of `path` as DataFrames of at most `batch_size` rows"""
+        data_path, _ = self._entry_paths(path)
+        if not self.is_fresh(path):
+            self._build(path, reader)
+
+        parquet_file = pq.ParquetFile(data_path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+
+def coerce_mixed_columns(df):
+    """
+    Excel sources mix ints and strings in the same column (e.g. InvoiceNo
+    '536365' vs 'C536379'). Parquet needs one type per column, so mixed object
+    columns become string columns, keeping nulls as nulls. Uncached reads go
+    through the same coercion, so a source parses to the same frame either way.
+    """
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col]
+            df[col] = values.where(values.isna(), values.astype(str)).astype(STRING_DTYPE)
+    return df
@@ -0,0 +1,115 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# Shape of the UCI Online Retail export (541,909 lines) that the generator scales from
+REFERENCE_ROWS = 541_909
+LINES_PER_INVOICE = 21
+CUSTOMERS = 4_372
+PRODUCTS = 4_070
+COUNTRIES = [
+    'United Kingdom', 'Germany', 'France', 'EIRE', 'Spain', 'Netherlands', 'Belgium', 'Switzerland',
+    'Portugal', 'Australia', 'Norway', 'Italy', 'Channel Islands', 'Finland', 'Cyprus', 'Sweden',
+    'Austria', 'Denmark', 'Japan', 'Poland', 'USA', 'Israel', 'Singapore', 'Iceland', 'Canada',
+    'Greece', 'Malta', 'United Arab Emirates', 'Lithuania', 'Czech Republic', 'Brazil', 'Bahrain'
+]
+_WORDS = ['WHITE', 'RED', 'HEART', 'VINTAGE', 'LANTERN', 'SET', 'BAG', 'CAKE', 'TIN', 'CANDLE',
+          'GLASS', 'HOLDER', 'RETRO', 'PAPER', 'WOODEN', 'STAR', 'JUMBO', 'PINK', 'MUG', 'CLOCK']
+
+def _zipf_weights(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+def generate_online_retail(n_rows, seed=0, start='2010-12-01', end='2011-12-09',
+                           missing_customer_rate=0.25, cancel_rate=0.02, duplicate_rate=0.01):
+    """
+    Deterministic synthetic Online Retail export with the raw file's columns.
+    Customers and products follow Zipf-like popularity, ~90% of invoices are from
+    the UK, a quarter of invoices lack a CustomerID, cancelled invoices ('C' prefix)
+    carry negative quantities, and a small share of lines is duplicated.
+    Entity counts grow with n_rows from the shape of the reference dataset.
+
+    :param n_rows: Number of lines to generate
+    :param seed: Random seed; equal seeds and arguments give identical frames
+    """
+    rng = np.random.default_rng(seed)
+    scale = n_rows / REFERENCE_ROWS
+    n_customers = max(50, int(CUSTOMERS * scale))
+    n_products = max(50, int(PRODUCTS * np.sqrt(scale)))
+    n_unique = n_rows - int(n_rows * duplicate_rate)
+
+    # Invoices: geometric basket sizes, cut to exactly n_unique lines
+    sizes = rng.geometric(1 / LINES_PER_INVOICE, size=n_unique // LINES_PER_INVOICE * 2 + 10)
+    n_invoices = int(np.searchsorted(np.cumsum(sizes), n_unique)) + 1
+    line_invoice = np.repeat(np.arange(n_invoices), sizes[:n_invoices])[:n_unique]
+
+    # Per-invoice attributes
+    customers = rng.choice(n_customers, size=n_invoices, p=_zipf_weights(n_customers, 0.7))
+    customer_ids = (12346 + customers).astype(float)
+    customer_ids[rng.random(n_invoices) < missing_customer_rate] = np.nan
+    customer_country = np.where(
+        rng.random(n_customers) < 0.9, 0,
+        1 + rng.choice(len(COUNTRIES) - 1, size=n_customers, p=_zipf_weights(len(COUNTRIES) - 1, 1.3))
+    )
+    countries = np.asarray(COUNTRIES)[customer_country[customers]]
+
+    # Invoice timestamps: ordered trading days (weekdays mostly) in business hours
+    days = pd.date_range(start, end, freq='D')
+    day_weights = np.where(days.dayofweek < 5, 1.0, 0.25)
+    day_of_invoice = np.sort(rng.choice(len(days), size=n_invoices, p=day_weights / day_weights.sum()))
+    minutes = rng.integers(8 * 60, 20 * 60, size=n_invoices)
+    invoice_dates = days.values[day_of_invoice] + minutes.astype('timedelta64[m]')
+
+    invoice_numbers = (536365 + np.arange(n_invoices)).astype(str)
+    cancelled = rng.random(n_invoices) < cancel_rate
+    invoice_numbers = np.where(cancelled, np.char.add('C', invoice_numbers), invoice_numbers)
+
+    # Products: Zipf popularity, log-normal list prices, occasional re-pricing
+    products = rng.choice(n_products, size=n_unique, p=_zipf_weights(n_products, 0.7))
+    codes = (10002 + products * 7).astype(str)
+    lettered = rng.random(n_products) < 0.1
+    codes = np.where(lettered[products], np.char.add(codes, 'A'), codes)
+    base_price = np.round(rng.lognormal(mean=0.9, sigma=0.8, size=n_products), 2) + 0.05
+    prices = np.where(rng.random(n_unique) < 0.1,
+                      np.round(base_price[products] * rng.uniform(0.7, 1.3, n_unique), 2),
+                      base_price[products])
+    descriptions = np.char.add(np.char.add(np.asarray(_WORDS)[products % len(_WORDS)], ' '),
+                               np.asarray(_WORDS)[(products // len(_WORDS)) % len(_WORDS)])
+    descriptions = np.char.add(np.char.add(descriptions, ' '), products.astype(str))
+
+    # Quantities: mostly small baskets with a long wholesale tail; cancellations are negative
+    quantity = np.maximum(1, np.round(rng.lognormal(mean=1.5, sigma=1.0, size=n_unique))).astype(np.int64)
+    quantity = np.where(cancelled[line_invoice], -quantity, quantity)
+
+    df = pd.DataFrame({
+        'InvoiceNo': invoice_numbers[line_invoice],
+        'StockCode': codes,
+        'Description': descriptions,
+        'Quantity': quantity,
+        'InvoiceDate': invoice_dates[line_invoice],
+        'UnitPrice': prices,
+        'CustomerID': customer_ids[line_invoice],
+        'Country': countries[line_invoice]
+    })
+
+    # Exact duplicate lines, as found in the real export
+    duplicates = df.iloc[np.sort(rng.choice(n_unique, size=n_rows - n_unique, replace=False))]
+    df = pd.concat([df, duplicates]).sort_index(kind='stable').reset_index(drop=True)
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Online Retail CSV")
+    parser.add_argument('--rows', type=int, default=REFERENCE_ROWS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, default='data/raw/synthetic_retail.csv')
+    args = parser.parse_args()
+
+    df = generate_online_retail(args.rows, seed=args.seed)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    df.to_csv(args.out, index=False)
+    logger.info(f"Wrote {len(df)} synthetic rows to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from loguru import logger
+from src.ingestion.raw_cache import coerce_mixed_columns
+
+# Bytes before a CSV watermark that must be unchanged for the file to count as appended to
+TAIL_BYTES = 4096
+
+class SourceWatermarks:
+    """
+    Persisted high-watermark of every raw source file: its size and mtime when
+    last read, the latest InvoiceDate extracted from it (with fingerprints of
+    the rows at that instant) and, for CSV files, the byte offset of the first
+    unread line. Incremental runs extract only what lies beyond these marks, so
+    their cost follows the new data, not the history.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: JSON file backing the marks; None keeps them in memory only
+        """
+        self.path = Path(path) if path else None
+        self.marks = {}
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.marks = json.load(f)
+            logger.info(f"Loaded watermarks for {len(self.marks)} source files.")
+
+    def get(self, source):
+        return self.marks.get(os.path.abspath(source))
+
+    def update(self, marks):
+        """Merges marks returned by an extraction (call once its rows are loaded)"""
+        self.marks.update(marks)
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.marks, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def extract(self, path, read_all):
+        """
+        Rows of `path` beyond its watermark, and the file's new mark.
+        Unchanged files are skipped from their size and mtime; CSV files that were
+        only appended to are read from the stored byte offset. Any other change,
+        and every change to an Excel file (which cannot be read from an offset),
+        re-reads the whole file and keeps the rows after the stored InvoiceDate,
+        plus rows at that instant whose fingerprint was not extracted before.
+        Rows dated before the watermark are skipped and counted in the log.
+        :param read_all: Callable returning the whole file as a DataFrame
+        :return: (DataFrame, or None if the file is unchanged; {source: new mark})
+        """
+        source = os.path.abspath(path)
+        stat = os.stat(path)
+        mark = self.get(path)
+        if mark is not None and mark['size'] == stat.st_size and mark['mtime_ns'] == stat.st_mtime_ns:
+            return None, {}
+
+        is_csv = path.endswith('.csv')
+        new_mark = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if is_csv:
+            new_mark['offset'] = self._last_line_end(path, stat.st_size)
+            new_mark['tail_sha1'] = self._tail_hash(path, new_mark['offset'])
+
+        if is_csv and mark is not None and mark.get('offset') and self._is_append(path, mark):
+            df = self._read_csv_range(path, mark['offset'], new_mark['offset'])
+            logger.info(f"{os.path.basename(path)}: read {len(df)} appended rows from byte {mark['offset']}.")
+        else:
+            if mark is not None:
+                logger.info(f"{os.path.basename(path)} changed in place, re-reading it in full.")
+            df = read_all(path)
+            if mark is not None and mark.get('max_invoice_date'):
+                df = self._beyond_mark(path, df, mark)
+
+        # The rows at the latest instant are remembered, so a rewrite can tell them from new ones
+        dates = pd.to_datetime(df['InvoiceDate'], errors='coerce')
+        latest = dates.max() if len(df) else None
+        boundary = []
+        if mark is not None and mark.get('max_invoice_date'):
+            previous = pd.Timestamp(mark['max_invoice_date'])
+            if pd.isna(latest) or latest <= previous:
+                latest, boundary = previous, list(mark.get('boundary_rows', []))
+        if pd.notna(latest) and len(df):
+            boundary += row_fingerprints(df[(dates == latest).to_numpy()])
+        new_mark['max_invoice_date'] = latest.isoformat() if pd.notna(latest) else None
+        new_mark['boundary_rows'] = sorted(set(boundary))
+        return df, {source: new_mark}
+
+    @staticmethod
+    def _beyond_mark(path, df, mark):
+        """Rows of a re-read file after its watermark, or at it and not extracted before"""
+        dates = pd.to_datetime(df['InvoiceDate'], errors='coerce')
+        watermark = pd.Timestamp(mark['max_invoice_date'])
+        older = (dates < watermark).to_numpy()
+        at_mark = (dates == watermark).to_numpy()
+        seen = np.zeros(len(df), dtype=bool)
+        if at_mark.any():
+            seen[at_mark] = np.isin(row_fingerprints(df[at_mark]), mark.get('boundary_rows', []))
+
+        name = os.path.basename(path)
+        if older.any():
+            logger.warning(f"{name}: skipped {older.sum()} rows dated before its watermark {watermark} "
+                           f"(already extracted, or back-dated and never loaded).")
+        df = df[~(older | seen)]
+        logger.info(f"{name}: {len(df)} rows beyond its watermark.")
+        return df
+
+    def _is_append(self, path, mark):
+        """True if the file grew and the bytes before the stored offset are unchanged"""
+        return os.path.getsize(path) >= mark['offset'] and self._tail_hash(path, mark['offset']) == mark['tail_sha1']
+
+    @staticmethod
+    def _tail_hash(path, offset):
+        with open(path, "rb") as f:
+            f.seek(max(0, offset - TAIL_BYTES))
+            return hashlib.sha1(f.read(offset - max(0, offset - TAIL_BYTES))).hexdigest()
+
+    @staticmethod
+    def _last_line_end(path, size):
+        """Offset just past the last newline, so a line still being written is read next time"""
+        with open(path, "rb") as f:
+            position = size
+            while position > 0:
+                start = max(0, position - TAIL_BYTES)
+                f.seek(start)
+                block = f.read(position - start)
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    return start + newline + 1
+                position = start
+        return 0
+
+    @staticmethod
+    def _read_csv_range(path, start, end):
+        """Parses the CSV header plus the complete lines between byte offsets start and end"""
+        with open(path, "rb") as f:
+            header = f.readline()
+            f.seek(start)
+            return coerce_mixed_columns(pd.read_csv(io.BytesIO(header + f.read(end - start))))
+
+def row_fingerprints(df):
+    """
+    SHA-1 of every row's values, independent of how the file was parsed: numbers
+    are compared as floats and dates as timestamps, since a byte-range read and
+    a full read of the same file may infer different dtypes.
+    """
+    def normalize(value):
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return ''
+        try:
+            return repr(float(value))
+        except (TypeError, ValueError):
+            return str(value).strip()
+
+    values = df.assign(InvoiceDate=pd.to_datetime(df['InvoiceDate'], errors='coerce').astype(str)).astype(object)
+    return [
+        hashlib.sha1('|'.join(normalize(value) for value in row).encode('utf-8')).hexdigest()
+        for row in values.itertuples(index=False)
+    ]
@@ -0,0 +1,178 @@
+import json
+import os
+import resource
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+from loguru import logger
+
+def _rss_bytes():
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return _peak_rss_bytes()
+
+def _peak_rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM'))
+    except (OSError, StopIteration):
+        # ru_maxrss is KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def _reset_peak_rss():
+    """Resets the kernel's peak RSS counter (Linux); elsewhere peaks stay process-wide"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+class Stage:
+    """Measurements of one stage execution; callers fill in rows_in/rows_out"""
+    def __init__(self, name, batch=None, rows_in=None):
+        self.name = name
+        self.batch = batch
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.started_at = datetime.now()
+        self.wall_s = None
+        self.cpu_s = None
+        self.peak_mem_mb = None
+        self.status = 'running'
+        self._rss_start = _rss_bytes()
+        self._peak = self._rss_start
+
+    def observe_peak(self):
+        self._peak = max(self._peak, _peak_rss_bytes())
+
+    def to_dict(self):
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        return {
+            'stage': self.name,
+            'batch': self.batch,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_s': round(self.wall_s, 4),
+            'cpu_s': round(self.cpu_s, 4),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_s': round(rows / self.wall_s, 1) if rows and self.wall_s else None,
+            'peak_mem_mb': round(self.peak_mem_mb, 2)
+        }
+
+class RunMetrics:
+    """
+    Per-stage instrumentation for one pipeline run: wall and CPU time, rows in/out,
+    rows/s and peak memory above the stage's starting RSS. Stages may nest (a load
+    step inside the load phase); every stage still sees the highest peak reached
+    while it was active. CPU time and memory are process-wide, so stages running
+    concurrently in threads share them.
+    """
+    def __init__(self, step):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.step = step
+        self.started_at = datetime.now()
+        self.status = 'running'
+        self.stages = []
+        self._active = []
+
+    @contextmanager
+    def stage(self, name, batch=None, rows_in=None):
+        """
+        Times the wrapped block. Usage:
+            with metrics.stage('clean', rows_in=len(df)) as stage:
+                df = cleaner.clean()
+                stage.rows_out = len(df)
+        """
+        # Resetting the kernel peak would hide what outer stages reached so far
+        for outer in self._active:
+            outer.observe_peak()
+        _reset_peak_rss()
+
+        stage = Stage(name, batch, rows_in)
+        self._active.append(stage)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+            stage.status = 'success'
+        except BaseException:
+            stage.status = 'failed'
+            raise
+        finally:
+            stage.wall_s = time.perf_counter() - wall_start
+            stage.cpu_s = time.process_time() - cpu_start
+            stage.observe_peak()
+            stage.peak_mem_mb = max(stage._peak - stage._rss_start, 0) / 1e6
+            self._active.remove(stage)
+            self.stages.append(stage)
+            logger.debug(f"Stage '{name}' took {stage.wall_s:.2f}s (peak +{stage.peak_mem_mb:.1f} MB).")
+
+    def timed_iter(self, name, frames):
+        """Yields from an iterable of DataFrames, recording the time to produce each as a stage"""
+        iterator = iter(frames)
+        batch = 0
+        while True:
+            batch += 1
+            with self.stage(name, batch) as stage:
+                frame = next(iterator, None)
+                stage.rows_out = len(frame) if frame is not None else 0
+            if frame is None:
+                # The final call only detected the end of the input
+                self.stages.pop()
+                return
+            yield frame
+
+    def summary(self):
+        """Totals per stage name across batches/chunks"""
+        if not self.stages:
+            return []
+        df = self.to_frame()
+        grouped = df.groupby('stage', sort=False).agg(
+            calls=('stage', 'size'),
+            wall_s=('wall_s', 'sum'),
+            cpu_s=('cpu_s', 'sum'),
+            rows_in=('rows_in', 'sum'),
+            rows_out=('rows_out', 'sum'),
+            peak_mem_mb=('peak_mem_mb', 'max')
+        ).reset_index()
+        rows = grouped['rows_out'].where(grouped['rows_out'] > 0, grouped['rows_in']).where(lambda r: r > 0)
+        grouped['rows_per_s'] = (rows / grouped['wall_s'].where(grouped['wall_s'] > 0)).round(1)
+        grouped = grouped.round(4).astype(object)
+        return grouped.where(grouped.notna(), None).to_dict(orient='records')
+
+    def report(self):
+        return {
+            'run_id': self.run_id,
+            'step': self.step,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_s': round((datetime.now() - self.started_at).total_seconds(), 3),
+            'stages': [stage.to_dict() for stage in self.stages],
+            'summary': self.summary()
+        }
+
+    def to_frame(self):
+        """One row per stage execution, in the layout of the pipeline_runs table"""
+        df = pd.DataFrame([stage.to_dict() for stage in self.stages])
+        df.insert(0, 'run_id', self.run_id)
+        df.insert(1, 'step', self.step)
+        df['started_at'] = pd.to_datetime(df['started_at'])
+        return df.astype({'rows_in': 'Int64', 'rows_out': 'Int64', 'rows_per_s': 'float64'})
+
+    def save(self, directory):
+        """Writes the JSON run report to `directory` and returns its path"""
+        directory = Path(directory)
+        os.makedirs(directory, exist_ok=True)
+        path = directory / f"run_{self.started_at:%Y%m%d_%H%M%S}_{self.run_id}.json"
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        logger.info(f"Run metrics written to {path}")
+        return path
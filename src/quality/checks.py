@@ -1,9 +1,20 @@
 from loguru import logger
 import pandas as pd
+from src.transformation.engine import resolve_engine, import_polars, to_lazy
+
+CRITICAL_COLUMNS = ['InvoiceNo', 'CustomerID', 'StockCode', 'Total_GBP']
 
 class QualityChecks:
-    def __init__(self, df):
+    def __init__(self, df, engine=None, fx_rates=None):
+        """
+        :param df: Processed DataFrame
+        :param engine: 'pandas' or 'polars' (default: DATAFRAME_ENGINE) used to profile df
+        :param fx_rates: Rate table (rate_date, currency, rate) that prices df's FX_Rate_Date
+            when currencies are computed on read instead of materialized
+        """
         self.df = df
+        self.engine = resolve_engine(engine)
+        self.fx_rates = fx_rates
 
     def run_checks(self):
         """
@@ -12,11 +23,11 @@ class QualityChecks:
         """
         logger.info("Running Advanced Data Quality Suite...")
         passed = True
-        
+        profile = self._profile_polars() if self.engine == 'polars' else self._profile()
+
         # 1. Null Check (Non-negotiable columns)
-        critical_cols = ['InvoiceNo', 'CustomerID', 'StockCode', 'Total_GBP']
-        for col in critical_cols:
-            null_count = self.df[col].isnull().sum()
+        for col in CRITICAL_COLUMNS:
+            null_count = profile[f'nulls_{col}']
             if null_count > 0:
                 logger.error(f"DQ Failure: Column '{col}' contains {null_count} nulls.")
                 passed = False
@@ -25,35 +36,95 @@ class QualityChecks:
         # Combination of InvoiceNo and StockCode should be unique in most cases
         # (Actually, there might be multiple lines for same stock code in one invoice?
         # Standard retail usually has one line per product per invoice. Let's check duplicates.)
-        duplicates = self.df.duplicated(subset=['InvoiceNo', 'StockCode']).sum()
+        duplicates = profile['duplicates']
         if duplicates > 0:
             logger.warning(f"DQ Warning: Found {duplicates} duplicate product entries within invoices. This might be normal but warrants review.")
-        
+
         # 3. Negative Value Check (Critical for Fact Table)
-        if (self.df['Quantity'] <= 0).any():
+        if profile['non_positive_quantity']:
             logger.error("DQ Failure: Found zero or negative quantities after cleaning!")
             passed = False
-            
-        if (self.df['Total_GBP'] <= 0).any():
+
+        if profile['non_positive_revenue']:
             logger.error("DQ Failure: Found zero or negative revenue!")
             passed = False
-            
+
         # 4. Date Sanity
         # Check for future dates
-        future_dates = (self.df['InvoiceDate'] > pd.Timestamp.now()).sum()
+        future_dates = profile['future_dates']
         if future_dates > 0:
             logger.error(f"DQ Failure: Found {future_dates} records with future timestamps!")
             passed = False
 
         # 5. Currency Conversion integrity
-        if 'Total_USD' in self.df.columns:
-            if (self.df['Total_USD'] == 0).all() and (self.df['Total_GBP'] != 0).any():
-                 logger.error("DQ Failure: Multi-currency conversion failed (detected columns with all zeros).")
-                 passed = False
+        if profile['conversion_failed']:
+            logger.error("DQ Failure: Multi-currency conversion failed (detected columns with all zeros).")
+            passed = False
+
+        # Lines on a day the FX history has no rates for are left unconverted
+        unconverted = profile['unconverted']
+        if unconverted > 0:
+            logger.error(f"DQ Failure: {unconverted} records have no FX rate for their invoice day.")
+            passed = False
+
+        # Compute-on-read: every line needs a rate key with a positive rate for each currency
+        if 'Total_USD' not in self.df.columns and 'FX_Rate_Date' in self.df.columns:
+            unrated = self._unrated_lines()
+            if unrated > 0:
+                logger.error(f"DQ Failure: {unrated} records have no FX rates to convert them on read.")
+                passed = False
 
         if passed:
             logger.info("✅ All critical Data Quality Checks Passed.")
         else:
             logger.error("❌ Data Quality Suite Failed. Review logs for details.")
-            
+
         return passed
+
+    def _profile(self):
+        """Measurements behind each check, computed with pandas"""
+        profile = {f'nulls_{col}': int(self.df[col].isnull().sum()) for col in CRITICAL_COLUMNS}
+        profile['duplicates'] = int(self.df.duplicated(subset=['InvoiceNo', 'StockCode']).sum())
+        profile['non_positive_quantity'] = bool((self.df['Quantity'] <= 0).any())
+        profile['non_positive_revenue'] = bool((self.df['Total_GBP'] <= 0).any())
+        profile['future_dates'] = int((self.df['InvoiceDate'] > pd.Timestamp.now()).sum())
+        profile['conversion_failed'] = 'Total_USD' in self.df.columns and bool(
+            (self.df['Total_USD'] == 0).all() and (self.df['Total_GBP'] != 0).any()
+        )
+        totals = self._converted_columns()
+        profile['unconverted'] = int(self.df[totals].isna().any(axis=1).sum()) if totals else 0
+        return profile
+
+    def _converted_columns(self):
+        """The Total_* columns converted from Total_GBP"""
+        return [c for c in self.df.columns if str(c).startswith('Total_') and c != 'Total_GBP']
+
+    def _unrated_lines(self):
+        """Lines without an FX_Rate_Date, or whose date lacks a positive rate for a currency of fx_rates"""
+        dates = pd.to_datetime(self.df['FX_Rate_Date'])
+        if self.fx_rates is None:
+            return int(dates.isna().sum())
+        wide = self.fx_rates.pivot_table(index='rate_date', columns='currency', values='rate', aggfunc='last')
+        priced = pd.to_datetime(wide.index[(wide > 0).all(axis=1)])
+        return int((~dates.isin(priced)).sum())
+
+    def _profile_polars(self):
+        """The same measurements as `_profile`, as a single aggregation query"""
+        pl = import_polars()
+        measures = [pl.col(col).null_count().alias(f'nulls_{col}') for col in CRITICAL_COLUMNS] + [
+            (pl.len() - pl.struct('InvoiceNo', 'StockCode').n_unique()).alias('duplicates'),
+            (pl.col('Quantity') <= 0).any().alias('non_positive_quantity'),
+            (pl.col('Total_GBP') <= 0).any().alias('non_positive_revenue'),
+            (pl.col('InvoiceDate') > pd.Timestamp.now().to_pydatetime()).sum().alias('future_dates')
+        ]
+        if 'Total_USD' in self.df.columns:
+            measures.append(
+                ((pl.col('Total_USD') == 0).all() & (pl.col('Total_GBP') != 0).any()).alias('conversion_failed')
+            )
+        totals = self._converted_columns()
+        if totals:
+            measures.append(pl.any_horizontal(pl.col(totals).is_null()).sum().alias('unconverted'))
+        profile = to_lazy(self.df).select(measures).collect().row(0, named=True)
+        profile.setdefault('conversion_failed', False)
+        profile.setdefault('unconverted', 0)
+        return profile
@@ -1,49 +1,137 @@
+import numpy as np
 import pandas as pd
 from loguru import logger
+from src.ingestion.hash_index import RowHashIndex
+from src.transformation.engine import resolve_engine, import_polars, to_lazy, to_pandas
 
 class DataCleaner:
-    def __init__(self, df):
-        self.df = df.copy()
+    def __init__(self, df, hash_index=None, copy=True, engine=None):
+        """
+        :param df: Raw DataFrame
+        :param hash_index: Optional RowHashIndex of rows already loaded to the warehouse
+        :param copy: False takes ownership of df instead of copying it
+                     (the caller must not use df afterwards)
+        :param engine: 'pandas' or 'polars' (default: DATAFRAME_ENGINE)
+        """
+        self.engine = resolve_engine(engine)
+        # The polars engine only reads df, so there is nothing to protect with a copy
+        self.df = df.copy() if copy and self.engine == 'pandas' else df
+        self.hash_index = hash_index
+        self.row_hashes = None
+        self.new_rows = None
 
     def clean(self):
         """
         Performs data cleaning:
         1. Remove null InvoiceNo and CustomerID
         2. Remove negative/zero Quantity and UnitPrice
-        3. Drop duplicates
-        4. Standardize types
+        3. Standardize types
+        4. Drop duplicates (hashed, within the batch and against the dedup index)
+
+        After cleaning, `row_hashes` holds the hash of every output row and
+        `new_rows` flags the rows the index has not seen yet.
         """
         initial_count = len(self.df)
+
+        if self.engine == 'polars':
+            # Steps 1-3 as one optimized query
+            self.df = self._standardize_polars()
+        else:
+            # 1. Drop Rows with missing essential ID info
+            valid = self.df['InvoiceNo'].notna() & self.df['CustomerID'].notna()
         
-        # 1. Drop Rows with missing essential ID info
-        self.df = self.df.dropna(subset=['InvoiceNo', 'CustomerID'])
-        
-        # 2. Filter out invalid financial records
-        # Negative quantities usually represent returns, we'll exclude them for 
-        # a "Sales Performance" analysis or handle them as separate 'Returns'
-        # For this ETL, we focus on positive sales.
-        self.df = self.df[self.df['Quantity'] > 0]
-        self.df = self.df[self.df['UnitPrice'] > 0]
-        
-        # 3. Handle duplicates
-        self.df = self.df.drop_duplicates()
+            # 2. Filter out invalid financial records
+            # Negative quantities usually represent returns, we'll exclude them for 
+            # a "Sales Performance" analysis or handle them as separate 'Returns'
+            # For this ETL, we focus on positive sales.
+            valid &= (self.df['Quantity'] > 0) & (self.df['UnitPrice'] > 0)
+
+            # Steps 1 and 2 share one mask, so the frame is materialized once
+            self.df = self.df[valid]
         
-        # 4. Standardize types and strings
-        self.df['CustomerID'] = self.df['CustomerID'].astype(int).astype(str)
-        self.df['InvoiceDate'] = pd.to_datetime(self.df['InvoiceDate'])
+            # 3. Standardize types and strings
+            # Key and label columns repeat a few distinct values, so they are factorized into
+            # categoricals and only the distinct values are converted and normalized
+            self.df['CustomerID'] = encode_categorical(self.df['CustomerID'], lambda u: u.astype(int).astype(str))
+            self.df['InvoiceDate'] = pd.to_datetime(self.df['InvoiceDate'])
         
-        # Strip whitespace and normalize case for categorical data
-        for col in ['InvoiceNo', 'StockCode', 'Description', 'Country']:
-            if col in self.df.columns:
-                self.df[col] = self.df[col].astype(str).str.strip()
-                if col in ['InvoiceNo', 'StockCode', 'Country']:
-                    self.df[col] = self.df[col].str.upper()
+            # Strip whitespace and normalize case for categorical data
+            for col in ['InvoiceNo', 'StockCode', 'Description', 'Country']:
+                if col in self.df.columns:
+                    if col in ['InvoiceNo', 'StockCode', 'Country']:
+                        normalize = lambda u: u.astype(str).str.strip().str.upper()
+                    else:
+                        normalize = lambda u: u.astype(str).str.strip()
+                    self.df[col] = encode_categorical(self.df[col], normalize)
+
+        # 4. Handle duplicates: one hashing pass serves both the in-batch check
+        # and the lookup against rows loaded by previous runs
+        hashes = RowHashIndex.hash_rows(self.df)
+        keep = RowHashIndex.first_occurrences(hashes)
+        self.df = self.df[keep]
+        self.row_hashes = hashes[keep]
+
+        if self.hash_index is not None:
+            self.new_rows = ~self.hash_index.contains(self.row_hashes)
+            logger.info(f"Dedup index: {len(self.df) - self.new_rows.sum()} rows were already loaded.")
+        else:
+            self.new_rows = np.ones(len(self.df), dtype=bool)
 
         cleaned_count = len(self.df)
         logger.info(f"Cleaning complete. Rows: {initial_count} -> {cleaned_count} (Dropped {initial_count - cleaned_count})")
         
         return self.df
 
+    def _standardize_polars(self):
+        """
+        Steps 1-3 on the polars engine. Key and label columns stay plain strings;
+        dates are parsed from their distinct values with the pandas parser, so
+        both engines read the same formats.
+        """
+        pl = import_polars()
+        dates = pl.col('InvoiceDate')
+        if not pd.api.types.is_datetime64_any_dtype(self.df['InvoiceDate']):
+            raw = pd.Series(self.df['InvoiceDate'].dropna().unique())
+            dates = dates.replace_strict(pl.from_pandas(raw), pl.from_pandas(pd.to_datetime(raw)), default=None)
+
+        columns = [
+            pl.col('CustomerID').cast(pl.Int64).cast(pl.String),
+            dates.alias('InvoiceDate')
+        ]
+        for col in ['InvoiceNo', 'StockCode', 'Description', 'Country']:
+            if col in self.df.columns:
+                normalized = pl.col(col).cast(pl.String).str.strip_chars()
+                columns.append(normalized if col == 'Description' else normalized.str.to_uppercase())
+
+        query = to_lazy(self.df).filter(
+            pl.col('InvoiceNo').is_not_null() & pl.col('CustomerID').is_not_null()
+            & (pl.col('Quantity') > 0) & (pl.col('UnitPrice') > 0)
+        ).with_columns(columns)
+        return to_pandas(query, self.df.index.name)
+
+def encode_categorical(col, normalize):
+    """
+    Factorizes col and applies `normalize` (Series -> Series) to its distinct values only.
+    Values that normalize to the same string share one category; missing values stay missing.
+    """
+    codes, uniques = pd.factorize(col)
+    # Sorted categories keep groupby output in the same order as on plain strings
+    categories, merged = pd.factorize(normalize(pd.Series(uniques)), sort=True)
+    codes = np.where(codes >= 0, categories[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=merged), index=col.index, name=col.name)
+
+def decode_categoricals(obj):
+    """
+    Plain-valued copy of a categorical Series/Index, or of a DataFrame's categorical columns.
+    Used where values leave the pipeline or are merged across batches with different categories.
+    """
+    if isinstance(obj, pd.DataFrame):
+        categorical = [col for col in obj.columns if isinstance(obj[col].dtype, pd.CategoricalDtype)]
+        return obj.astype({col: obj[col].cat.categories.dtype for col in categorical}) if categorical else obj
+    if isinstance(obj.dtype, pd.CategoricalDtype):
+        return obj.astype(obj.dtype.categories.dtype)
+    return obj
+
 if __name__ == "__main__":
     # Test cleaning logic
     pass
@@ -1,28 +1,133 @@
+import numpy as np
 import pandas as pd
 from loguru import logger
+from config.settings import settings
+from src.transformation.engine import resolve_engine, import_polars, to_lazy, to_pandas
 
 class CurrencyTransformer:
-    def __init__(self, df, exchange_rates):
+    def __init__(self, df, exchange_rates, copy=True, engine=None, materialize=None):
         """
         :param df: Cleaned DataFrame
-        :param exchange_rates: Dict of rates { 'USD': 1.27, 'EUR': 1.16, ... }
+        :param exchange_rates: Dict of rates { 'USD': 1.27, 'EUR': 1.16, ... }, or a date-sorted
+            DataFrame of daily rates (a date column and one column per currency) to convert
+            each line at the rate of its invoice date
+        :param copy: False writes the Total_* columns into df itself
+        :param engine: 'pandas' or 'polars' (default: DATAFRAME_ENGINE); polars returns a new frame
+        :param materialize: Write a Total_* column per currency (default: unless CURRENCY_MODE is
+            'on_read'); otherwise only Total_GBP and the FX_Rate_Date key are kept, see with_currency_totals
         """
-        self.df = df.copy()
+        self.engine = resolve_engine(engine)
+        self.df = df.copy() if copy and self.engine == 'pandas' else df
         self.rates = exchange_rates
+        self.is_history = isinstance(exchange_rates, pd.DataFrame)
+        self.currencies = [c for c in (exchange_rates.columns if self.is_history else exchange_rates)
+                           if c not in ('date', 'GBP')]
+        self.materialize = settings.CURRENCY_MODE != 'on_read' if materialize is None else materialize
+        # A rate snapshot is keyed by the day it was taken
+        self.snapshot_date = pd.Timestamp.now().normalize()
 
     def transform(self):
         """
-        Calculates Total Revenue in GBP (base), USD, EUR, MAD
-        """
-        # Base Calculation: Total GBP
-        self.df['Total_GBP'] = self.df['Quantity'] * self.df['UnitPrice']
-        
-        # Multi-currency conversion
-        for currency, rate in self.rates.items():
-            if currency == 'GBP':
-                continue
-            col_name = f'Total_{currency}'
-            self.df[col_name] = self.df['Total_GBP'] * rate
-            
-        logger.info(f"Currency transformation applied for: {list(self.rates.keys())}")
+        Calculates Total Revenue in GBP (base), USD, EUR, MAD, and the date of
+        the rates each line was converted at (FX_Rate_Date, its key into rate_table())
+        """
+        if self.engine == 'polars':
+            self.df = self._transform_polars()
+        else:
+            # Base Calculation: Total GBP
+            self.df['Total_GBP'] = self.df['Quantity'] * self.df['UnitPrice']
+
+            # Multi-currency conversion
+            if self.is_history:
+                rate_dates, rates = self._rates_as_of()
+                self.df['FX_Rate_Date'] = rate_dates
+                if self.materialize:
+                    totals = self.df['Total_GBP'].to_numpy() * rates
+                    for i, currency in enumerate(self.currencies):
+                        self.df[f'Total_{currency}'] = totals[i]
+            else:
+                self.df['FX_Rate_Date'] = self.snapshot_date
+                if self.materialize:
+                    for currency in self.currencies:
+                        self.df[f'Total_{currency}'] = self.df['Total_GBP'] * self.rates[currency]
+
+        logger.info(f"Currency transformation applied for: {self.currencies}"
+                    + (" at invoice-date rates" if self.is_history else "")
+                    + ("" if self.materialize else " (computed on read)"))
         return self.df
+
+    def rate_table(self):
+        """
+        The rates lines are converted at, one row per rate_date and currency (the
+        fx_rates table); once transformed, only the dates the lines reference
+        """
+        if self.is_history:
+            rates = self.rates.assign(rate_date=pd.to_datetime(self.rates['date']).dt.normalize().astype('datetime64[ns]'))
+            if 'FX_Rate_Date' in self.df.columns:
+                rates = rates[rates['rate_date'].isin(pd.to_datetime(self.df['FX_Rate_Date'].unique()))]
+            return rates.melt(id_vars='rate_date', value_vars=self.currencies, var_name='currency',
+                              value_name='rate', ignore_index=True)
+        return pd.DataFrame({'rate_date': self.snapshot_date, 'currency': self.currencies,
+                             'rate': [float(self.rates[c]) for c in self.currencies]})
+
+    def _rates_as_of(self):
+        """
+        As-of join of the daily rate history: every line gets the rates dated on
+        or before its invoice day (lines older than the history get its first
+        rates). The sorted history is expanded to one entry per calendar day, so
+        lines are matched by day number in one pass, without sorting them.
+        :return: (rate date of every line, (currencies x lines) matrix of rates)
+        """
+        rate_days = self.rates['date'].to_numpy(dtype='datetime64[D]')
+        days = np.arange(rate_days[0], rate_days[-1] + 1)
+        history_row = np.searchsorted(rate_days, days, side='right') - 1
+
+        invoice_days = pd.to_datetime(self.df['InvoiceDate']).to_numpy(dtype='datetime64[D]')
+        position = (invoice_days - rate_days[0]).astype(np.int64)
+        early = position < 0
+        if early.any():
+            logger.warning(f"{early.sum()} lines predate the FX history, converted at its first rates.")
+        line_rows = history_row[np.clip(position, 0, len(days) - 1)]
+        rates = np.ascontiguousarray(self.rates[self.currencies].to_numpy(dtype=float).T)
+        return rate_days[line_rows].astype('datetime64[ns]'), rates[:, line_rows]
+
+    def _transform_polars(self):
+        pl = import_polars()
+        query = to_lazy(self.df).with_columns(Total_GBP=pl.col('Quantity') * pl.col('UnitPrice'))
+        if self.is_history:
+            # join_asof needs both sides sorted; lines older than the history take its first rates,
+            # while lines on a day without rates stay unconverted (null) like in pandas
+            rates = pl.from_pandas(self.rates[['date'] + self.currencies]).lazy().with_columns(
+                pl.col('date').cast(pl.Datetime('ns'))
+            )
+            first = self.rates.iloc[0]
+            conversions = [(pl.col('Total_GBP') * pl.when(pl.col('date').is_null()).then(pl.lit(first[c]))
+                            .otherwise(pl.col(c))).alias(f'Total_{c}')
+                           for c in self.currencies] if self.materialize else []
+            query = query.with_row_index('_row').with_columns(
+                pl.col('InvoiceDate').cast(pl.Datetime('ns')).alias('_rate_date')
+            ).sort('_rate_date').join_asof(
+                rates, left_on='_rate_date', right_on='date', strategy='backward'
+            ).with_columns(
+                pl.col('date').fill_null(pl.lit(pd.Timestamp(first['date']).to_pydatetime()).cast(pl.Datetime('ns'))).alias('FX_Rate_Date'), *conversions
+            ).sort('_row').drop(['_row', '_rate_date', 'date'] + self.currencies)
+        else:
+            conversions = [(pl.col('Total_GBP') * self.rates[c]).alias(f'Total_{c}')
+                           for c in self.currencies] if self.materialize else []
+            query = query.with_columns(pl.lit(self.snapshot_date.to_pydatetime()).alias('FX_Rate_Date'), *conversions)
+        return to_pandas(query, self.df.index.name)
+
+def with_currency_totals(df, fx_rates, currencies=None):
+    """
+    Accessor for frames converted with materialize=False: returns df with the
+    Total_* columns computed from Total_GBP and the fx_rates rows of each
+    line's FX_Rate_Date (any currency in fx_rates, not only those materialized before)
+    :param fx_rates: Long rate table (rate_date, currency, rate), e.g. CurrencyTransformer.rate_table()
+    :param currencies: Currencies to add (default: all in fx_rates)
+    """
+    wide = fx_rates.pivot_table(index='rate_date', columns='currency', values='rate', aggfunc='last')
+    wide.index = pd.to_datetime(wide.index).astype('datetime64[ns]')
+    currencies = [c for c in (currencies or wide.columns) if c != 'GBP']
+    rates = wide.reindex(index=pd.to_datetime(df['FX_Rate_Date']).astype('datetime64[ns]'), columns=currencies)
+    totals = df['Total_GBP'].to_numpy()[:, None] * rates.to_numpy(dtype=float)
+    return df.assign(**{f'Total_{c}': totals[:, i] for i, c in enumerate(currencies)})
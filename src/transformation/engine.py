@@ -0,0 +1,37 @@
+from config.settings import settings
+
+ENGINES = ('pandas', 'polars')
+# The pandas index travels through Polars queries as a column, so outputs keep the input's labels
+INDEX_COLUMN = '__index__'
+
+def resolve_engine(engine=None):
+    """
+    Validates a dataframe engine name (default: DATAFRAME_ENGINE).
+    Polars is optional; selecting it without the package installed fails here, up front.
+    """
+    engine = (engine or settings.DATAFRAME_ENGINE).lower()
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown dataframe engine '{engine}', expected one of {ENGINES}.")
+    if engine == 'polars':
+        import_polars()
+    return engine
+
+def import_polars():
+    try:
+        import polars as pl
+    except ImportError as e:
+        raise ImportError("The polars engine requires the 'polars' package (pip install polars).") from e
+    return pl
+
+def to_lazy(df):
+    """LazyFrame over a pandas frame; categoricals are read as plain strings"""
+    pl = import_polars()
+    frame = pl.from_pandas(df.reset_index(names=INDEX_COLUMN))
+    return frame.lazy().with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.String))
+
+def to_pandas(frame, index_name=None):
+    """Collects a LazyFrame (on all cores) or converts a DataFrame back to pandas with its original index"""
+    pl = import_polars()
+    if isinstance(frame, pl.LazyFrame):
+        frame = frame.collect()
+    return frame.to_pandas().set_index(INDEX_COLUMN).rename_axis(index_name)
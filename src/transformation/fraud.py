@@ -1,10 +1,181 @@
+import os
+from pathlib import Path
 import pandas as pd
 import numpy as np
 from loguru import logger
+from config.settings import settings
+from src.transformation.sketch import KLLSketch
+from src.transformation.partitions import MonthlyPartitions, concat_rows
+from src.transformation.cleaner import decode_categoricals
+from src.transformation.engine import resolve_engine, import_polars, to_lazy, to_pandas
+
+class FraudBaseline:
+    """
+    Running fraud baselines for streaming runs and CDC batches.
+    Keeps per-product UnitPrice sums/counts, the invoices of every customer
+    and day with their line counts (partitioned by month), and the transaction
+    values for the IQR threshold: exactly until FRAUD_SKETCH_MIN_ROWS values
+    have been folded in, as a KLL sketch from then on.
+    Persisted between runs so incremental batches are scored against history.
+    """
+    def __init__(self):
+        self.price_stats = None
+        # Invoices per customer and day, filed by month: a batch only reads its own days' months
+        self.invoices = MonthlyPartitions(['CustomerID', 'day', 'InvoiceNo', 'lines'], 'day')
+        # Exact values until the history is large enough for the sketch to pay off
+        self.values = np.empty(0)
+        self.value_sketch = None
+
+    def fold(self, df):
+        """
+        Folds a batch (with Total_GBP) into the baselines.
+        Every step touches only the batch's own products, customers and days.
+        """
+        prices = df.groupby('StockCode', observed=True)['UnitPrice'].agg(['sum', 'count'])
+        prices.index = decode_categoricals(prices.index)
+        self.price_stats = prices if self.price_stats is None else self.price_stats.add(prices, fill_value=0)
+
+        # Invoices per customer/day, counting each invoice once across batches
+        lines = day_invoice_lines(df)
+        months = self.invoices.months_of(lines['day'])
+        invoices = concat_rows([self.invoices.read(months), lines], self.invoices.columns)
+        self.invoices.replace(months, invoices.groupby(['CustomerID', 'day', 'InvoiceNo'], as_index=False)['lines'].sum())
+
+        values = df['Total_GBP'].to_numpy(dtype=float)
+        if self.value_sketch is not None:
+            self.value_sketch.update(values)
+        elif len(self.values) + len(values) >= settings.FRAUD_SKETCH_MIN_ROWS:
+            logger.info(f"Fraud value baseline reached {settings.FRAUD_SKETCH_MIN_ROWS} rows, switching to a sketch.")
+            self.value_sketch = KLLSketch(k=settings.FRAUD_SKETCH_K).update(np.concatenate([self.values, values]))
+            self.values = None
+        else:
+            self.values = np.concatenate([self.values, values])
+
+    def retract(self, df):
+        """
+        Takes removed lines (CDC DELETE events and UPDATE before images, with
+        Total_GBP) back out of the baselines. An invoice stops counting towards
+        its customer's day once its last line is gone. A sketch cannot forget
+        values, so once the history has switched to one, removed values stay
+        in the IQR baseline.
+        """
+        if df.empty or self.price_stats is None:
+            return
+
+        prices = df.groupby('StockCode', observed=True)['UnitPrice'].agg(['sum', 'count'])
+        prices.index = decode_categoricals(prices.index)
+        stats = self.price_stats.sub(prices.reindex(self.price_stats.index, fill_value=0))
+        self.price_stats = stats[stats['count'] > 0]
+
+        lines = day_invoice_lines(df)
+        months = self.invoices.months_of(lines['day'])
+        removed = self.invoices.read(months).merge(
+            lines, on=['CustomerID', 'day', 'InvoiceNo'], how='left', suffixes=('', '_removed')
+        )
+        left = (removed['lines'] - removed.pop('lines_removed').fillna(0)).astype('int64')
+        self.invoices.replace(months, removed.assign(lines=left)[(left > 0).to_numpy()])
+
+        if self.value_sketch is None:
+            self.values = remove_values(self.values, df['Total_GBP'].to_numpy(dtype=float))
+
+    def scores(self, df):
+        """
+        What a batch already folded in is scored against:
+        (Q1, Q3, avg price per row, invoices per customer/day per row).
+        """
+        if self.value_sketch is not None:
+            q1, q3 = self.value_sketch.quantile([0.25, 0.75])
+        else:
+            q1, q3 = np.nanquantile(self.values, [0.25, 0.75]) if len(self.values) else (np.nan, np.nan)
+
+        # Look the batch's keys up against the merged state (its months are still in memory after fold)
+        days = df['InvoiceDate'].dt.normalize()
+        invoices = self.invoices.read(self.invoices.months_of(days))
+        velocity = invoices.groupby(['CustomerID', 'day']).size()
+        avg = (self.price_stats['sum'] / self.price_stats['count']).reindex(decode_categoricals(df['StockCode']))
+        day_keys = pd.MultiIndex.from_arrays([decode_categoricals(df['CustomerID']), days])
+        return (
+            q1, q3,
+            pd.Series(avg.to_numpy(), index=df.index),
+            pd.Series(velocity.reindex(day_keys).to_numpy(), index=df.index)
+        )
+
+    def save(self, path):
+        """
+        Persists the baselines as Parquet/NumPy files under `path`; of the
+        invoices per customer/day, only the months changed since the last save are rewritten
+        """
+        if self.price_stats is None:
+            return
+        path = Path(path)
+        os.makedirs(path, exist_ok=True)
+        self.price_stats.rename_axis('StockCode').reset_index().to_parquet(path / "price_stats.parquet", index=False)
+        self.invoices.save(path / "invoices")
+        # Exactly one of the two value files describes the current baseline
+        stale = path / ("values.npy" if self.value_sketch is not None else "value_sketch.npz")
+        if os.path.exists(stale):
+            os.remove(stale)
+        if self.value_sketch is not None:
+            self.value_sketch.save(path / "value_sketch.npz")
+        else:
+            tmp_path = path / "values.tmp.npy"
+            np.save(tmp_path, self.values)
+            os.replace(tmp_path, path / "values.npy")
+        logger.info(f"Fraud baselines saved ({len(self.price_stats)} products).")
+
+    @classmethod
+    def load(cls, path):
+        """Restores baselines saved with `save`; returns empty baselines if none exist"""
+        baseline = cls()
+        path = Path(path)
+        if not os.path.exists(path / "price_stats.parquet"):
+            return baseline
+
+        baseline.price_stats = pd.read_parquet(path / "price_stats.parquet").set_index('StockCode')
+        # Invoices per customer/day are read month by month as batches need them
+        baseline.invoices.path = path / "invoices"
+        if os.path.exists(path / "value_sketch.npz"):
+            baseline.value_sketch, baseline.values = KLLSketch.load(path / "value_sketch.npz"), None
+        elif os.path.exists(path / "values.npy"):
+            baseline.values = np.load(path / "values.npy")
+        logger.info(f"Loaded fraud baselines for {len(baseline.price_stats)} products.")
+        return baseline
+
+def day_invoice_lines(df):
+    """Plain-valued (CustomerID, day, InvoiceNo, lines) of every invoice in a batch"""
+    days = df['InvoiceDate'].dt.normalize().rename('day')
+    return decode_categoricals(
+        df.groupby([df['CustomerID'], days, df['InvoiceNo']], observed=True).size().rename('lines').reset_index()
+    )
+
+def remove_values(values, removed):
+    """`values` (in any order) without one occurrence of each removed value"""
+    values, removed = np.sort(values), np.sort(removed)
+    # The i-th copy of a removed value takes out the i-th copy in values
+    copy = np.arange(len(removed)) - np.searchsorted(removed, removed, 'left')
+    pos = np.searchsorted(values, removed, 'left') + copy
+    found = pos < len(values)
+    found[found] = values[pos[found]] == removed[found]
+    keep = np.ones(len(values), dtype=bool)
+    keep[pos[found]] = False
+    return values[keep]
 
 class FraudDetector:
-    def __init__(self, df):
-        self.df = df.copy()
+    def __init__(self, df, baseline=None, copy=True, engine=None):
+        """
+        :param df: DataFrame with Total_GBP
+        :param baseline: Optional FraudBaseline; the batch is folded into it and
+                         scored against the running baselines instead of its own.
+                         Initial loads leave it out and fold afterwards, so they
+                         are scored exactly like any in-memory run.
+        :param copy: False adds Is_Fraud_Suspect to df itself
+        :param engine: 'pandas' or 'polars' (default: DATAFRAME_ENGINE). Running
+                       baselines are kept in pandas; with the polars engine their
+                       per-row lookups are handed to the query as columns.
+        """
+        self.engine = resolve_engine(engine)
+        self.df = df.copy() if copy and self.engine == 'pandas' else df
+        self.baseline = baseline
 
     def detect(self):
         """
@@ -15,31 +186,44 @@ class FraudDetector:
         """
         logger.info("Starting Advanced Fraud Detection Analysis...")
         
+        if self.baseline is not None:
+            self.baseline.fold(self.df)
+            Q1, Q3, avg_prices, invoice_counts = self.baseline.scores(self.df)
+
         # 1. IQR Method for Transaction Value
-        Q1 = self.df['Total_GBP'].quantile(0.25)
-        Q3 = self.df['Total_GBP'].quantile(0.75)
+        if self.baseline is None and len(self.df) >= settings.FRAUD_SKETCH_MIN_ROWS:
+            # Large inputs: approximate quartiles from a sketch instead of a full sort
+            sketch = KLLSketch(k=settings.FRAUD_SKETCH_K).update(self.df['Total_GBP'].to_numpy(dtype=float))
+            Q1, Q3 = sketch.quantile([0.25, 0.75])
+        elif self.baseline is None:
+            Q1 = self.df['Total_GBP'].quantile(0.25)
+            Q3 = self.df['Total_GBP'].quantile(0.75)
         IQR = Q3 - Q1
         value_outlier_limit = Q3 + 3.0 * IQR # Stringent threshold
+
+        if self.engine == 'polars':
+            if self.baseline is not None:
+                return self._detect_polars(value_outlier_limit, avg_prices, invoice_counts)
+            return self._detect_polars(value_outlier_limit)
         
         # 2. Product Price Anomaly
         # Detect if an item is sold at > 200% of its usual average price (potential fat-finger or fraud)
-        avg_prices = self.df.groupby('StockCode')['UnitPrice'].transform('mean')
+        if self.baseline is None:
+            avg_prices = self.df.groupby('StockCode', observed=True)['UnitPrice'].transform('mean')
         price_anomaly = self.df['UnitPrice'] > (avg_prices * 2.0)
         
         # 3. High Velocity 
         # Customers with more than 10 unique invoices in a single day
-        self.df['date_only'] = self.df['InvoiceDate'].dt.date
-        invoice_counts = self.df.groupby(['CustomerID', 'date_only'])['InvoiceNo'].transform('nunique')
+        if self.baseline is None:
+            # Grouping by a derived key leaves the frame untouched (no temporary column)
+            date_only = self.df['InvoiceDate'].dt.normalize().rename('date_only')
+            invoice_counts = self.df.groupby([self.df['CustomerID'], date_only], observed=True)['InvoiceNo'].transform('nunique')
         velocity_anomaly = invoice_counts > 10
         
         # Aggregate Flags
         value_anomaly = self.df['Total_GBP'] > value_outlier_limit
         
         self.df['Is_Fraud_Suspect'] = value_anomaly | price_anomaly | velocity_anomaly
-        
-        # Cleanup
-        if 'date_only' in self.df.columns:
-            self.df.drop(columns=['date_only'], inplace=True)
             
         suspects = self.df['Is_Fraud_Suspect'].sum()
         logger.info(f"Fraud Analysis Complete: Flagged {suspects} suspicious transactions.")
@@ -48,3 +232,38 @@ class FraudDetector:
         logger.info(f" - High Velocity Invoices: {velocity_anomaly.sum()}")
         
         return self.df
+
+    def _detect_polars(self, value_outlier_limit, avg_prices=None, invoice_counts=None):
+        """
+        Checks 2 and 3 and the flag aggregation as one query on the polars engine
+        :param avg_prices: Per-row product averages from a baseline (default: the batch's own)
+        :param invoice_counts: Per-row invoices per customer/day from a baseline (default: the batch's own)
+        """
+        pl = import_polars()
+        day = pl.col('InvoiceDate').dt.truncate('1d')
+        if avg_prices is None:
+            avg_price = pl.col('UnitPrice').mean().over('StockCode')
+            invoice_count = pl.col('InvoiceNo').n_unique().over('CustomerID', day)
+        else:
+            # Baseline lookups are aligned with the rows, so they join the query as plain columns
+            avg_price = pl.lit(pl.Series(avg_prices.to_numpy(dtype=float), nan_to_null=True))
+            invoice_count = pl.lit(pl.Series(invoice_counts.to_numpy(dtype=float), nan_to_null=True))
+        flags = to_lazy(self.df).with_columns(
+            value_anomaly=pl.col('Total_GBP') > value_outlier_limit,
+            price_anomaly=pl.col('UnitPrice') > avg_price * 2.0,
+            velocity_anomaly=invoice_count > 10
+        ).with_columns(
+            pl.col('value_anomaly', 'price_anomaly', 'velocity_anomaly').fill_null(False)
+        ).with_columns(
+            Is_Fraud_Suspect=pl.any_horizontal('value_anomaly', 'price_anomaly', 'velocity_anomaly')
+        ).collect()
+
+        counts = flags.select(pl.col('Is_Fraud_Suspect', 'value_anomaly', 'price_anomaly', 'velocity_anomaly').sum())
+        suspects, value_count, price_count, velocity_count = counts.row(0)
+        self.df = to_pandas(flags.drop('value_anomaly', 'price_anomaly', 'velocity_anomaly'), self.df.index.name)
+
+        logger.info(f"Fraud Analysis Complete: Flagged {suspects} suspicious transactions.")
+        logger.info(f" - Value Outliers (> {value_outlier_limit:.2f} GBP): {value_count}")
+        logger.info(f" - Price Anomalies: {price_count}")
+        logger.info(f" - High Velocity Invoices: {velocity_count}")
+        return self.df
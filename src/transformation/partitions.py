@@ -0,0 +1,85 @@
+import os
+import shutil
+from pathlib import Path
+import pandas as pd
+from loguru import logger
+
+class MonthlyPartitions:
+    """
+    Running state rows split by the month of a date column and persisted as
+    one Parquet file per month. Batches read and rewrite only the months their
+    dates fall in, and saved months are dropped from memory, so a batch's
+    memory and I/O follow its own date range instead of the whole history.
+    """
+    def __init__(self, columns, date_column, path=None):
+        """
+        :param columns: Columns of the state rows
+        :param date_column: Datetime column whose month files each row
+        :param path: Directory backing the partitions; None keeps them in memory
+                     until the first `save`
+        """
+        self.columns = list(columns)
+        self.date_column = date_column
+        self.path = Path(path) if path else None
+        self.frames = {}
+        self.dirty = set()
+
+    def months_of(self, dates):
+        """Distinct partition names ('YYYY-MM') of a datetime Series"""
+        return sorted(dates.dt.strftime('%Y-%m').dropna().unique())
+
+    def read(self, months):
+        """State rows of the given months, loading saved months on first use"""
+        for month in months:
+            if month not in self.frames:
+                file = self.path / f"{month}.parquet" if self.path is not None else None
+                self.frames[month] = pd.read_parquet(file) if file is not None and os.path.exists(file) else None
+        return concat_rows([self.frames[month] for month in months], self.columns)
+
+    def stored_months(self):
+        """Sorted names of every month holding rows, saved or still in memory"""
+        saved = {file.stem for file in self.path.glob('*.parquet')} if self.path is not None and self.path.exists() else set()
+        empty = {month for month, frame in self.frames.items() if frame is None or frame.empty}
+        return sorted((saved | set(self.frames)) - empty)
+
+    def replace(self, months, df):
+        """Makes df (rows dated within `months`) the full content of those months"""
+        if not months:
+            return
+        by_month = df[self.date_column].dt.strftime('%Y-%m')
+        for month in months:
+            self.frames[month] = df[(by_month == month).to_numpy()].reset_index(drop=True)
+            self.dirty.add(month)
+
+    def save(self, path=None):
+        """
+        Writes the months changed since the last save and frees them from memory.
+        Saving in-memory partitions to a path replaces whatever that path held.
+        """
+        path = Path(path) if path else self.path
+        if path is None:
+            return
+        if self.path != path:
+            shutil.rmtree(path, ignore_errors=True)
+            self.path, self.dirty = path, set(self.frames)
+        os.makedirs(path, exist_ok=True)
+
+        for month in sorted(self.dirty):
+            frame = self.frames[month]
+            file = path / f"{month}.parquet"
+            if frame is None or frame.empty:
+                if os.path.exists(file):
+                    os.remove(file)
+                continue
+            tmp_path = file.with_name(file.name + ".tmp")
+            frame.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, file)
+        logger.debug(f"Saved {len(self.dirty)} monthly partitions to {path}.")
+        self.frames, self.dirty = {}, set()
+
+def concat_rows(frames, columns):
+    """Concatenates the non-empty frames (empty ones would turn typed columns into object)"""
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
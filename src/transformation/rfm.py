@@ -1,9 +1,21 @@
+import os
+from pathlib import Path
+import numpy as np
 import pandas as pd
 from loguru import logger
+from src.transformation.cleaner import decode_categoricals
+from src.transformation.engine import resolve_engine, import_polars, to_lazy
+from src.transformation.partitions import MonthlyPartitions, concat_rows
 
 class RFMSegmenter:
-    def __init__(self, df):
-        self.df = df.copy()
+    def __init__(self, df, copy=True, engine=None):
+        """
+        :param df: Processed DataFrame with Total_GBP
+        :param copy: False aggregates df in place (it is only read)
+        :param engine: 'pandas' or 'polars' (default: DATAFRAME_ENGINE)
+        """
+        self.engine = resolve_engine(engine)
+        self.df = df.copy() if copy and self.engine == 'pandas' else df
 
     def generate_segments(self):
         """
@@ -12,23 +24,48 @@ class RFMSegmenter:
         - Frequency: Number of invoice transactions
         - Monetary: Total spend
         """
+        if self.engine == 'polars':
+            return self.score(self._aggregate_polars())
+
         # Ensure latest date is relative to the dataset
         snapshot_date = self.df['InvoiceDate'].max() + pd.Timedelta(days=1)
         
-        # Aggregate data by CustomerID
-        rfm = self.df.groupby('CustomerID').agg({
-            'InvoiceDate': lambda x: (snapshot_date - x.max()).days, # Recency
-            'InvoiceNo': 'nunique',                                   # Frequency
-            'Total_GBP': 'sum'                                        # Monetary
-        }).reset_index()
-        
-        # Rename columns
-        rfm.rename(columns={
-            'InvoiceDate': 'Recency',
-            'InvoiceNo': 'Frequency',
-            'Total_GBP': 'Monetary'
-        }, inplace=True)
+        # Aggregate data by CustomerID (native groupby kernels only, on the categorical codes)
+        rfm = self.df.groupby('CustomerID', observed=True).agg(
+            Last_Purchase=('InvoiceDate', 'max'),
+            Frequency=('InvoiceNo', 'nunique'),
+            Monetary=('Total_GBP', 'sum')
+        )
+        rfm.index = decode_categoricals(rfm.index)
+        rfm = rfm.reset_index()
         
+        # Recency is derived in one vectorized step from the last purchase date
+        rfm.insert(1, 'Recency', (snapshot_date - rfm.pop('Last_Purchase')).dt.days)
+
+        return self.score(rfm)
+
+    def _aggregate_polars(self):
+        """Per-customer CustomerID, Recency, Frequency, Monetary on the polars engine"""
+        pl = import_polars()
+        last_purchase = pl.col('Last_Purchase')
+        query = to_lazy(self.df).filter(pl.col('CustomerID').is_not_null()).group_by('CustomerID').agg(
+            Last_Purchase=pl.col('InvoiceDate').max(),
+            Frequency=pl.col('InvoiceNo').drop_nulls().n_unique().cast(pl.Int64),
+            Monetary=pl.col('Total_GBP').sum()
+        ).sort('CustomerID').select(
+            'CustomerID',
+            Recency=(last_purchase.max() + pl.duration(days=1) - last_purchase).dt.total_days(),
+            Frequency='Frequency',
+            Monetary='Monetary'
+        )
+        return query.collect().to_pandas()
+
+    @staticmethod
+    def score(rfm):
+        """
+        Scores and labels a per-customer frame holding
+        CustomerID, Recency, Frequency and Monetary columns.
+        """
         # Simple Scoring (Quantiles 1-4)
         # Using qcut with duplicate dropping to handle uneven distributions
         # Actually standard RFM: High Recency (days) = Bad score. High Freq/Mon = Good score.
@@ -48,37 +85,191 @@ class RFMSegmenter:
         rfm['M_Score'] = pd.qcut(rfm['Monetary'], q=4, labels=m_labels)
         
         # Convert to int for concatenation
-        rfm['R'] = rfm['R_Score'].astype(str)
-        rfm['F'] = rfm['F_Score'].astype(str)
-        rfm['M'] = rfm['M_Score'].astype(str)
+        r = rfm['R_Score'].astype(int)
+        f = rfm['F_Score'].astype(int)
+        m = rfm['M_Score'].astype(int)
+        rfm['R'] = r.astype(str)
+        rfm['F'] = f.astype(str)
+        rfm['M'] = m.astype(str)
         
         # RFM Segment Concatenation
         rfm['RFM_Segment'] = rfm['R'] + rfm['F'] + rfm['M']
-        rfm['RFM_Score'] = rfm[['R_Score', 'F_Score', 'M_Score']].sum(axis=1)
+        rfm['RFM_Score'] = r + f + m
         
-        # Define Actionable Customer Segments
-        def segment_customer(row):
-            score = row['RFM_Score']
-            r = int(row['R'])
-            f = int(row['F'])
-            m = int(row['M'])
-            
-            if score >= 11:
-                return 'Best Customers'
-            elif score >= 9:
-                return 'Loyal Customers'
-            elif f >= 4 and m >= 4:
-                return 'Big Spenders'
-            elif score >= 7:
-                return 'Potential Loyalists'
-            elif r <= 1:
-                return 'Lost Customers'
-            elif r <= 2:
-                return 'At Risk'
-            else:
-                return 'Recent Customers'
-
-        rfm['Customer_Segment'] = rfm.apply(segment_customer, axis=1)
+        # Define Actionable Customer Segments (rules are evaluated in order, first match wins)
+        score = rfm['RFM_Score']
+        conditions = [
+            score >= 11,
+            score >= 9,
+            (f >= 4) & (m >= 4),
+            score >= 7,
+            r <= 1,
+            r <= 2
+        ]
+        segments = [
+            'Best Customers',
+            'Loyal Customers',
+            'Big Spenders',
+            'Potential Loyalists',
+            'Lost Customers',
+            'At Risk'
+        ]
+        rfm['Customer_Segment'] = np.select(conditions, segments, default='Recent Customers')
         
         logger.info("RFM Segmentation complete.")
         return rfm
+
+class RFMState:
+    """
+    Running per-customer aggregates (last purchase, distinct invoices, spend, country).
+    Used for streaming runs and, persisted between runs, for CDC batches:
+    a batch is merged by touching only its own customers and invoice months,
+    and segments are rescored from the state without rescanning fact_sales.
+    """
+    def __init__(self):
+        self.customers = None
+        # Live lines per counted invoice, filed by invoice month: a batch only reads its own months
+        self.invoices = MonthlyPartitions(['CustomerID', 'InvoiceNo', 'InvoiceDate', 'lines'], 'InvoiceDate')
+
+    def update(self, df):
+        """Merges a processed chunk (with Total_GBP) into the running aggregates"""
+        if df.empty:
+            return
+
+        # Frequency counts distinct invoices, which can span chunk boundaries
+        pairs = invoice_lines(df)
+        months = self.invoices.months_of(pairs['InvoiceDate'])
+        counted = self.invoices.read(months)
+        is_new = pairs.merge(counted[['CustomerID', 'InvoiceNo']], how='left', indicator=True)['_merge'] == 'left_only'
+        new_invoices = pairs[is_new.to_numpy()].groupby('CustomerID').size()
+        merged = concat_rows([counted, pairs], self.invoices.columns).groupby(['CustomerID', 'InvoiceNo'], as_index=False).agg(
+            InvoiceDate=('InvoiceDate', 'max'), lines=('lines', 'sum')
+        )
+        self.invoices.replace(months, merged)
+
+        named_aggs = {'Last_Purchase': ('InvoiceDate', 'max'), 'Monetary': ('Total_GBP', 'sum')}
+        if 'Country' in df.columns:
+            named_aggs['Country'] = ('Country', 'last')
+        batch = df.groupby('CustomerID', observed=True).agg(**named_aggs)
+        batch['Frequency'] = new_invoices.reindex(batch.index, fill_value=0)
+        # Each batch has its own categories, so the running state holds plain values
+        batch = decode_categoricals(batch)
+        batch.index = decode_categoricals(batch.index)
+
+        if self.customers is None:
+            self.customers = batch
+            return
+
+        # Known customers are updated in place; new ones are appended
+        known = batch.index.isin(self.customers.index)
+        seen = batch[known]
+        current = self.customers.loc[seen.index]
+        self.customers.loc[seen.index, 'Last_Purchase'] = current['Last_Purchase'].where(
+            current['Last_Purchase'] >= seen['Last_Purchase'], seen['Last_Purchase']
+        )
+        self.customers.loc[seen.index, 'Frequency'] = current['Frequency'] + seen['Frequency']
+        self.customers.loc[seen.index, 'Monetary'] = current['Monetary'] + seen['Monetary']
+        if 'Country' in seen.columns:
+            self.customers.loc[seen.index, 'Country'] = seen['Country']
+
+        if not known.all():
+            self.customers = pd.concat([self.customers, batch[~known]])
+
+    def retract(self, df):
+        """
+        Takes removed lines (CDC DELETE events and UPDATE before images, with
+        Total_GBP) back out of the aggregates. An invoice stops counting once
+        its last line is gone, and a customer without invoices leaves the state.
+        """
+        if df.empty or self.customers is None:
+            return
+
+        pairs = invoice_lines(df)
+        months = self.invoices.months_of(pairs['InvoiceDate'])
+        counted = self.invoices.read(months)
+        removed = counted.merge(
+            pairs[['CustomerID', 'InvoiceNo', 'lines']], on=['CustomerID', 'InvoiceNo'], how='left', suffixes=('', '_removed')
+        )
+        left = (removed['lines'] - removed.pop('lines_removed').fillna(0)).astype('int64')
+        closed = removed[(left <= 0).to_numpy()]
+        self.invoices.replace(months, removed.assign(lines=left)[(left > 0).to_numpy()])
+
+        spend = df.groupby('CustomerID', observed=True)['Total_GBP'].sum()
+        spend.index = decode_categoricals(spend.index)
+        spend = spend[spend.index.isin(self.customers.index)]
+        self.customers.loc[spend.index, 'Monetary'] -= spend
+        closed_invoices = closed.groupby('CustomerID').size()
+        closed_invoices = closed_invoices[closed_invoices.index.isin(self.customers.index)]
+        self.customers.loc[closed_invoices.index, 'Frequency'] -= closed_invoices
+        self.customers = self.customers[self.customers['Frequency'] > 0]
+
+        # Customers whose last invoice was closed take it from the invoices left
+        latest = closed.groupby('CustomerID')['InvoiceDate'].max()
+        latest = latest[latest.index.isin(self.customers.index)]
+        stale = latest.index[(latest >= self.customers.loc[latest.index, 'Last_Purchase']).to_numpy()]
+        if len(stale):
+            self.customers.loc[stale, 'Last_Purchase'] = self._last_purchases(stale)
+
+    def _last_purchases(self, customers):
+        """Latest invoice date of each customer, scanning the saved months newest first until all are found"""
+        found = pd.Series(pd.NaT, index=customers, dtype=self.customers['Last_Purchase'].dtype)
+        newest = self.customers.loc[customers, 'Last_Purchase'].max().strftime('%Y-%m')
+        for month in reversed(self.invoices.stored_months()):
+            if month > newest:
+                continue
+            rows = self.invoices.read([month])
+            rows = rows[rows['CustomerID'].isin(found.index[found.isna()])]
+            found.update(rows.groupby('CustomerID')['InvoiceDate'].max())
+            if found.notna().all():
+                break
+        return found
+
+    def country_map(self):
+        if self.customers is None or 'Country' not in self.customers.columns:
+            return {}
+        return self.customers['Country'].dropna().to_dict()
+
+    def generate_segments(self):
+        """Scores the accumulated aggregates exactly like RFMSegmenter.generate_segments"""
+        customers = self.customers.sort_index()
+        snapshot_date = customers['Last_Purchase'].max() + pd.Timedelta(days=1)
+
+        rfm = pd.DataFrame({
+            'Recency': (snapshot_date - customers['Last_Purchase']).dt.days,
+            'Frequency': customers['Frequency'].astype(int),
+            'Monetary': customers['Monetary'].astype(float)
+        }).rename_axis('CustomerID').reset_index()
+        return RFMSegmenter.score(rfm)
+
+    def save(self, path):
+        """
+        Persists the aggregates under `path`; of the counted invoices, only the
+        months changed since the state was loaded are rewritten
+        """
+        if self.customers is None:
+            return
+        path = Path(path)
+        os.makedirs(path, exist_ok=True)
+        self.customers.rename_axis('CustomerID').reset_index().to_parquet(path / "customers.parquet", index=False)
+        self.invoices.save(path / "invoices")
+        logger.info(f"RFM state saved ({len(self.customers)} customers).")
+
+    @classmethod
+    def load(cls, path):
+        """Restores a state saved with `save`; returns an empty state if none exists"""
+        state = cls()
+        path = Path(path)
+        if not os.path.exists(path / "customers.parquet"):
+            return state
+
+        state.customers = pd.read_parquet(path / "customers.parquet").set_index('CustomerID')
+        # Counted invoices are read month by month as batches need them
+        state.invoices.path = path / "invoices"
+        logger.info(f"Loaded RFM state for {len(state.customers)} customers.")
+        return state
+
+def invoice_lines(df):
+    """Plain-valued (CustomerID, InvoiceNo, InvoiceDate, lines) of every invoice in a batch"""
+    return decode_categoricals(df.groupby(['CustomerID', 'InvoiceNo'], observed=True).agg(
+        InvoiceDate=('InvoiceDate', 'max'), lines=('InvoiceDate', 'size')
+    ).reset_index())
@@ -0,0 +1,97 @@
+import numpy as np
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty) over float values.
+    Level h holds items of weight 2**h; when the sketch outgrows its capacity,
+    the lowest overfull level is sorted and every other item is promoted.
+    Memory stays O(k) whatever the stream length, and the normalized rank error
+    is about 2.7 / k (k=200 -> ~1.3%). Sketches can be updated chunk by chunk,
+    merged across workers and saved between runs.
+    """
+    C = 2.0 / 3.0
+
+    def __init__(self, k=200, seed=0):
+        self.k = int(k)
+        self.n = 0
+        self.levels = [np.empty(0, dtype=float)]
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def for_error(cls, epsilon, seed=0):
+        """Sketch sized for an approximate normalized rank error `epsilon`"""
+        return cls(k=max(8, int(np.ceil(2.7 / epsilon))), seed=seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * self.C ** depth)))
+
+    def _compress(self):
+        while sum(len(items) for items in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, items in enumerate(self.levels):
+                if len(items) < self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=float))
+
+                items = np.sort(items)
+                # An odd item out stays at this level so total weight is preserved
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[:len(items) - len(keep)]
+                promoted = paired[self._rng.integers(2)::2]
+
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                break
+
+    def update(self, values):
+        """Adds an array of values (NaNs are ignored)"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Folds another sketch (e.g. from a parallel worker) into this one"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=float))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, qs):
+        """
+        Approximate quantiles for the probabilities `qs`.
+        While nothing has been compacted the sketch holds every value, and the
+        result is the exact (linearly interpolated) quantile.
+        """
+        if self.n == 0:
+            return np.full(len(np.atleast_1d(qs)), np.nan)
+        if all(len(items) == 0 for items in self.levels[1:]):
+            return np.quantile(self.levels[0], qs)
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values)
+        values, cum_weights = values[order], np.cumsum(weights[order])
+
+        ranks = np.atleast_1d(qs) * cum_weights[-1]
+        idx = np.searchsorted(cum_weights, ranks, side='left')
+        return values[np.clip(idx, 0, len(values) - 1)]
+
+    def save(self, path):
+        np.savez(path, *self.levels, k=self.k, n=self.n)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            sketch = cls(k=int(data['k']))
+            sketch.n = int(data['n'])
+            sketch.levels = [data[f'arr_{h}'] for h in range(len(data.files) - 2)]
+        return sketch
@@ -0,0 +1,269 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import duckdb
+from loguru import logger
+from config.settings import settings, BASE_DIR
+from src.warehouse.loader import (
+    FACT_COLUMNS, FACT_MERGE_COLUMNS, FACT_DELETE_SQL, ROLLUP_DELTA_SQL, ROLLUP_DELETE_DELTA_SQL, ROLLUP_APPLY_SQL,
+    ROLLUP_CLEANUP_SQL, ROLLUP_BACKFILL_CHECK_SQL, ROW_KEY_COLUMNS, ROW_KEY_CHECK_SQL, ROW_KEY_MIGRATION_SQL,
+    WATERMARK_BUMP_SQL, WATERMARK_SQL, LOAD_TOKEN_SQL, rollup_rebuild_sql, row_key_sql,
+    format_load_token, product_rows, batch_country_map, customer_rows, segment_rows, date_rows, fact_rows
+)
+
+SQL_DIR = BASE_DIR / "sql" / "duckdb"
+
+class DuckDBLoader:
+    """
+    Embedded, file-based DuckDB warehouse with the same star schema, loads and
+    views as WarehouseLoader. Batches are scanned straight from the pandas frames
+    (no CSV round trip) and merged with vectorized INSERT ... ON CONFLICT, and the
+    analytical queries run on DuckDB's columnar engine with no server to run.
+    A connection is opened per operation: DuckDB allows one writing process, so
+    the file is only locked while a load or query is in progress.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: Database file (default: DUCKDB_PATH)
+        """
+        self.path = Path(path or settings.DUCKDB_PATH)
+
+    @contextmanager
+    def connect(self, read_only=False):
+        if not read_only:
+            os.makedirs(self.path.parent, exist_ok=True)
+        conn = duckdb.connect(str(self.path), read_only=read_only)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Connection whose statements commit together, or roll back on error"""
+        with self.connect() as conn:
+            conn.begin()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def init_db(self):
+        """Create tables and views if they don't exist"""
+        logger.info(f"Initializing DuckDB Warehouse Schema at {self.path}...")
+        migrated = False
+        with self.transaction() as conn:
+            conn.execute((SQL_DIR / 'init_schema.sql').read_text())
+            # Warehouses created before fact rows carried their FX rate date get the column
+            conn.execute("ALTER TABLE fact_sales ADD COLUMN IF NOT EXISTS rate_date DATE")
+            # Warehouses created before row_key existed get the column, filled from their rows (one-time)
+            if not conn.execute(ROW_KEY_CHECK_SQL).fetchone()[0]:
+                logger.info("Adding row keys to existing fact_sales (one-time)...")
+                for statement in ROW_KEY_MIGRATION_SQL[:-1]:
+                    conn.execute(statement)
+                duplicates = conn.execute(ROW_KEY_MIGRATION_SQL[-1]).fetchone()[0]
+                if duplicates:
+                    logger.warning(f"Removed {duplicates} duplicate sales records left by earlier reloads.")
+                migrated = True
+            conn.execute((SQL_DIR / 'views.sql').read_text())
+            if conn.execute(ROLLUP_BACKFILL_CHECK_SQL).fetchone()[0]:
+                logger.info("Building rollup tables from existing fact_sales (one-time)...")
+                for statement in rollup_rebuild_sql():
+                    conn.execute(statement)
+        if migrated:
+            # DuckDB only indexes a table once the updates to it have committed
+            with self.transaction() as conn:
+                conn.execute("CREATE UNIQUE INDEX ux_fact_sales_row_key ON fact_sales (row_key)")
+
+    def _upsert(self, conn, df, table, key, update=True):
+        """
+        Inserts df into `table`; existing keys are updated where an attribute
+        differs (or left alone with update=False).
+        :param key: Conflict key column, or comma-separated columns of a composite key
+        :return: Number of rows inserted or updated
+        """
+        conn.register('stg_batch', df)
+        try:
+            return self._merge(conn, 'stg_batch', list(df.columns), table, key, update)
+        finally:
+            conn.unregister('stg_batch')
+
+    def _merge(self, conn, source, columns, table, key, update=True):
+        """`_upsert` of the rows of a staging table or registered frame `source`"""
+        start = time.perf_counter()
+        keys = [k.strip() for k in key.split(',')]
+        attributes = [col for col in columns if col not in keys]
+        if update and attributes:
+            assignments = ', '.join(f"{col} = EXCLUDED.{col}" for col in attributes)
+            changed = ' OR '.join(f"{table}.{col} IS DISTINCT FROM EXCLUDED.{col}" for col in attributes)
+            conflict = f"DO UPDATE SET {assignments} WHERE {changed}"
+        else:
+            conflict = "DO NOTHING"
+
+        column_list = ', '.join(columns)
+        rows = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+        written = conn.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {source} ON CONFLICT ({key}) {conflict}"
+        ).fetchone()[0]
+
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        logger.info(f"Merged {rows} rows into {table} in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s).")
+        return written
+
+    def _stage_facts(self, conn, df, table):
+        """
+        Copies fact rows into a temporary `table` typed like fact_sales and keys
+        them there with row_key_sql, as PostgreSQL does on its staging table
+        """
+        columns = [col for col in df.columns if col != 'country']
+        conn.execute(f"CREATE TEMP TABLE {table} AS SELECT row_key, {', '.join(columns)} FROM fact_sales LIMIT 0")
+        if 'country' in df.columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN country VARCHAR")
+        conn.register('stg_batch', df)
+        try:
+            conn.execute(f"INSERT INTO {table} ({', '.join(df.columns)}) SELECT {', '.join(df.columns)} FROM stg_batch")
+        finally:
+            conn.unregister('stg_batch')
+        conn.execute(f"UPDATE {table} SET row_key = {row_key_sql()}")
+
+    def load_dimensions(self, df, rfm_df=None, country_map=None, fx_rates=None):
+        """
+        Load DimProduct, DimCustomer, and DimDate dimension tables, and the batch's FX rates, in one transaction.
+        :param country_map: CustomerID -> Country for customers outside df (incremental RFM)
+        :param fx_rates: Rate table (rate_date, currency, rate) the batch was converted at
+        """
+        try:
+            with self.transaction() as conn:
+                logger.info("Populating Date Dimension...")
+                self._upsert(conn, date_rows(df['InvoiceDate']), 'dim_date', 'date_key', update=False)
+
+                logger.info("Syncing DimProduct...")
+                self._upsert(conn, product_rows(df), 'dim_product', 'product_key')
+
+                if rfm_df is not None:
+                    if country_map is None:
+                        country_map = batch_country_map(df)
+                    self._load_customers(conn, rfm_df, country_map)
+
+                if fx_rates is not None and not fx_rates.empty:
+                    logger.info("Syncing FX rates...")
+                    self._upsert(conn, fx_rates[['rate_date', 'currency', 'rate']], 'fx_rates', 'rate_date, currency')
+                conn.execute(WATERMARK_BUMP_SQL)
+        except Exception as e:
+            logger.error(f"Error loading dimensions: {e}")
+            raise
+
+    def load_customers(self, rfm_df, country_map):
+        """Refreshes DimCustomer on its own (streaming mode)"""
+        try:
+            with self.transaction() as conn:
+                self._load_customers(conn, rfm_df, country_map)
+                conn.execute(WATERMARK_BUMP_SQL)
+        except Exception as e:
+            logger.error(f"Error loading customers: {e}")
+            raise
+
+    def _replace(self, conn, df, table, key):
+        """
+        Leaves `table` holding exactly the rows of df. Same end state as the PostgreSQL
+        clear-and-reload; DuckDB checks keys eagerly, so deleting and re-inserting a
+        key in one transaction is avoided.
+        """
+        self._upsert(conn, df, table, key)
+        conn.register('current_keys', df[[key]])
+        try:
+            conn.execute(f"DELETE FROM {table} WHERE {key} NOT IN (SELECT {key} FROM current_keys)")
+        finally:
+            conn.unregister('current_keys')
+
+    def _load_customers(self, conn, rfm_df, country_map):
+        logger.info("Syncing DimCustomer with RFM profiles...")
+        customers_to_load = customer_rows(rfm_df, country_map)
+        self._replace(conn, customers_to_load, 'dim_customer', 'customer_key')
+        self._replace(conn, segment_rows(customers_to_load), 'agg_customer_segments', 'rfm_segment')
+        logger.info(f"Refreshed {len(customers_to_load)} customer profiles.")
+
+    def load_facts(self, df):
+        """
+        Load FactSales idempotently: the batch is merged on row_key with
+        INSERT ... ON CONFLICT, so reruns and retried batches only touch new or
+        changed rows.
+        """
+        logger.info("Loading FactSales...")
+        facts_db = fact_rows(df)
+        changed = ' OR '.join(f"f.{col} IS DISTINCT FROM s.{col}" for col in FACT_MERGE_COLUMNS)
+
+        with self.transaction() as conn:
+            self._stage_facts(conn, facts_db, 'stg_fact_sales')
+            # Counted before the merge: DuckDB's ON CONFLICT does not report inserts and updates apart
+            inserted, updated = conn.execute(f"""
+                SELECT COUNT(*) FILTER (WHERE f.row_key IS NULL),
+                       COUNT(*) FILTER (WHERE f.row_key IS NOT NULL AND ({changed}))
+                FROM stg_fact_sales s LEFT JOIN fact_sales f ON f.row_key = s.row_key
+            """).fetchone()
+            # Rollup deltas are read before the merge overwrites the stored values
+            conn.execute(ROLLUP_DELTA_SQL.format(on_commit=''))
+            self._merge(conn, 'stg_fact_sales', FACT_COLUMNS, 'fact_sales', 'row_key')
+            for statement in ROLLUP_APPLY_SQL:
+                conn.execute(statement.format(on_commit=''))
+            conn.execute("DROP TABLE stg_fact_sales; DROP TABLE stg_fact_delta; DROP TABLE stg_order_delta")
+            conn.execute(WATERMARK_BUMP_SQL)
+
+        logger.info(f"Merged {len(facts_db)} sales records: {inserted} inserted, "
+                    f"{updated} updated, {len(facts_db) - inserted - updated} unchanged.")
+
+    def delete_facts(self, df):
+        """
+        Deletes the sales lines of a processed batch (CDC DELETE events and
+        UPDATE before images) by row_key and takes them out of the rollups,
+        in one transaction.
+        :return: Number of rows deleted
+        """
+        logger.info("Deleting FactSales...")
+        keys = fact_rows(df)[ROW_KEY_COLUMNS]
+        with self.transaction() as conn:
+            self._stage_facts(conn, keys, 'stg_fact_keys')
+            conn.execute(ROLLUP_DELETE_DELTA_SQL.format(on_commit=''))
+            deleted = conn.execute(FACT_DELETE_SQL).fetchone()[0]
+            for statement in ROLLUP_APPLY_SQL + ROLLUP_CLEANUP_SQL:
+                conn.execute(statement.format(on_commit=''))
+            conn.execute("DROP TABLE stg_fact_keys; DROP TABLE stg_fact_delta; DROP TABLE stg_order_delta")
+            conn.execute(WATERMARK_BUMP_SQL)
+
+        logger.info(f"Deleted {deleted} of {len(keys)} sales records.")
+        return deleted
+
+    def load_watermark(self):
+        """Version of the warehouse contents: changes whenever a load commits (0 before the first)"""
+        with self.connect(read_only=True) as conn:
+            return conn.execute(WATERMARK_SQL).fetchone()[0]
+
+    def load_token(self):
+        """Identity of the warehouse contents, as WarehouseLoader.load_token (None for a missing file or schema)"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with self.connect(read_only=True) as conn:
+                return format_load_token(conn.execute(LOAD_TOKEN_SQL).fetchone())
+        except duckdb.CatalogException:
+            return None
+
+    def read_sql(self, query):
+        """Runs a query against the warehouse and returns the result as a DataFrame"""
+        with self.connect(read_only=True) as conn:
+            return conn.execute(query).df()
+
+    def record_run_metrics(self, runs_df):
+        """Appends per-stage run metrics (RunMetrics.to_frame) to pipeline_runs"""
+        runs_df = runs_df.astype({'batch': str}).replace({'batch': {'None': None}})
+        with self.transaction() as conn:
+            conn.execute((SQL_DIR / 'init_schema.sql').read_text())
+            conn.register('stg_runs', runs_df)
+            try:
+                columns = ', '.join(runs_df.columns)
+                conn.execute(f"INSERT INTO pipeline_runs ({columns}) SELECT {columns} FROM stg_runs")
+            finally:
+                conn.unregister('stg_runs')
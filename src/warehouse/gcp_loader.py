@@ -4,6 +4,8 @@ from loguru import logger
 import pandas as pd
 import os
 from config.settings import settings
+from src.transformation.cleaner import decode_categoricals
+from src.transformation.currency import with_currency_totals
 
 class GCPLoader:
     def __init__(self):
@@ -57,17 +59,23 @@ class GCPLoader:
             logger.error(f"Failed to upload to BigQuery: {e}")
             return False
 
-    def load_star_schema(self, fact_df, rfm_df=None):
-        """Orchestrates the cloud load"""
+    def load_star_schema(self, fact_df, rfm_df=None, fx_rates=None):
+        """
+        Orchestrates the cloud load
+        :param fx_rates: Rate table for facts whose currencies are computed on read;
+            BigQuery keeps its materialized total_* columns
+        """
         if self.bq_client is None: return
         
         # 1. Load Facts
-        fact_bq = fact_df.copy()
-        fact_bq.columns = [c.lower() for c in fact_bq.columns]
-        self.upload_to_bigquery(fact_bq, "fact_sales")
+        if fact_df is not None:
+            if 'Total_USD' not in fact_df.columns and fx_rates is not None:
+                fact_df = with_currency_totals(fact_df, fx_rates)
+            fact_df = fact_df.drop(columns='FX_Rate_Date', errors='ignore')
+            fact_bq = decode_categoricals(fact_df.rename(columns=str.lower))
+            self.upload_to_bigquery(fact_bq, "fact_sales")
         
         # 2. Load Customers
         if rfm_df is not None:
-            cust_bq = rfm_df.copy()
-            cust_bq.columns = [c.lower() for c in cust_bq.columns]
+            cust_bq = rfm_df.rename(columns=str.lower)
             self.upload_to_bigquery(cust_bq, "dim_customer", if_exists='replace')
@@ -0,0 +1,107 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+class DimensionKeyIndex:
+    """
+    Warm index of a dimension's business keys and a 64-bit hash of their attributes.
+    Warmed once per loader (from a persisted Parquet snapshot or a single table
+    scan) and maintained as batches are loaded, so each batch is split into new
+    and changed keys without re-reading the dimension table. Snapshots are
+    stamped with the warehouse's load token (a JSON sidecar) and only reused
+    while the warehouse has seen no load since.
+    """
+    def __init__(self, table, key, attributes=(), path=None):
+        """
+        :param table: Dimension table name
+        :param key: Business key column
+        :param attributes: Columns whose changes should be detected
+        :param path: Optional .parquet snapshot reused across runs
+        """
+        self.table = table
+        self.key = key
+        self.attributes = list(attributes)
+        self.path = Path(path) if path else None
+        self.hashes = None
+        self.dirty = False
+
+    def hash_attributes(self, df):
+        """Hashes the attribute columns of df, normalized so DB and pipeline values agree"""
+        if not self.attributes:
+            return np.zeros(len(df), dtype=np.uint64)
+        normalized = pd.DataFrame({
+            col: df[col].astype(float) if pd.api.types.is_numeric_dtype(df[col]) else df[col].fillna('').astype(str)
+            for col in self.attributes
+        })
+        return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+    @property
+    def token_path(self):
+        return self.path.with_suffix('.json')
+
+    def warm(self, engine, load_token=None):
+        """
+        Loads the index once; a persisted snapshot is trusted only if it was
+        stamped with the warehouse's current load token
+        :param load_token: Callable returning the warehouse's load token (loader.load_token)
+        """
+        if self.hashes is not None:
+            return
+
+        if self.path is not None and os.path.exists(self.path):
+            token = load_token() if load_token is not None else None
+            stored = None
+            if os.path.exists(self.token_path):
+                with open(self.token_path) as f:
+                    stored = json.load(f).get('token')
+            if token is not None and stored == token:
+                self.hashes = pd.read_parquet(self.path).set_index(self.key)['hash']
+                logger.info(f"Loaded {self.table} key index ({len(self.hashes)} keys).")
+                return
+            logger.warning(f"{self.table} key index was saved at warehouse state {stored}, not {token}; rebuilding.")
+
+        columns = ', '.join([self.key] + self.attributes)
+        existing = pd.read_sql(f"SELECT {columns} FROM {self.table}", engine)
+        self.hashes = pd.Series(self.hash_attributes(existing), index=existing[self.key], name='hash')
+        self.dirty = True
+        logger.info(f"Warmed {self.table} key index from the warehouse ({len(self.hashes)} keys).")
+
+    def diff(self, df):
+        """
+        Compares df (one row per key, dimension column names) with the index.
+        :return: (new-key mask, changed-attributes mask, attribute hashes of df)
+        """
+        hashes = self.hash_attributes(df)
+        # Positional lookup keeps the hashes uint64 (reindex would upcast them to float)
+        pos = self.hashes.index.get_indexer(df[self.key])
+        is_new = pos == -1
+        is_changed = np.zeros(len(df), dtype=bool)
+        is_changed[~is_new] = self.hashes.to_numpy()[pos[~is_new]] != hashes[~is_new]
+        return is_new, is_changed, hashes
+
+    def update(self, keys, hashes):
+        """Records keys written to the warehouse with their attribute hashes"""
+        batch = pd.Series(np.asarray(hashes, dtype=np.uint64), index=pd.Index(keys, name=self.key), name='hash')
+        self.hashes = pd.concat([self.hashes[~self.hashes.index.isin(batch.index)], batch])
+        self.dirty = True
+
+    def save(self, token):
+        """
+        Snapshots the index to `path` if it changed, and stamps it with `token` (atomic replaces)
+        :param token: Load token of the warehouse once the indexed rows have committed
+        """
+        if self.path is None or self.hashes is None:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        if self.dirty:
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            self.hashes.rename_axis(self.key).reset_index().to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        tmp_path = self.token_path.with_name(self.token_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({'token': token}, f)
+        os.replace(tmp_path, self.token_path)
@@ -1,118 +1,789 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from loguru import logger
-from config.settings import settings
-from src.warehouse.models import create_tables, DimCustomer, FactSales, DimProduct, DimDate
+from config.settings import settings, BASE_DIR
+from src.warehouse.models import (
+    create_tables, partitioned_fact_table, DimCustomer, FactSales, DimProduct, DimDate, PipelineRun
+)
+from src.warehouse.key_index import DimensionKeyIndex
+from src.transformation.cleaner import decode_categoricals
+from concurrent.futures import ThreadPoolExecutor
+import io
+import math
+import threading
+import time
 import pandas as pd
 import sqlalchemy
 
+SQL_DIR = BASE_DIR / "sql" / "postgresql"
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Process-wide SQLAlchemy engine. Every loader shares its connection pool
+    (DB_POOL_SIZE + DB_MAX_OVERFLOW connections), which also bounds how many
+    concurrent writes the load phase can issue.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            connection_string = f"postgresql+psycopg2://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
+            _engine = create_engine(
+                connection_string,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_pre_ping=True
+            )
+        return _engine
+
+def get_loader():
+    """Warehouse loader for the configured WAREHOUSE_BACKEND ('postgres' or 'duckdb')"""
+    if settings.WAREHOUSE_BACKEND == 'duckdb':
+        # Imported here so PostgreSQL deployments do not need duckdb installed
+        from src.warehouse.duckdb_loader import DuckDBLoader
+        return DuckDBLoader()
+    if settings.WAREHOUSE_BACKEND != 'postgres':
+        raise ValueError(f"Unknown warehouse backend '{settings.WAREHOUSE_BACKEND}', expected 'postgres' or 'duckdb'.")
+    return WarehouseLoader()
+
 class WarehouseLoader:
     def __init__(self):
-        connection_string = f"postgresql+psycopg2://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
-        self.engine = create_engine(connection_string)
+        self.engine = get_engine()
         self.session_factory = sessionmaker(bind=self.engine)
+        self._partitioned = None
+
+        # Warm key indexes: each batch is diffed in memory instead of re-reading the dimension
+        index_dir = settings.DIM_INDEX_PATH if settings.DIM_INDEX_ENABLED else None
+        self.product_index = DimensionKeyIndex(
+            'dim_product', 'product_key', ['description', 'unit_price_gbp'],
+            path=index_dir / "dim_product.parquet" if index_dir else None
+        )
+        self.date_index = DimensionKeyIndex(
+            'dim_date', 'date_key', path=index_dir / "dim_date.parquet" if index_dir else None
+        )
 
     def init_db(self):
-        """Create tables if they don't exist"""
+        """Create tables and views if they don't exist"""
         logger.info("Initializing Data Warehouse Schema...")
-        create_tables(self.engine)
+        create_tables(self.engine, partition_facts=settings.FACT_PARTITIONING)
+
+        with self.engine.begin() as conn:
+            # Warehouses created before fact rows carried their FX rate date get the column
+            conn.execute(sqlalchemy.text("ALTER TABLE fact_sales ADD COLUMN IF NOT EXISTS rate_date DATE"))
+            # Warehouses created before row_key existed get the column, filled from their rows (one-time)
+            if not conn.execute(sqlalchemy.text(ROW_KEY_CHECK_SQL)).scalar():
+                logger.info("Adding row keys to existing fact_sales (one-time)...")
+                for statement in ROW_KEY_MIGRATION_SQL[:-1]:
+                    conn.execute(sqlalchemy.text(statement))
+                duplicates = conn.execute(sqlalchemy.text(ROW_KEY_MIGRATION_SQL[-1])).rowcount
+                if duplicates:
+                    logger.warning(f"Removed {duplicates} duplicate sales records left by earlier reloads.")
+
+            if settings.FACT_PARTITIONING and not self._facts_partitioned(conn):
+                self._partition_fact_sales(conn)
+
+            if not self._facts_partitioned(conn):
+                # ... and the unique index the merge targets
+                conn.execute(sqlalchemy.text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_sales_row_key ON fact_sales (row_key)"
+                ))
+                # ... and the secondary indexes added since
+                for index in FactSales.__table__.indexes:
+                    index.create(conn, checkfirst=True)
 
-    def load_dimensions(self, df, rfm_df=None):
+            # Warehouses loaded before the rollups existed build them once from fact_sales
+            if conn.execute(sqlalchemy.text(ROLLUP_BACKFILL_CHECK_SQL)).scalar():
+                logger.info("Building rollup tables from existing fact_sales (one-time)...")
+                for statement in rollup_rebuild_sql():
+                    conn.execute(sqlalchemy.text(statement))
+
+            conn.execute(sqlalchemy.text((SQL_DIR / "views.sql").read_text()))
+
+    def _facts_partitioned(self, conn=None):
+        """Whether fact_sales is the monthly partitioned layout (cached once known)"""
+        if self._partitioned is None:
+            query = sqlalchemy.text("""
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+                    WHERE c.relname = 'fact_sales' AND pg_table_is_visible(c.oid)
+                )
+            """)
+            if conn is not None:
+                return conn.execute(query).scalar()
+            with self.engine.connect() as conn:
+                self._partitioned = conn.execute(query).scalar()
+        return self._partitioned
+
+    def _partition_fact_sales(self, conn):
         """
-        Load DimProduct, DimCustomer, and DimDate dimension tables.
+        One-time conversion of an existing single-table fact_sales into the
+        partitioned layout, in the caller's transaction. Views over fact_sales
+        are dropped with the old table and recreated from views.sql.
         """
-        session = self.session_factory()
+        logger.info("Converting fact_sales to monthly partitions (one-time)...")
+        for index in FactSales.__table__.indexes:
+            conn.execute(sqlalchemy.text(f"DROP INDEX IF EXISTS {index.name}"))
+        conn.execute(sqlalchemy.text("ALTER TABLE fact_sales RENAME TO fact_sales_unpartitioned"))
+        partitioned_fact_table().create(conn)
+
+        months = conn.execute(sqlalchemy.text(
+            "SELECT DISTINCT date_trunc('month', invoice_date) FROM fact_sales_unpartitioned WHERE invoice_date IS NOT NULL"
+        )).scalars().all()
+        self._create_fact_partitions(conn, months)
+        columns = ', '.join(['sales_id'] + FACT_COLUMNS)
+        moved = conn.execute(sqlalchemy.text(
+            f"INSERT INTO fact_sales ({columns}) SELECT {columns} FROM fact_sales_unpartitioned"
+        )).rowcount
+        conn.execute(sqlalchemy.text(
+            "SELECT setval(pg_get_serial_sequence('fact_sales', 'sales_id'), COALESCE(MAX(sales_id), 0) + 1, false) FROM fact_sales"
+        ))
+        conn.execute(sqlalchemy.text("DROP TABLE fact_sales_unpartitioned CASCADE"))
+        conn.execute(sqlalchemy.text((SQL_DIR / "views.sql").read_text()))
+        logger.info(f"Moved {moved} sales records into {len(months)} monthly partitions.")
+        self._partitioned = None
+
+    def _create_fact_partitions(self, conn, months):
+        """Creates the monthly partitions of fact_sales for the given month starts, if missing"""
+        for month in sorted(set(months)):
+            month = pd.Timestamp(month)
+            conn.execute(sqlalchemy.text(
+                f"CREATE TABLE IF NOT EXISTS {fact_partition_name(month)} PARTITION OF fact_sales "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{month + pd.DateOffset(months=1):%Y-%m-%d}')"
+            ))
+
+    def ensure_fact_partitions(self, dates):
+        """Creates the partitions a batch's invoice dates fall into (no-op for a single-table fact_sales)"""
+        if not self._facts_partitioned():
+            return
+        months = pd.to_datetime(pd.Series(dates)).dropna().dt.to_period('M').unique()
+        with self.engine.begin() as conn:
+            self._create_fact_partitions(conn, [month.to_timestamp() for month in months])
+
+    def detach_fact_partition(self, month):
+        """
+        Detaches one month of fact_sales. The partition stays behind as a
+        standalone table (named by fact_partition_name) to archive or drop, and
+        its dates are removed from the rollups.
+        :param month: Any date within the month
+        """
+        month = pd.Timestamp(month).to_period('M').to_timestamp()
+        name = fact_partition_name(month)
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text(f"ALTER TABLE fact_sales DETACH PARTITION {name}"))
+            self._refresh_rollups(conn, month)
+        self._record_load()
+        logger.info(f"Detached {name} from fact_sales.")
+
+    def attach_fact_partition(self, month, table=None):
+        """
+        Attaches a table holding one month of sales (by default a partition
+        detached earlier) and adds its dates back to the rollups.
+        :param month: Any date within the month
+        :param table: Table to attach (default: fact_partition_name(month))
+        """
+        month = pd.Timestamp(month).to_period('M').to_timestamp()
+        name = table or fact_partition_name(month)
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text(
+                f"ALTER TABLE fact_sales ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{month + pd.DateOffset(months=1):%Y-%m-%d}')"
+            ))
+            self._refresh_rollups(conn, month)
+        self._record_load()
+        logger.info(f"Attached {name} to fact_sales.")
+
+    def _refresh_rollups(self, conn, month):
+        end = month + pd.DateOffset(months=1)
+        for statement in rollup_rebuild_sql(f"{month:%Y-%m-%d}", f"{end:%Y-%m-%d}"):
+            conn.execute(sqlalchemy.text(statement))
+
+    def _bulk_insert(self, df, table, connection=None):
+        """
+        Appends df to `table`. With LOAD_METHOD='copy' on PostgreSQL the rows are
+        streamed with COPY FROM STDIN in LOAD_BATCH_SIZE batches; otherwise (or if
+        COPY fails outside a caller's transaction) DataFrame.to_sql is used.
+        :param connection: Optional SQLAlchemy connection whose transaction the insert joins
+        """
+        start = time.perf_counter()
+        method = 'to_sql'
+        if settings.LOAD_METHOD == 'copy' and self.engine.dialect.name == 'postgresql':
+            try:
+                self._copy_insert(df, table, connection)
+                method = 'COPY'
+            except Exception as e:
+                if connection is not None:
+                    raise
+                logger.warning(f"COPY into {table} failed ({e}), falling back to to_sql.")
+
+        if method == 'to_sql':
+            df.to_sql(table, connection if connection is not None else self.engine, if_exists='append', index=False)
+
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        logger.info(f"Wrote {len(df)} rows to {table} via {method} in {elapsed:.2f}s ({len(df) / elapsed:,.0f} rows/s).")
+
+    def _copy_insert(self, df, table, connection=None):
+        """COPY df into table as CSV, one buffer per batch"""
+        columns = ', '.join(df.columns)
+        copy_sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        batch_size = settings.LOAD_BATCH_SIZE
+
+        raw_conn = connection.connection.dbapi_connection if connection is not None else self.engine.raw_connection()
         try:
-            # 1. DimDate (populate for the range in the dataset)
-            self._load_dates(df['InvoiceDate'])
-
-            # 2. DimProduct
-            logger.info("Syncing DimProduct...")
-            products = df[['StockCode', 'Description', 'UnitPrice']].drop_duplicates(subset=['StockCode']).copy()
-            products.columns = ['product_key', 'description', 'unit_price_gbp']
-            
-            # Efficient check for new records only
-            existing_products = pd.read_sql("SELECT product_key FROM dim_product", self.engine)['product_key'].tolist()
-            new_products = products[~products['product_key'].isin(existing_products)]
-            
+            with raw_conn.cursor() as cursor:
+                for offset in range(0, len(df), batch_size):
+                    buffer = io.StringIO()
+                    df.iloc[offset:offset + batch_size].to_csv(buffer, index=False, header=False, na_rep='\\N')
+                    buffer.seek(0)
+                    cursor.copy_expert(copy_sql, buffer)
+            if connection is None:
+                raw_conn.commit()
+        except Exception:
+            if connection is None:
+                raw_conn.rollback()
+            raise
+        finally:
+            if connection is None:
+                raw_conn.close()
+
+    def load_dimensions(self, df, rfm_df=None, country_map=None, fx_rates=None):
+        """
+        Load DimProduct, DimCustomer, and DimDate dimension tables, and the batch's FX rates.
+        The tables are independent, so each is written concurrently over its own pooled connection.
+        :param country_map: CustomerID -> Country for customers outside df (incremental RFM)
+        :param fx_rates: Rate table (rate_date, currency, rate) the batch was converted at
+        """
+        # 1. DimDate (populate for the range in the dataset)
+        tasks = [(self._load_dates, df['InvoiceDate'])]
+
+        # 2. DimProduct
+        tasks.append((self._load_products, product_rows(df)))
+
+        # 3. DimCustomer
+        if rfm_df is not None:
+            if country_map is None:
+                country_map = batch_country_map(df)
+            tasks.append((self._refresh_customers, rfm_df, country_map))
+
+        # 4. FX rates
+        if fx_rates is not None and not fx_rates.empty:
+            tasks.append((self._load_fx_rates, fx_rates))
+
+        try:
+            self._run_concurrently(tasks)
+            self._record_load()
+        except Exception as e:
+            logger.error(f"Error loading dimensions: {e}")
+            raise
+
+    def _run_concurrently(self, tasks):
+        """Runs (callable, *args) tasks on up to LOAD_WORKERS threads and returns their results in order"""
+        workers = max(1, min(settings.LOAD_WORKERS, len(tasks)))
+        if workers == 1:
+            return [task[0](*task[1:]) for task in tasks]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(*task) for task in tasks]
+            return [future.result() for future in futures]
+
+    def _load_products(self, products):
+        """Inserts new product keys and updates products whose description or price changed"""
+        logger.info("Syncing DimProduct...")
+        self.product_index.warm(self.engine, self.load_token)
+        is_new, is_changed, hashes = self.product_index.diff(products)
+        new_products, changed_products = products[is_new], products[is_changed]
+        if new_products.empty and changed_products.empty:
+            return
+
+        with self.engine.begin() as conn:
             if not new_products.empty:
-                new_products.to_sql('dim_product', self.engine, if_exists='append', index=False)
-                logger.info(f"Inserted {len(new_products)} new products.")
-            
-            # 3. DimCustomer
-            if rfm_df is not None:
-                logger.info("Syncing DimCustomer with RFM profiles...")
-                country_map = df[['CustomerID', 'Country']].drop_duplicates().set_index('CustomerID')['Country'].to_dict()
-                
-                customers_to_load = pd.DataFrame({
-                    'customer_key': rfm_df['CustomerID'],
-                    'country': rfm_df['CustomerID'].map(country_map).fillna('Unknown'),
-                    'rfm_segment': rfm_df['Customer_Segment'],
-                    'rfm_score': rfm_df['RFM_Score'],
-                    'is_current': True,
-                    'valid_from': pd.Timestamp.now()
-                })
-                
-                # For a PFE project, we'll clear and reload customers to ensure latest RFM is there
-                session.execute(sqlalchemy.text("DELETE FROM dim_customer"))
-                customers_to_load.to_sql('dim_customer', self.engine, if_exists='append', index=False)
-                logger.info(f"Refreshed {len(customers_to_load)} customer profiles.")
+                self._bulk_insert(new_products, 'dim_product', connection=conn)
+            if not changed_products.empty:
+                self._update_rows(conn, changed_products, 'dim_product', 'product_key')
 
+        # The index only records what has been committed (and is saved once the load is recorded)
+        written = is_new | is_changed
+        self.product_index.update(products['product_key'][written], hashes[written])
+        logger.info(f"Inserted {len(new_products)} new products, updated {len(changed_products)} changed products.")
+
+    def _load_fx_rates(self, fx_rates):
+        """Upserts the rates by (rate_date, currency); stored rates that differ are replaced"""
+        logger.info("Syncing FX rates...")
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text(
+                "CREATE TEMP TABLE stg_fx_rates ON COMMIT DROP AS SELECT rate_date, currency, rate FROM fx_rates WITH NO DATA"
+            ))
+            self._bulk_insert(fx_rates[['rate_date', 'currency', 'rate']], 'stg_fx_rates', connection=conn)
+            written = conn.execute(sqlalchemy.text("""
+                INSERT INTO fx_rates (rate_date, currency, rate)
+                SELECT rate_date, currency, rate FROM stg_fx_rates
+                ON CONFLICT (rate_date, currency) DO UPDATE SET rate = EXCLUDED.rate
+                WHERE fx_rates.rate IS DISTINCT FROM EXCLUDED.rate
+            """)).rowcount
+        logger.info(f"Stored {written} new or changed FX rates.")
+
+    def _update_rows(self, connection, df, table, key):
+        """Applies changed dimension attributes: COPY into a staging table, then one UPDATE ... FROM"""
+        staging = f"stg_{table}"
+        connection.execute(sqlalchemy.text(
+            f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {', '.join(df.columns)} FROM {table} WITH NO DATA"
+        ))
+        self._bulk_insert(df, staging, connection=connection)
+        assignments = ', '.join(f"{col} = s.{col}" for col in df.columns if col != key)
+        connection.execute(sqlalchemy.text(
+            f"UPDATE {table} t SET {assignments} FROM {staging} s WHERE t.{key} = s.{key}"
+        ))
+
+    def load_customers(self, rfm_df, country_map):
+        """
+        Refreshes DimCustomer on its own, for runs where RFM is only known
+        after every batch has been processed (streaming mode).
+        """
+        self._refresh_customers(rfm_df, country_map)
+        self._record_load()
+
+    def _refresh_customers(self, rfm_df, country_map):
+        session = self.session_factory()
+        try:
+            self._load_customers(session, rfm_df, country_map)
             session.commit()
         except Exception as e:
             session.rollback()
-            logger.error(f"Error loading dimensions: {e}")
+            logger.error(f"Error loading customers: {e}")
             raise
         finally:
             session.close()
 
+    def _load_customers(self, session, rfm_df, country_map):
+        logger.info("Syncing DimCustomer with RFM profiles...")
+        customers_to_load = customer_rows(rfm_df, country_map)
+
+        # For a PFE project, we'll clear and reload customers to ensure latest RFM is there.
+        # The insert goes through the session's connection: a separate connection would
+        # block on the rows this uncommitted DELETE has locked.
+        session.execute(sqlalchemy.text("DELETE FROM dim_customer"))
+        self._bulk_insert(customers_to_load, 'dim_customer', connection=session.connection())
+
+        # The segment rollup is rebuilt from the same frame, as DimCustomer is reloaded in full
+        session.execute(sqlalchemy.text("DELETE FROM agg_customer_segments"))
+        self._bulk_insert(segment_rows(customers_to_load), 'agg_customer_segments', connection=session.connection())
+        logger.info(f"Refreshed {len(customers_to_load)} customer profiles.")
+
     def _load_dates(self, date_col):
         """Populates the dim_date table based on range of dates in dataframe"""
         logger.info("Populating Date Dimension...")
-        # Ensure column is datetime
-        date_col = pd.to_datetime(date_col)
-        min_date = date_col.min().date()
-        max_date = date_col.max().date()
-        
-        date_range = pd.date_range(min_date, max_date)
-        date_df = pd.DataFrame({'full_date': date_range})
-        
-        date_df['date_key'] = date_df['full_date'].dt.strftime('%Y%m%d').astype(int)
-        date_df['day_name'] = date_df['full_date'].dt.day_name()
-        date_df['month_name'] = date_df['full_date'].dt.month_name()
-        date_df['month'] = date_df['full_date'].dt.month
-        date_df['quarter'] = date_df['full_date'].dt.quarter
-        date_df['year'] = date_df['full_date'].dt.year
-        date_df['is_weekend'] = date_df['full_date'].dt.dayofweek >= 5
-        
-        # Upsert logic for dates
-        existing_dates = pd.read_sql("SELECT date_key FROM dim_date", self.engine)['date_key'].tolist()
-        new_dates = date_df[~date_df['date_key'].isin(existing_dates)]
+        date_df = date_rows(date_col)
+
+        # Only days the key index has not seen are inserted; date attributes never change
+        self.date_index.warm(self.engine, self.load_token)
+        is_new, _, hashes = self.date_index.diff(date_df)
+        new_dates = date_df[is_new]
         
         if not new_dates.empty:
-            new_dates.to_sql('dim_date', self.engine, if_exists='append', index=False)
+            self._bulk_insert(new_dates, 'dim_date')
+            self.date_index.update(new_dates['date_key'], hashes[is_new])
             logger.info(f"Inserted {len(new_dates)} days into dim_date.")
 
+    def delete_facts(self, df):
+        """
+        Deletes the sales lines of a processed batch (CDC DELETE events and
+        UPDATE before images) by row_key and takes them out of the rollups,
+        in one transaction.
+        :return: Number of rows deleted
+        """
+        logger.info("Deleting FactSales...")
+        keys = fact_rows(df)[ROW_KEY_COLUMNS]
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text(
+                f"CREATE TEMP TABLE stg_fact_keys ON COMMIT DROP AS "
+                f"SELECT row_key, {', '.join(ROW_KEY_COLUMNS)} FROM fact_sales WITH NO DATA"
+            ))
+            self._bulk_insert(keys, 'stg_fact_keys', connection=conn)
+            conn.execute(sqlalchemy.text(f"UPDATE stg_fact_keys SET row_key = {row_key_sql()}"))
+            conn.execute(sqlalchemy.text(ROLLUP_DELETE_DELTA_SQL.format(on_commit='ON COMMIT DROP')))
+            deleted = conn.execute(sqlalchemy.text(FACT_DELETE_SQL)).rowcount
+            for statement in ROLLUP_APPLY_SQL + ROLLUP_CLEANUP_SQL:
+                conn.execute(sqlalchemy.text(statement.format(on_commit='ON COMMIT DROP')))
+        self._record_load()
+
+        logger.info(f"Deleted {deleted} of {len(keys)} sales records.")
+        return deleted
+
+    def _record_load(self):
+        """
+        Bumps the load watermark once a load has committed, and stamps the warm
+        key indexes with the new load token (read in the same statement, so a
+        concurrent load cannot slip in between)
+        """
+        with self.engine.begin() as conn:
+            token = format_load_token(conn.execute(sqlalchemy.text(WATERMARK_BUMP_SQL + " RETURNING version, loaded_at")).first())
+        for index in (self.product_index, self.date_index):
+            index.save(token)
+
+    def load_watermark(self):
+        """Version of the warehouse contents: changes whenever a load commits (0 before the first)"""
+        with self.engine.connect() as conn:
+            return conn.execute(sqlalchemy.text(WATERMARK_SQL)).scalar()
+
+    def load_token(self):
+        """
+        Identity of the warehouse contents ("version@loaded_at" of the last load),
+        or None for a warehouse with no loads or no schema. Local state derived
+        from loaded rows is stamped with it and dropped when it no longer matches.
+        """
+        try:
+            with self.engine.connect() as conn:
+                return format_load_token(conn.execute(sqlalchemy.text(LOAD_TOKEN_SQL)).first())
+        except sqlalchemy.exc.ProgrammingError:
+            return None
+
+    def read_sql(self, query):
+        """Runs a query against the warehouse and returns the result as a DataFrame"""
+        return pd.read_sql(query, self.engine)
+
+    def record_run_metrics(self, runs_df):
+        """Appends per-stage run metrics (RunMetrics.to_frame) to pipeline_runs"""
+        PipelineRun.__table__.create(self.engine, checkfirst=True)
+        runs_df = runs_df.astype({'batch': str}).replace({'batch': {'None': None}})
+        self._bulk_insert(runs_df, 'pipeline_runs')
+
     def load_facts(self, df):
-        """Load FactSales"""
+        """
+        Load FactSales idempotently: the batch is copied into a temporary staging
+        table and merged on row_key with INSERT ... ON CONFLICT, so reruns and
+        retried batches only touch new or changed rows. Large batches are merged
+        as concurrent partitions, each committed on its own; a failed load is
+        therefore repaired by simply rerunning it.
+        """
         logger.info("Loading FactSales...")
-        # Prepare DataFrame
-        facts = df.copy()
-        
-        # Mapping columns to DB schema
-        facts_db = pd.DataFrame()
-        facts_db['invoice_no'] = facts['InvoiceNo']
-        facts_db['invoice_date'] = facts['InvoiceDate']
-        facts_db['customer_key'] = facts['CustomerID']
-        facts_db['product_key'] = facts['StockCode']
-        facts_db['quantity'] = facts['Quantity']
-        facts_db['unit_price'] = facts['UnitPrice']
-        facts_db['total_gbp'] = facts['Total_GBP']
-        facts_db['total_usd'] = facts['Total_USD']
-        facts_db['total_eur'] = facts['Total_EUR']
-        facts_db['total_mad'] = facts['Total_MAD']
-        facts_db['is_fraud_suspect'] = facts.get('Is_Fraud_Suspect', False)
-        
-        # Bulk load
-        facts_db.to_sql('fact_sales', self.engine, if_exists='append', index=False)
-        logger.info(f"Loaded {len(facts_db)} sales records.")
+        facts_db = fact_rows(df)
+        # Rows are routed to their month by PostgreSQL; the partitions just have to exist
+        self.ensure_fact_partitions(facts_db['invoice_date'])
+
+        # Partitions are split by invoice (part of row_key), so concurrent merges never
+        # touch the same key and each order's rollup delta is applied by one partition
+        partitions = min(settings.LOAD_WORKERS, math.ceil(len(facts_db) / FACT_PARTITION_MIN_ROWS))
+        if partitions > 1:
+            bucket = pd.util.hash_pandas_object(facts_db['invoice_no'], index=False) % partitions
+            tasks = [(self._merge_facts, part) for _, part in facts_db.groupby(bucket, sort=False)]
+        else:
+            tasks = [(self._merge_facts, facts_db)]
+        results = self._run_concurrently(tasks)
+
+        self._record_load()
+
+        inserted = sum(r[0] for r in results)
+        updated = sum(r[1] for r in results)
+        logger.info(f"Merged {len(facts_db)} sales records in {len(tasks)} partition(s): {inserted} inserted, "
+                    f"{updated} updated, {len(facts_db) - inserted - updated} unchanged.")
+
+    def _merge_facts(self, facts_db):
+        """
+        Merges one partition through its own staging table and transaction, and
+        applies the partition's deltas to the rollup tables in the same transaction.
+        :return: (inserted, updated) row counts
+        """
+        columns = ', '.join(FACT_COLUMNS)
+        # A partitioned fact_sales can only enforce row_key unique per invoice_date
+        merge_key = 'row_key, invoice_date' if self._facts_partitioned() else 'row_key'
+        updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in FACT_MERGE_COLUMNS)
+        changed = ' OR '.join(f"fact_sales.{col} IS DISTINCT FROM EXCLUDED.{col}" for col in FACT_MERGE_COLUMNS)
+
+        with self.engine.begin() as conn:
+            # Staging table shares the fact columns but not the sales_id sequence,
+            # plus the attributes only the rollups need
+            conn.execute(sqlalchemy.text(
+                f"CREATE TEMP TABLE stg_fact_sales ON COMMIT DROP AS SELECT {columns} FROM fact_sales WITH NO DATA"
+            ))
+            conn.execute(sqlalchemy.text("ALTER TABLE stg_fact_sales ADD COLUMN country VARCHAR(100)"))
+            self._bulk_insert(facts_db, 'stg_fact_sales', connection=conn)
+            # Keyed once the rows have the types they are stored with
+            conn.execute(sqlalchemy.text(f"UPDATE stg_fact_sales SET row_key = {row_key_sql()}"))
+
+            # Deltas are read before the merge overwrites the stored values
+            conn.execute(sqlalchemy.text(ROLLUP_DELTA_SQL.format(on_commit='ON COMMIT DROP')))
+
+            # The delta holds every new line, which splits inserts from updates (xmax = 0
+            # would too, but system columns cannot be returned from a partitioned table)
+            inserted = conn.execute(sqlalchemy.text("SELECT COALESCE(SUM(line_count), 0) FROM stg_fact_delta")).scalar()
+            merged = conn.execute(sqlalchemy.text(f"""
+                INSERT INTO fact_sales ({columns})
+                SELECT DISTINCT ON (row_key) {columns} FROM stg_fact_sales ORDER BY row_key
+                ON CONFLICT ({merge_key}) DO UPDATE SET {updates}
+                WHERE {changed}
+            """)).rowcount
+
+            # Applied last, so the rollup row locks are held only until the commit
+            for statement in ROLLUP_APPLY_SQL:
+                conn.execute(sqlalchemy.text(statement.format(on_commit='ON COMMIT DROP')))
+
+        return inserted, merged - inserted
+
+# Smallest fact partition worth its own connection
+FACT_PARTITION_MIN_ROWS = 10_000
+
+# Columns of fact_sales written by the loaders (fact_rows adds `country` for the rollups)
+FACT_COLUMNS = [
+    'row_key', 'invoice_no', 'invoice_date', 'customer_key', 'product_key', 'quantity', 'unit_price',
+    'total_gbp', 'total_usd', 'total_eur', 'total_mad', 'rate_date', 'is_fraud_suspect'
+]
+
+# Attributes a rerun may legitimately change for an existing row_key (quantity and price are part of it)
+FACT_MERGE_COLUMNS = [
+    'total_gbp', 'total_usd', 'total_eur', 'total_mad', 'rate_date', 'is_fraud_suspect'
+]
+
+# Attributes of a sales line its row_key is derived from (see row_key_sql)
+ROW_KEY_COLUMNS = ['invoice_no', 'product_key', 'customer_key', 'invoice_date', 'quantity', 'unit_price']
+
+def row_key_sql():
+    """
+    SQL expression of a fact_sales row's row_key: MD5 of invoice, product,
+    customer, timestamp, quantity and unit price as the database renders them.
+    Every attribute belongs to the line itself, so the key is the same whichever
+    batch the line arrives in (lines identical in all of these are dropped as
+    duplicates by the cleaner). Loads evaluate it on their staging table, once
+    the rows have the stored column types, so incoming and stored rows key alike.
+    """
+    parts = ', '.join(f"COALESCE(CAST({col} AS VARCHAR), '')" for col in ROW_KEY_COLUMNS)
+    return f"md5(concat_ws('|', {parts}))"
+
+ROW_KEY_CHECK_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'fact_sales' AND column_name = 'row_key'
+    )
+"""
+
+# Keys the rows of a fact_sales created before row_key; the earlier loads appended on
+# every rerun, so only the first copy of each line is kept (the last statement)
+ROW_KEY_MIGRATION_SQL = [
+    "ALTER TABLE fact_sales ADD COLUMN row_key VARCHAR(32)",
+    f"UPDATE fact_sales SET row_key = {row_key_sql()}",
+    """
+    DELETE FROM fact_sales WHERE sales_id IN (
+        SELECT sales_id FROM (
+            SELECT sales_id, ROW_NUMBER() OVER (PARTITION BY row_key ORDER BY sales_id) AS copy_number
+            FROM fact_sales
+        ) copies WHERE copy_number > 1
+    )
+    """
+]
+
+FACT_DELETE_SQL = """
+    DELETE FROM fact_sales USING stg_fact_keys k
+    WHERE fact_sales.row_key = k.row_key AND fact_sales.invoice_date = k.invoice_date
+"""
+
+# Rollup maintenance, shared by both backends. A batch's delta is read from its
+# staging table before the merge: new lines add their values, changed lines add the
+# difference to the stored value, unchanged lines add nothing (idempotent reruns).
+ROLLUP_DELTA_SQL = """
+    CREATE TEMP TABLE stg_fact_delta {on_commit} AS
+    SELECT s.invoice_no, s.invoice_date, s.customer_key, COALESCE(s.country, 'Unknown') AS country,
+           COALESCE(s.total_gbp, 0) - COALESCE(f.total_gbp, 0) AS revenue_gbp,
+           CASE WHEN f.row_key IS NULL THEN 1 ELSE 0 END AS line_count
+    FROM (SELECT DISTINCT ON (row_key) * FROM stg_fact_sales ORDER BY row_key) s
+    LEFT JOIN fact_sales f ON f.row_key = s.row_key AND f.invoice_date = s.invoice_date
+    WHERE f.row_key IS NULL OR f.total_gbp IS DISTINCT FROM s.total_gbp
+"""
+
+# Deleted lines (CDC DELETE events, keys staged in stg_fact_keys) leave the rollups with
+# the opposite delta; they are counted in their order's country, as they were added
+ROLLUP_DELETE_DELTA_SQL = """
+    CREATE TEMP TABLE stg_fact_delta {on_commit} AS
+    SELECT f.invoice_no, f.invoice_date, f.customer_key, COALESCE(o.country, 'Unknown') AS country,
+           -COALESCE(f.total_gbp, 0) AS revenue_gbp, -1 AS line_count
+    FROM fact_sales f
+    JOIN (SELECT DISTINCT row_key, invoice_date FROM stg_fact_keys) k
+        ON f.row_key = k.row_key AND f.invoice_date = k.invoice_date
+    LEFT JOIN agg_orders o ON o.invoice_no = f.invoice_no
+"""
+
+# An order counts once: when its first line is loaded, until its last line is deleted.
+# Rows are written in key order so concurrent partitions lock shared rollup rows in
+# the same order (no deadlocks)
+ROLLUP_APPLY_SQL = [
+    """
+    CREATE TEMP TABLE stg_order_delta {on_commit} AS
+    SELECT d.invoice_no, MIN(d.invoice_date) AS invoice_date, MIN(d.customer_key) AS customer_key,
+           MIN(d.country) AS country, SUM(d.revenue_gbp) AS total_gbp, SUM(d.line_count) AS line_count,
+           CASE WHEN o.invoice_no IS NULL THEN 1
+                WHEN MIN(o.line_count) + SUM(d.line_count) <= 0 THEN -1
+                ELSE 0 END AS order_count
+    FROM stg_fact_delta d
+    LEFT JOIN agg_orders o ON o.invoice_no = d.invoice_no
+    GROUP BY d.invoice_no, o.invoice_no
+    """,
+    """
+    INSERT INTO agg_daily_sales (sale_date, country, revenue_gbp, line_count, order_count)
+    SELECT CAST(invoice_date AS DATE), country, SUM(total_gbp), SUM(line_count), SUM(order_count)
+    FROM stg_order_delta
+    GROUP BY CAST(invoice_date AS DATE), country
+    ORDER BY 1, 2
+    ON CONFLICT (sale_date, country) DO UPDATE SET
+        revenue_gbp = agg_daily_sales.revenue_gbp + EXCLUDED.revenue_gbp,
+        line_count = agg_daily_sales.line_count + EXCLUDED.line_count,
+        order_count = agg_daily_sales.order_count + EXCLUDED.order_count
+    """,
+    """
+    INSERT INTO agg_orders (invoice_no, invoice_date, customer_key, country, total_gbp, line_count)
+    SELECT invoice_no, invoice_date, customer_key, country, total_gbp, line_count
+    FROM stg_order_delta
+    ORDER BY invoice_no
+    ON CONFLICT (invoice_no) DO UPDATE SET
+        total_gbp = agg_orders.total_gbp + EXCLUDED.total_gbp,
+        line_count = agg_orders.line_count + EXCLUDED.line_count
+    """
+]
+
+# After deletes: orders and days left without lines are removed
+ROLLUP_CLEANUP_SQL = [
+    "DELETE FROM agg_orders WHERE invoice_no IN (SELECT invoice_no FROM stg_order_delta WHERE order_count < 0)",
+    "DELETE FROM agg_daily_sales WHERE line_count <= 0"
+]
+
+ROLLUP_BACKFILL_CHECK_SQL = """
+    SELECT EXISTS (SELECT 1 FROM fact_sales) AND NOT EXISTS (SELECT 1 FROM agg_orders)
+"""
+
+def rollup_rebuild_sql(start=None, end=None):
+    """
+    Statements rebuilding the rollups from the warehouse, in full or only for the
+    invoice dates in [start, end) (an attached or detached fact partition).
+    Countries come from DimCustomer as fact_sales has none.
+    """
+    if start is None:
+        days = dates = fact_dates = 'TRUE'
+    else:
+        days = f"sale_date >= '{start}' AND sale_date < '{end}'"
+        dates = f"invoice_date >= '{start}' AND invoice_date < '{end}'"
+        fact_dates = f"f.invoice_date >= '{start}' AND f.invoice_date < '{end}'"
+    statements = [
+        f"DELETE FROM agg_daily_sales WHERE {days}",
+        f"DELETE FROM agg_orders WHERE {dates}",
+        f"""
+        INSERT INTO agg_orders (invoice_no, invoice_date, customer_key, country, total_gbp, line_count)
+        SELECT f.invoice_no, MIN(f.invoice_date), MIN(f.customer_key), COALESCE(MIN(c.country), 'Unknown'),
+               SUM(f.total_gbp), COUNT(*)
+        FROM fact_sales f
+        LEFT JOIN dim_customer c ON c.customer_key = f.customer_key
+        WHERE {fact_dates}
+        GROUP BY f.invoice_no
+        """,
+        f"""
+        INSERT INTO agg_daily_sales (sale_date, country, revenue_gbp, line_count, order_count)
+        SELECT CAST(f.invoice_date AS DATE), o.country, SUM(f.total_gbp), COUNT(*), COUNT(DISTINCT f.invoice_no)
+        FROM fact_sales f
+        JOIN agg_orders o ON o.invoice_no = f.invoice_no
+        WHERE {fact_dates}
+        GROUP BY CAST(f.invoice_date AS DATE), o.country
+        """
+    ]
+    if start is None:
+        statements += [
+            "DELETE FROM agg_customer_segments",
+            """
+            INSERT INTO agg_customer_segments (rfm_segment, customer_count)
+            SELECT rfm_segment, COUNT(*) FROM dim_customer WHERE rfm_segment IS NOT NULL GROUP BY rfm_segment
+            """
+        ]
+    return statements
+
+WATERMARK_BUMP_SQL = """
+    INSERT INTO load_watermark (id, version, loaded_at) VALUES (1, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (id) DO UPDATE SET version = load_watermark.version + 1, loaded_at = EXCLUDED.loaded_at
+"""
+
+WATERMARK_SQL = "SELECT COALESCE(MAX(version), 0) FROM load_watermark"
+
+LOAD_TOKEN_SQL = "SELECT version, loaded_at FROM load_watermark WHERE id = 1"
+
+def format_load_token(row):
+    """Load token of a (version, loaded_at) watermark row; None without one"""
+    if row is None:
+        return None
+    version, loaded_at = row
+    return f"{version}@{pd.Timestamp(loaded_at).isoformat()}"
+
+def product_rows(df):
+    """
+    DimProduct rows from a processed batch: the first description seen for each
+    StockCode and its modal UnitPrice (ties go to the price invoiced last). Lines
+    of one product vary in price, so the first line's price would differ from batch
+    to batch; the modal price only moves when the product is really repriced.
+    """
+    products = decode_categoricals(df[['StockCode', 'Description']].drop_duplicates(subset=['StockCode']))
+    prices = decode_categoricals(df[['StockCode', 'UnitPrice', 'InvoiceDate']]).groupby(
+        ['StockCode', 'UnitPrice'], sort=False, observed=True
+    )['InvoiceDate'].agg(['size', 'max']).reset_index()
+    prices = prices.sort_values(['size', 'max'], ascending=False).drop_duplicates(subset=['StockCode'])
+    products = products.merge(prices[['StockCode', 'UnitPrice']], on='StockCode', how='left')
+    products.columns = ['product_key', 'description', 'unit_price_gbp']
+    return products
+
+def batch_country_map(df):
+    """CustomerID -> Country for the customers of a batch"""
+    return df[['CustomerID', 'Country']].drop_duplicates().set_index('CustomerID')['Country'].to_dict()
+
+def customer_rows(rfm_df, country_map):
+    """DimCustomer rows from RFM segments"""
+    return pd.DataFrame({
+        'customer_key': rfm_df['CustomerID'],
+        'country': rfm_df['CustomerID'].map(country_map).fillna('Unknown'),
+        'rfm_segment': rfm_df['Customer_Segment'],
+        'rfm_score': rfm_df['RFM_Score'],
+        'is_current': True,
+        'valid_from': pd.Timestamp.now()
+    })
+
+def segment_rows(customers):
+    """agg_customer_segments rows from DimCustomer rows"""
+    return customers.groupby('rfm_segment').size().rename('customer_count').reset_index()
+
+def date_rows(date_col):
+    """DimDate rows for every day between the first and last date of date_col"""
+    # Ensure column is datetime
+    date_col = pd.to_datetime(date_col)
+    min_date = date_col.min().date()
+    max_date = date_col.max().date()
+
+    date_range = pd.date_range(min_date, max_date)
+    date_df = pd.DataFrame({'full_date': date_range})
+
+    date_df['date_key'] = date_df['full_date'].dt.strftime('%Y%m%d').astype(int)
+    date_df['day_name'] = date_df['full_date'].dt.day_name()
+    date_df['month_name'] = date_df['full_date'].dt.month_name()
+    date_df['month'] = date_df['full_date'].dt.month
+    date_df['quarter'] = date_df['full_date'].dt.quarter
+    date_df['year'] = date_df['full_date'].dt.year
+    date_df['is_weekend'] = date_df['full_date'].dt.dayofweek >= 5
+    return date_df
+
+def fact_rows(df):
+    """
+    FactSales rows (FACT_COLUMNS but row_key, plus the rollups' `country`) for a
+    processed batch; row_key is computed by the database (row_key_sql).
+    The input is only read; this is the one frame built for the load.
+    """
+    facts_db = pd.DataFrame(index=df.index)
+    facts_db['invoice_no'] = df['InvoiceNo']
+    facts_db['invoice_date'] = df['InvoiceDate']
+    facts_db['customer_key'] = df['CustomerID']
+    facts_db['product_key'] = df['StockCode']
+    facts_db['quantity'] = df['Quantity']
+    facts_db['unit_price'] = df['UnitPrice']
+    facts_db['total_gbp'] = df['Total_GBP']
+    # Only GBP is stored when the other currencies are computed on read
+    facts_db['total_usd'] = df['Total_USD'] if 'Total_USD' in df.columns else None
+    facts_db['total_eur'] = df['Total_EUR'] if 'Total_EUR' in df.columns else None
+    facts_db['total_mad'] = df['Total_MAD'] if 'Total_MAD' in df.columns else None
+    facts_db['rate_date'] = df['FX_Rate_Date'] if 'FX_Rate_Date' in df.columns else None
+    facts_db['is_fraud_suspect'] = df.get('Is_Fraud_Suspect', False)
+    # Not a fact_sales column: only the rollups are kept by country
+    facts_db['country'] = df['Country'] if 'Country' in df.columns else 'Unknown'
+    return facts_db
+
+def fact_partition_name(month):
+    """Name of the fact_sales partition holding `month` (e.g. fact_sales_201012)"""
+    return f"fact_sales_{pd.Timestamp(month):%Y%m}"
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, MetaData, Date, Boolean
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Float, DateTime, MetaData, Date, Boolean, Index, Table, text
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -32,7 +32,18 @@ class DimProduct(Base):
 
 class FactSales(Base):
     __tablename__ = 'fact_sales'
+    __table_args__ = (
+        Index('ux_fact_sales_row_key', 'row_key', unique=True),
+        # Loads arrive in roughly ascending invoice_date order, which suits a tiny BRIN index;
+        # B-trees serve the dimension joins, order lookups and the fraud report
+        Index('ix_fact_sales_invoice_date', 'invoice_date', postgresql_using='brin'),
+        Index('ix_fact_sales_customer_key', 'customer_key'),
+        Index('ix_fact_sales_product_key', 'product_key'),
+        Index('ix_fact_sales_invoice_no', 'invoice_no'),
+        Index('ix_fact_sales_fraud', 'invoice_date', postgresql_where=text('is_fraud_suspect')),
+    )
     sales_id = Column(Integer, primary_key=True, autoincrement=True)
+    row_key = Column(String(32)) # MD5 natural key, merge target for idempotent reloads
     invoice_no = Column(String(50))
     invoice_date = Column(DateTime)
     customer_key = Column(String(50)) # FK
@@ -43,7 +54,89 @@ class FactSales(Base):
     total_usd = Column(Float)
     total_eur = Column(Float)
     total_mad = Column(Float)
+    rate_date = Column(Date)  # key into fx_rates; with CURRENCY_MODE=on_read the total_* besides GBP stay NULL
     is_fraud_suspect = Column(Boolean)
 
-def create_tables(engine):
-    Base.metadata.create_all(engine)
+# Rollups maintained by every fact load from the batch's deltas, so dashboards never scan fact_sales
+class AggDailySales(Base):
+    __tablename__ = 'agg_daily_sales'
+    sale_date = Column(Date, primary_key=True)
+    country = Column(String(100), primary_key=True)
+    revenue_gbp = Column(Float)
+    line_count = Column(Integer)
+    order_count = Column(Integer)
+
+class AggOrder(Base):
+    __tablename__ = 'agg_orders'
+    invoice_no = Column(String(50), primary_key=True)
+    invoice_date = Column(DateTime)
+    customer_key = Column(String(50))
+    country = Column(String(100))
+    total_gbp = Column(Float)
+    line_count = Column(Integer)
+
+class AggCustomerSegment(Base):
+    __tablename__ = 'agg_customer_segments'
+    rfm_segment = Column(String(50), primary_key=True)
+    customer_count = Column(Integer)
+
+class LoadWatermark(Base):
+    """Single row bumped by every warehouse load; readers key their caches on `version`"""
+    __tablename__ = 'load_watermark'
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger)
+    loaded_at = Column(DateTime)
+
+class FXRate(Base):
+    """Rates the facts were converted at (units per 1 GBP); v_fact_sales_fx converts on read with them"""
+    __tablename__ = 'fx_rates'
+    rate_date = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    rate = Column(Float)
+
+class PipelineRun(Base):
+    __tablename__ = 'pipeline_runs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String(32))
+    step = Column(String(20))
+    stage = Column(String(50))
+    batch = Column(String(50))
+    status = Column(String(20))
+    started_at = Column(DateTime)
+    wall_s = Column(Float)
+    cpu_s = Column(Float)
+    rows_in = Column(Integer)
+    rows_out = Column(Integer)
+    rows_per_s = Column(Float)
+    peak_mem_mb = Column(Float)
+
+def partitioned_fact_table(metadata=None):
+    """
+    FactSales as a declarative range-partitioned table, one partition per month of
+    invoice_date (PostgreSQL). Unique keys must include the partition key, so the
+    primary key and the row_key merge target gain invoice_date; row_key already
+    hashes the timestamp, so uniqueness is unchanged.
+    """
+    source = FactSales.__table__
+    columns = [
+        Column(c.name, c.type, primary_key=c.name in ('sales_id', 'invoice_date'), autoincrement=c.name == 'sales_id')
+        for c in source.columns
+    ]
+    indexes = [
+        Index(i.name, *[c.name for c in i.columns], **i.dialect_kwargs) for i in source.indexes if not i.unique
+    ]
+    return Table(
+        source.name, metadata or MetaData(), *columns,
+        Index('ux_fact_sales_row_key', 'row_key', 'invoice_date', unique=True), *indexes,
+        postgresql_partition_by='RANGE (invoice_date)'
+    )
+
+def create_tables(engine, partition_facts=False):
+    """
+    :param partition_facts: Create fact_sales partitioned by month (see partitioned_fact_table)
+    """
+    if not partition_facts:
+        Base.metadata.create_all(engine)
+        return
+    Base.metadata.create_all(engine, tables=[t for t in Base.metadata.sorted_tables if t is not FactSales.__table__])
+    partitioned_fact_table().create(engine, checkfirst=True)
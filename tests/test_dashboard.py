@@ -0,0 +1,40 @@
+import pytest
+from dashboards.data_access import DashboardData, DASHBOARD_QUERIES
+
+def test_dashboard_cache_follows_load_watermark(tmp_path):
+    pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+
+    df = DataCleaner(generate_online_retail(2_000, seed=4)).clean()
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    assert loader.load_token() is None
+    loader.init_db()
+    assert loader.load_watermark() == 0 and loader.load_token() is None
+    loader.load_facts(df.iloc[:1_000])
+    token = loader.load_token()
+    assert token.startswith('1@')
+
+    queries = []
+    read_sql = loader.read_sql
+    loader.read_sql = lambda sql: queries.append(sql) or read_sql(sql)
+    data = DashboardData(loader, workers=3)
+
+    first = data.fetch()
+    assert len(queries) == len(DASHBOARD_QUERIES)
+    assert first['total_sales'].iloc[0, 0] == pytest.approx(df['Total_GBP'].iloc[:1_000].sum())
+
+    # Served from the cache until a load moves the watermark
+    data.fetch()
+    assert len(queries) == len(DASHBOARD_QUERIES)
+
+    loader.load_facts(df.iloc[1_000:])
+    assert loader.load_token() not in (None, token)
+    refreshed = data.fetch()
+    assert len(queries) == 2 * len(DASHBOARD_QUERIES)
+    facts = read_sql("SELECT SUM(total_gbp) FROM fact_sales")
+    assert refreshed['total_sales'].iloc[0, 0] == pytest.approx(facts.iloc[0, 0])
+    assert refreshed['total_sales'].iloc[0, 0] > first['total_sales'].iloc[0, 0]
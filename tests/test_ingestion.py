@@ -0,0 +1,301 @@
+import os
+import pytest
+import pandas as pd
+from src.ingestion.raw_cache import RawFileCache
+
+@pytest.fixture
+def raw_csv(tmp_path):
+    path = tmp_path / "sales.csv"
+    pd.DataFrame({
+        'InvoiceNo': ['536365', 'C536379'],
+        'Quantity': [6, -1],
+        'UnitPrice': [2.55, 27.5]
+    }).to_csv(path, index=False)
+    return path
+
+def test_raw_cache_reuses_parquet(raw_csv, tmp_path):
+    cache = RawFileCache(tmp_path / "cache")
+    first = cache.read(raw_csv, pd.read_csv)
+
+    def fail_reader(path):
+        raise AssertionError("Source should not be re-parsed on a cache hit")
+
+    # Touching the file moves the mtime but not the content
+    os.utime(raw_csv, None)
+    second = cache.read(raw_csv, fail_reader)
+    pd.testing.assert_frame_equal(first, second)
+
+def test_raw_cache_rebuilds_changed_file(raw_csv, tmp_path):
+    cache = RawFileCache(tmp_path / "cache")
+    cache.read(raw_csv, pd.read_csv)
+
+    pd.DataFrame({'InvoiceNo': ['1'], 'Quantity': [1], 'UnitPrice': [1.0]}).to_csv(raw_csv, index=False)
+    assert not cache.is_fresh(raw_csv)
+    assert len(cache.read(raw_csv, pd.read_csv)) == 1
+
+def test_cached_and_uncached_reads_match(tmp_path, monkeypatch):
+    from config.settings import settings
+    from src.ingestion.csv_loader import CSVLoader
+
+    monkeypatch.setattr(settings, 'RAW_DATA_PATH', tmp_path / "raw")
+    monkeypatch.setattr(settings, 'RAW_CACHE_PATH', tmp_path / "cache")
+    path = tmp_path / "sales.xlsx"
+    # Excel yields an object column mixing ints and strings
+    pd.DataFrame({
+        'InvoiceNo': [536365, 'C536379', None],
+        'Quantity': [6, -1, 2],
+        'InvoiceDate': pd.to_datetime(['2010-12-01 08:26', '2010-12-01 09:41', '2010-12-01 10:03'])
+    }).to_excel(path, index=False)
+
+    cached = CSVLoader()._read_path(str(path))
+    monkeypatch.setattr(settings, 'RAW_CACHE_ENABLED', False)
+    uncached = CSVLoader()._read_path(str(path))
+    pd.testing.assert_frame_equal(cached, uncached)
+    assert cached['InvoiceNo'].tolist()[:2] == ['536365', 'C536379']
+
+def test_parallel_ingestion_matches_serial(tmp_path, monkeypatch):
+    from config.settings import settings
+    from src.ingestion.csv_loader import CSVLoader
+
+    monkeypatch.setattr(settings, 'RAW_DATA_PATH', tmp_path / "raw")
+    monkeypatch.setattr(settings, 'RAW_CACHE_PATH', tmp_path / "cache")
+    landing = tmp_path / "landing"
+    landing.mkdir()
+    for day in range(3):
+        pd.DataFrame({'InvoiceNo': [f'{day}-{i}' for i in range(5)], 'Quantity': range(5)}).to_csv(landing / f"drop_{day}.csv", index=False)
+
+    serial = pd.concat(CSVLoader(workers=1)._load_from_dir(landing), ignore_index=True)
+    parallel = pd.concat(CSVLoader(workers=2)._load_from_dir(landing), ignore_index=True)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+def test_hash_index_drops_rows_loaded_by_previous_runs(tmp_path):
+    from src.ingestion.hash_index import RowHashIndex
+    from src.transformation.cleaner import DataCleaner
+
+    batch = pd.DataFrame({
+        'InvoiceNo': ['1', '1', '2'],
+        'StockCode': ['A', 'A', 'B'],
+        'Quantity': [1, 1, 2],
+        'UnitPrice': [2.0, 2.0, 3.0],
+        'InvoiceDate': ['2023-01-01', '2023-01-01', '2023-01-02'],
+        'CustomerID': [100.0, 100.0, 101.0]
+    })
+    index = RowHashIndex(tmp_path / "row_hashes.npy")
+    cleaner = DataCleaner(batch, hash_index=index)
+    assert len(cleaner.clean()) == 2
+    assert cleaner.new_rows.all()
+
+    index.add(cleaner.row_hashes)
+    index.save()
+
+    rerun = DataCleaner(batch, hash_index=RowHashIndex(tmp_path / "row_hashes.npy"))
+    rerun.clean()
+    assert not rerun.new_rows.any()
+
+    # An index saved for one warehouse state is not trusted by another (e.g. a reset database)
+    index.save(token='3@2023-01-02T00:00:00')
+    assert len(RowHashIndex(tmp_path / "row_hashes.npy", token='3@2023-01-02T00:00:00').hashes) == 2
+    assert len(RowHashIndex(tmp_path / "row_hashes.npy", token=None).hashes) == 0
+
+def test_rows_are_hashed_once_from_load_to_clean(tmp_path, monkeypatch):
+    from config.settings import settings
+    from src.ingestion.csv_loader import CSVLoader
+    from src.ingestion.hash_index import RowHashIndex
+    from src.transformation.cleaner import DataCleaner
+
+    monkeypatch.setattr(settings, 'RAW_DATA_PATH', tmp_path / "raw")
+    monkeypatch.setattr(settings, 'RAW_CACHE_ENABLED', False)
+    line = {'InvoiceNo': '1', 'StockCode': 'A', 'Quantity': 1, 'UnitPrice': 2.0,
+            'InvoiceDate': '2023-01-01', 'CustomerID': 100.0}
+    loader = CSVLoader(workers=1)
+    loader.extra_path = str(tmp_path / "none")
+    # The same line sent twice, once with padding the cleaner strips
+    pd.DataFrame([line]).to_csv(settings.RAW_DATA_PATH / "a.csv", index=False)
+    pd.DataFrame([{**line, 'StockCode': ' A '}]).to_csv(settings.RAW_DATA_PATH / "b.csv", index=False)
+
+    calls = []
+    hash_rows = RowHashIndex.hash_rows
+    monkeypatch.setattr(RowHashIndex, 'hash_rows', staticmethod(lambda df: calls.append(len(df)) or hash_rows(df)))
+    raw = loader.load_all_files()
+    assert len(raw) == 2
+    assert len(DataCleaner(raw, hash_index=RowHashIndex()).clean()) == 1
+    assert calls == [2]
+
+def test_unreachable_warehouse_exits_before_processing(monkeypatch):
+    import main
+    from config.settings import settings
+
+    class Unreachable:
+        def load_token(self):
+            raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(settings, 'DEDUP_INDEX_ENABLED', True)
+    monkeypatch.setattr(main, 'get_loader', Unreachable)
+    batch = pd.DataFrame({'InvoiceNo': ['1'], 'InvoiceDate': ['2023-01-01']})
+    with pytest.raises(SystemExit):
+        main.process_data(batch, None)
+    with pytest.raises(SystemExit):
+        main.process_stream(iter([batch]), None)
+
+def test_partitioned_row_index_spills_months_between_batches(tmp_path):
+    from src.ingestion.hash_index import PartitionedRowIndex
+
+    index = PartitionedRowIndex(tmp_path / "row_hashes")
+    dates = pd.to_datetime(['2011-01-05', '2011-01-20', '2011-02-01'])
+    assert index.add([1, 2, 3], dates).all()
+    index.save()
+    assert index.partitions.frames == {}
+
+    # Repeats are found in the months read back from disk
+    later = pd.to_datetime(['2011-02-01', '2011-03-01', '2011-01-05'])
+    assert index.add([3, 5, 1], later).tolist() == [False, True, False]
+    index.save()
+    assert sorted(f.stem for f in (tmp_path / "row_hashes").glob('*.parquet')) == ['2011-01', '2011-02', '2011-03']
+
+def test_synthetic_generator_is_deterministic_and_realistic():
+    from src.ingestion.synthetic import generate_online_retail
+
+    df = generate_online_retail(20_000, seed=7)
+    pd.testing.assert_frame_equal(df, generate_online_retail(20_000, seed=7))
+    assert not df.equals(generate_online_retail(20_000, seed=8))
+
+    assert len(df) == 20_000
+    assert list(df.columns) == ['InvoiceNo', 'StockCode', 'Description', 'Quantity',
+                                'InvoiceDate', 'UnitPrice', 'CustomerID', 'Country']
+    # Returns are 'C' invoices with negative quantities
+    returns = df['InvoiceNo'].str.startswith('C')
+    assert 0 < returns.mean() < 0.05
+    assert (df.loc[returns, 'Quantity'] < 0).all() and (df.loc[~returns, 'Quantity'] > 0).all()
+    assert 0.15 < df['CustomerID'].isna().mean() < 0.35
+    assert df.duplicated().any()
+    # Skew: the UK dominates and the top customers account for far more than their share
+    assert (df['Country'] == 'United Kingdom').mean() > 0.8
+    top_share = df['CustomerID'].value_counts(normalize=True).head(5).sum()
+    assert top_share > 5 * 5 / df['CustomerID'].nunique()
+
+def test_watermarks_extract_only_new_rows(tmp_path):
+    from src.ingestion.watermark import SourceWatermarks
+
+    path = tmp_path / "sales.csv"
+    path.write_text(
+        "InvoiceNo,InvoiceDate,Quantity\n"
+        "1,2011-01-01 10:00,1\n"
+        "2,2011-01-02 10:00,2\n"
+    )
+    marks_path = tmp_path / "state" / "watermarks.json"
+    watermarks = SourceWatermarks(marks_path)
+    df, marks = watermarks.extract(str(path), pd.read_csv)
+    assert list(df['InvoiceNo']) == [1, 2]
+    watermarks.update(marks)
+    watermarks.save()
+
+    # Unchanged and touched files yield nothing; a line still being written waits for the next run
+    watermarks = SourceWatermarks(marks_path)
+    assert watermarks.extract(str(path), pd.read_csv) == (None, {})
+    with open(path, "a") as f:
+        f.write("3,2011-01-03 10:00,3\n4,2011-01-0")
+    df, marks = watermarks.extract(str(path), pd.read_csv)
+    assert list(df['InvoiceNo']) == [3]
+    watermarks.update(marks)
+    with open(path, "a") as f:
+        f.write("4 10:00,4\n")
+    df, marks = watermarks.extract(str(path), pd.read_csv)
+    assert list(df['InvoiceNo']) == [4]
+    watermarks.update(marks)
+
+    # A rewritten file is re-read past its latest InvoiceDate; at that instant only
+    # rows not extracted before are kept (6 is new, 4 was read from the appended bytes)
+    path.write_text(
+        "InvoiceNo,InvoiceDate,Quantity\n"
+        "2,2011-01-02 10:00,2\n"
+        "4,2011-01-04 10:00,4\n"
+        "6,2011-01-04 10:00,6\n"
+        "5,2011-01-05 10:00,5\n"
+    )
+    df, marks = watermarks.extract(str(path), pd.read_csv)
+    assert list(df['InvoiceNo']) == [6, 5]
+    assert marks[str(path)]['max_invoice_date'] == '2011-01-05T10:00:00'
+    assert len(marks[str(path)]['boundary_rows']) == 1
+
+def test_cdc_simulator_splits_chronologically():
+    from src.ingestion.cdc_simulator import CDCSimulator
+
+    df = pd.DataFrame({'InvoiceDate': pd.date_range('2011-01-01', periods=10)[::-1], 'val': range(10)})
+    cdc = CDCSimulator(df)
+    initial, incremental = cdc.get_initial_load(), cdc.get_incremental_load()
+    assert len(initial) == 8 and len(incremental) == 2
+    assert initial['InvoiceDate'].max() < incremental['InvoiceDate'].min()
+
+def test_cdc_replay_mixes_updates_and_deletes():
+    from src.ingestion.cdc_simulator import CDCSimulator
+    from src.ingestion.synthetic import generate_online_retail
+
+    raw = generate_online_retail(5_000, seed=3)
+    batches = list(CDCSimulator(raw).replay(5, update_rate=0.1, delete_rate=0.05, seed=1))
+    assert len(batches) == 5
+
+    events = pd.concat(batches, ignore_index=True)
+    inserts = events[events['cdc_operation'] == 'INSERT']
+    assert len(inserts) == len(raw)
+    assert (batches[0]['cdc_operation'] == 'INSERT').all()
+    assert (events['cdc_operation'] == 'UPDATE').any() and (events['cdc_operation'] == 'DELETE').any()
+
+    # Each line is deleted at most once and never changed after its DELETE
+    key = events['InvoiceNo'].astype(str) + '|' + events['StockCode'].astype(str)
+    deleted = set()
+    for batch in batches:
+        batch_key = batch['InvoiceNo'].astype(str) + '|' + batch['StockCode'].astype(str)
+        changes = batch_key[batch['cdc_operation'] != 'INSERT']
+        assert not deleted & set(changes)
+        deleted |= set(batch_key[batch['cdc_operation'] == 'DELETE'])
+    assert key[events['cdc_operation'] == 'DELETE'].is_unique
+
+    # Before images and deletes carry the price the line was last emitted with
+    last_price = {}
+    for batch in batches:
+        batch_key = batch['InvoiceNo'].astype(str) + '|' + batch['StockCode'].astype(str)
+        for line, op, price in zip(batch_key, batch['cdc_operation'], batch['UnitPrice']):
+            if op in ('UPDATE_BEFORE', 'DELETE'):
+                assert price == last_price[line]
+            last_price[line] = price
+
+    # A snapshot comes first, as plain inserts, ahead of the micro-batches
+    replayed = list(CDCSimulator(raw).replay(5, snapshot_ratio=0.5, seed=1))
+    assert len(replayed) == 6
+    assert len(replayed[0]) == len(raw) // 2 and (replayed[0]['cdc_operation'] == 'INSERT').all()
+
+def test_fx_rate_store_fills_gaps_and_persists(tmp_path, monkeypatch):
+    from config.settings import settings
+    from src.ingestion.fx_api import FXFetcher
+    from src.ingestion.fx_history import FXRateStore
+
+    monkeypatch.setattr(settings, 'FX_HISTORY_PATH', tmp_path / "fx.parquet")
+    monkeypatch.setattr(settings, 'EXCHANGE_RATE_API_KEY', 'demo_key')
+    monkeypatch.setattr(settings, 'TARGET_CURRENCIES', ['USD', 'EUR'])
+    store = FXRateStore(settings.FX_HISTORY_PATH)
+    store.add(pd.DataFrame({'date': ['2011-01-05'], 'USD': [1.55], 'EUR': [1.18]}))
+    store.save()
+
+    history = FXFetcher().get_rate_history('2011-01-01', '2011-01-10')
+    assert history['date'].tolist() == list(pd.date_range('2011-01-01', '2011-01-10'))
+    assert history.loc[history['date'] == '2011-01-05', 'USD'].item() == 1.55
+    # Mock rates are a function of the date, so refetching gives the same history
+    assert FXFetcher().get_rate_history('2011-01-01', '2011-01-10').equals(history)
+    # ...and they are never stored
+    assert len(FXRateStore(settings.FX_HISTORY_PATH).missing_dates('2011-01-01', '2011-01-10')) == 9
+
+    # With a key, fetched days are stored; a day the API fails on keeps no rates
+    monkeypatch.setattr(settings, 'EXCHANGE_RATE_API_KEY', 'key')
+    monkeypatch.setattr(FXFetcher, '_fetch_history_day', lambda self, day: None if day.day == 7 else
+                        {'date': day, 'USD': 1.5, 'EUR': 1.1})
+    history = FXFetcher().get_rate_history('2011-01-01', '2011-01-10')
+    assert history['date'].tolist() == list(pd.date_range('2011-01-01', '2011-01-10'))
+    assert history.loc[history['date'] == '2011-01-07', ['USD', 'EUR']].isna().all(axis=None)
+    assert history.loc[history['date'] == '2011-01-05', 'USD'].item() == 1.55
+
+    stored = FXRateStore(settings.FX_HISTORY_PATH)
+    assert stored.missing_dates('2011-01-01', '2011-01-10').tolist() == [pd.Timestamp('2011-01-07')]
+    # A currency added later is missing for every stored date
+    assert len(FXRateStore(settings.FX_HISTORY_PATH, ['USD', 'MAD']).missing_dates('2011-01-01', '2011-01-10')) == 10
+    # Ranges start at the last rate on or before their first day
+    assert stored.between('2011-01-12', '2011-01-20')['date'].tolist() == [pd.Timestamp('2011-01-10')]
@@ -0,0 +1,36 @@
+import json
+import pytest
+import pandas as pd
+from src.monitoring.metrics import RunMetrics
+
+def test_stage_records_rows_and_timing():
+    metrics = RunMetrics('full')
+    with metrics.stage('load', batch='initial', rows_in=100):
+        with metrics.stage('load_facts', batch='initial', rows_in=100) as stage:
+            stage.rows_out = 80
+
+    inner, outer = metrics.stages
+    assert (inner.name, outer.name) == ('load_facts', 'load')
+    assert inner.to_dict()['rows_per_s'] > 0
+    assert outer.wall_s >= inner.wall_s
+    assert inner.cpu_s >= 0 and inner.peak_mem_mb >= 0
+
+def test_failed_stage_is_recorded():
+    metrics = RunMetrics('full')
+    with pytest.raises(ValueError):
+        with metrics.stage('clean', rows_in=10):
+            raise ValueError("bad batch")
+    assert metrics.stages[0].status == 'failed'
+
+def test_run_report_and_chunk_iteration(tmp_path):
+    metrics = RunMetrics('full')
+    chunks = [pd.DataFrame({'a': range(3)}), pd.DataFrame({'a': range(2)})]
+    for chunk in metrics.timed_iter('ingest', chunks):
+        with metrics.stage('clean', rows_in=len(chunk)) as stage:
+            stage.rows_out = len(chunk)
+
+    report = json.loads(metrics.save(tmp_path).read_text())
+    summary = {row['stage']: row for row in report['summary']}
+    assert summary['ingest']['calls'] == 2 and summary['ingest']['rows_out'] == 5
+    assert summary['clean']['rows_in'] == 5
+    assert len(metrics.to_frame()) == len(report['stages']) == 4
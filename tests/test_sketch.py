@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from src.transformation.sketch import KLLSketch
+
+@pytest.fixture
+def values():
+    return np.random.default_rng(42).lognormal(2.0, 1.0, 200_000)
+
+def test_sketch_is_exact_before_compaction():
+    data = np.array([5.0, 1.0, 3.0, 2.0, 4.0])
+    sketch = KLLSketch(k=200).update(data)
+    assert sketch.quantile([0.25, 0.75]) == pytest.approx(np.quantile(data, [0.25, 0.75]))
+
+def test_sketch_rank_error_within_bound(values):
+    sketch = KLLSketch(k=200)
+    for chunk in np.array_split(values, 13):
+        sketch.update(chunk)
+
+    for q, estimate in zip([0.25, 0.5, 0.75], sketch.quantile([0.25, 0.5, 0.75])):
+        assert abs((values < estimate).mean() - q) < 0.02
+    assert sum(len(level) for level in sketch.levels) < 2_000
+
+def test_sketch_merge_and_roundtrip(values, tmp_path):
+    left = KLLSketch(k=200).update(values[:100_000])
+    right = KLLSketch(k=200).update(values[100_000:])
+    merged = left.merge(right)
+    assert merged.n == len(values)
+
+    merged.save(tmp_path / "sketch.npz")
+    restored = KLLSketch.load(tmp_path / "sketch.npz")
+    assert restored.n == merged.n
+    np.testing.assert_array_equal(restored.quantile([0.25, 0.75]), merged.quantile([0.25, 0.75]))
+    for q, estimate in zip([0.25, 0.75], restored.quantile([0.25, 0.75])):
+        assert abs((values < estimate).mean() - q) < 0.02
@@ -23,6 +23,18 @@ def test_cleaner_removes_negative_quantity(sample_data):
     assert (cleaned['Quantity'] > 0).all()
     assert len(cleaned) == 2  # Should drop the negative one
 
+def test_cleaner_encodes_categoricals(sample_data):
+    sample_data['StockCode'] = [' a', 'A ', 'b']
+    sample_data['Quantity'] = [10, 5, 20]
+    cleaned = DataCleaner(sample_data).clean()
+
+    for col in ['InvoiceNo', 'StockCode', 'Description', 'Country', 'CustomerID']:
+        assert isinstance(cleaned[col].dtype, pd.CategoricalDtype)
+    # Normalized variants of one value share a category
+    assert list(cleaned['StockCode'].cat.categories) == ['A', 'B']
+    assert cleaned['StockCode'].tolist() == ['A', 'A', 'B']
+    assert cleaned['CustomerID'].tolist() == ['100', '100', '101']
+
 def test_currency_conversion(sample_data):
     # Use pre-cleaned data for this test
     df = sample_data[sample_data['Quantity'] > 0].copy()
@@ -36,6 +48,58 @@ def test_currency_conversion(sample_data):
     assert row1['Total_GBP'] == pytest.approx(100.0)
     assert row1['Total_USD'] == pytest.approx(150.0)  # 100 * 1.5
 
+def test_currency_conversion_uses_invoice_date_rates():
+    df = pd.DataFrame({
+        'Quantity': [1, 2, 1, 4],
+        'UnitPrice': [10.0, 10.0, 10.0, 10.0],
+        'InvoiceDate': pd.to_datetime(['2011-01-09 15:00', '2010-12-31 09:00', '2011-01-03 08:00', '2011-01-10 00:00'])
+    }, index=[7, 3, 9, 1])
+    # No rates on the weekend of 8-9 January
+    history = pd.DataFrame({
+        'date': pd.to_datetime(['2011-01-03', '2011-01-07', '2011-01-10']),
+        'USD': [1.5, 1.6, 1.7],
+        'EUR': [1.1, 1.2, 1.3]
+    })
+
+    result = CurrencyTransformer(df, history).transform()
+    assert result.index.tolist() == [7, 3, 9, 1]
+    # Friday's rate for Sunday, the first rate before the history starts
+    assert result['Total_USD'].tolist() == pytest.approx([16.0, 30.0, 15.0, 68.0])
+    assert result['Total_EUR'].tolist() == pytest.approx([12.0, 22.0, 11.0, 52.0])
+
+    # A day the rate history could not be fetched for leaves its lines unconverted, failing DQ
+    from src.quality.checks import QualityChecks
+    history.loc[2, ['USD', 'EUR']] = None
+    result = CurrencyTransformer(df, history).transform()
+    assert result['Total_USD'].isna().tolist() == [False, False, False, True]
+    checked = result.assign(InvoiceNo=['1', '2', '3', '4'], StockCode='A', CustomerID='7')
+    assert not QualityChecks(checked).run_checks()
+
+def test_currency_on_read_matches_materialized():
+    from src.transformation.currency import with_currency_totals
+    from src.quality.checks import QualityChecks
+
+    df = pd.DataFrame({
+        'InvoiceNo': ['1', '1', '2'], 'StockCode': ['A', 'B', 'A'], 'CustomerID': ['7', '7', '8'],
+        'Quantity': [1, 2, 3], 'UnitPrice': [10.0, 5.0, 2.0],
+        'InvoiceDate': pd.to_datetime(['2011-01-03 10:00', '2011-01-04 11:00', '2011-01-08 12:00'])
+    })
+    history = pd.DataFrame({'date': pd.to_datetime(['2011-01-03', '2011-01-04']), 'USD': [1.5, 1.6], 'EUR': [1.1, 1.2]})
+
+    for rates in [{'USD': 1.5, 'EUR': 1.2}, history]:
+        materialized = CurrencyTransformer(df, rates, materialize=True).transform()
+        transformer = CurrencyTransformer(df, rates, materialize=False)
+        on_read = transformer.transform()
+        assert 'Total_USD' not in on_read.columns
+        pd.testing.assert_frame_equal(with_currency_totals(on_read, transformer.rate_table()), materialized,
+                                      check_like=True)
+        assert QualityChecks(on_read, fx_rates=transformer.rate_table()).run_checks()
+
+    # Only the rate dates the lines use are kept, and lines without rates fail DQ
+    fx_rates = transformer.rate_table()
+    assert sorted(fx_rates['rate_date'].unique()) == list(pd.to_datetime(['2011-01-03', '2011-01-04']))
+    assert not QualityChecks(on_read, fx_rates=fx_rates[fx_rates['rate_date'] == '2011-01-03']).run_checks()
+
 def test_rfm_segmentation():
     # Need at least 4 customers for q=4 binning
     now = pd.Timestamp.now()
@@ -73,3 +137,295 @@ def test_fraud_detection():
     # Row 3 (Index 2) should be flagged as suspect
     assert result.iloc[2]['Is_Fraud_Suspect'] == True
     assert result.iloc[0]['Is_Fraud_Suspect'] == False
+
+def test_rfm_state_matches_batch_segments():
+    from src.transformation.rfm import RFMState
+
+    now = pd.Timestamp('2023-06-01')
+    df = pd.DataFrame({
+        'CustomerID': ['A', 'A', 'B', 'C', 'C', 'D', 'E', 'E'],
+        'InvoiceDate': [now - pd.Timedelta(days=d) for d in [1, 40, 10, 50, 50, 100, 3, 3]],
+        'InvoiceNo': ['1', '2', '3', '4', '4', '5', '6', '6'],
+        'Total_GBP': [100, 50, 500, 80, 20, 10, 300, 5]
+    })
+
+    state = RFMState()
+    # Invoice '4' and '6' are split across chunks and must be counted once
+    for start in range(0, len(df), 3):
+        state.update(df.iloc[start:start + 3])
+
+    expected = RFMSegmenter(df).generate_segments()
+    pd.testing.assert_frame_equal(state.generate_segments(), expected, check_dtype=False)
+
+def test_fraud_baseline_single_chunk_matches_batch():
+    from src.transformation.fraud import FraudDetector, FraudBaseline
+
+    df = pd.DataFrame({
+        'InvoiceNo': ['1', '2', '3', '4'],
+        'StockCode': ['P1', 'P1', 'P1', 'P2'],
+        'UnitPrice': [10.0, 10.0, 50.0, 3.0],
+        'Quantity': [1, 1, 1, 2],
+        'Total_GBP': [10.0, 10.0, 5000.0, 6.0],
+        'InvoiceDate': pd.to_datetime(['2023-01-01'] * 4),
+        'CustomerID': ['C1', 'C1', 'C1', 'C2']
+    })
+    batch = FraudDetector(df).detect()
+    streamed = FraudDetector(df, baseline=FraudBaseline()).detect()
+    assert streamed['Is_Fraud_Suspect'].tolist() == batch['Is_Fraud_Suspect'].tolist()
+
+def legacy_rfm_segments(df):
+    """The row-wise RFM implementation the vectorized one replaced, kept as the reference"""
+    snapshot_date = df['InvoiceDate'].max() + pd.Timedelta(days=1)
+    rfm = df.groupby('CustomerID').agg({
+        'InvoiceDate': lambda x: (snapshot_date - x.max()).days,
+        'InvoiceNo': 'nunique',
+        'Total_GBP': 'sum'
+    }).reset_index()
+    rfm.rename(columns={'InvoiceDate': 'Recency', 'InvoiceNo': 'Frequency', 'Total_GBP': 'Monetary'}, inplace=True)
+
+    rfm['R_Score'] = pd.qcut(rfm['Recency'], q=4, labels=[4, 3, 2, 1], duplicates='drop')
+    rfm['F_Score'] = pd.qcut(rfm['Frequency'].rank(method='first'), q=4, labels=[1, 2, 3, 4])
+    rfm['M_Score'] = pd.qcut(rfm['Monetary'], q=4, labels=[1, 2, 3, 4])
+    rfm['R'] = rfm['R_Score'].astype(str)
+    rfm['F'] = rfm['F_Score'].astype(str)
+    rfm['M'] = rfm['M_Score'].astype(str)
+    rfm['RFM_Segment'] = rfm['R'] + rfm['F'] + rfm['M']
+    rfm['RFM_Score'] = rfm[['R_Score', 'F_Score', 'M_Score']].sum(axis=1)
+
+    def segment_customer(row):
+        score, r, f, m = row['RFM_Score'], int(row['R']), int(row['F']), int(row['M'])
+        if score >= 11:
+            return 'Best Customers'
+        elif score >= 9:
+            return 'Loyal Customers'
+        elif f >= 4 and m >= 4:
+            return 'Big Spenders'
+        elif score >= 7:
+            return 'Potential Loyalists'
+        elif r <= 1:
+            return 'Lost Customers'
+        elif r <= 2:
+            return 'At Risk'
+        else:
+            return 'Recent Customers'
+
+    rfm['Customer_Segment'] = rfm.apply(segment_customer, axis=1)
+    return rfm
+
+def test_rfm_vectorized_segments_match_row_rules():
+    import numpy as np
+
+    rng = np.random.default_rng(7)
+    n = 3_000
+    df = pd.DataFrame({
+        'CustomerID': rng.integers(0, 400, n).astype(str),
+        'InvoiceDate': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24, n), unit='h'),
+        'InvoiceNo': rng.integers(0, 1_200, n).astype(str),
+        'Total_GBP': rng.gamma(2.0, 50.0, n)
+    })
+    result = RFMSegmenter(df).generate_segments()
+    expected = legacy_rfm_segments(df)
+
+    columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary', 'RFM_Segment', 'RFM_Score', 'Customer_Segment']
+    pd.testing.assert_frame_equal(result[columns], expected[columns], check_dtype=False)
+    # Every reachable rule of the cascade is exercised ('Big Spenders' is shadowed:
+    # F = M = 4 already scores 9, a 'Loyal Customers' match)
+    assert result['Customer_Segment'].nunique() == 6
+
+def test_rfm_state_persists_between_batches(tmp_path):
+    from src.transformation.rfm import RFMState
+
+    now = pd.Timestamp('2023-06-01')
+    df = pd.DataFrame({
+        'CustomerID': ['A', 'B', 'C', 'D', 'D', 'A', 'E'],
+        'InvoiceDate': [now - pd.Timedelta(days=d) for d in [90, 60, 30, 20, 20, 2, 1]],
+        'InvoiceNo': ['1', '2', '3', '4', '4', '5', '6'],
+        'Total_GBP': [10, 20, 30, 40, 15, 50, 75],
+        'Country': ['UK', 'UK', 'FRANCE', 'UK', 'UK', 'UK', 'SPAIN']
+    })
+
+    initial = RFMState()
+    initial.update(df.iloc[:4])
+    initial.save(tmp_path)
+
+    # Invoice '4' continues in the increment; only the increment's month is read back
+    incremental = RFMState.load(tmp_path)
+    incremental.update(df.iloc[4:])
+    assert list(incremental.invoices.frames) == ['2023-05']
+
+    expected = RFMSegmenter(df).generate_segments()
+    pd.testing.assert_frame_equal(incremental.generate_segments(), expected, check_dtype=False)
+    assert incremental.country_map()['E'] == 'SPAIN'
+
+def test_rfm_state_retracts_removed_lines(tmp_path):
+    from src.transformation.rfm import RFMState
+
+    now = pd.Timestamp('2023-06-01')
+    df = pd.DataFrame({
+        'CustomerID': ['A', 'B', 'C', 'D', 'D', 'A', 'E'],
+        'InvoiceDate': [now - pd.Timedelta(days=d) for d in [90, 60, 30, 20, 20, 2, 1]],
+        'InvoiceNo': ['1', '2', '3', '4', '4', '5', '6'],
+        'Total_GBP': [10, 20, 30, 40, 15, 50, 75]
+    })
+    state = RFMState()
+    state.update(df)
+    state.save(tmp_path)
+
+    # One line of invoice '4' (still counted), A's latest invoice and E's only one
+    removed = df.iloc[[4, 5, 6]]
+    state = RFMState.load(tmp_path)
+    state.retract(removed)
+    kept = df.drop(removed.index)
+
+    assert 'E' not in state.customers.index
+    assert state.customers.loc['A', 'Last_Purchase'] == now - pd.Timedelta(days=90)
+    expected = RFMSegmenter(kept).generate_segments()
+    pd.testing.assert_frame_equal(state.generate_segments(), expected, check_dtype=False)
+
+def test_fraud_baseline_scores_increment_against_history(tmp_path):
+    from src.transformation.fraud import FraudDetector, FraudBaseline
+
+    history = pd.DataFrame({
+        'InvoiceNo': [str(i) for i in range(5)],
+        'StockCode': ['P1'] * 5,
+        'UnitPrice': [10.0] * 5,
+        'Quantity': [1] * 5,
+        'Total_GBP': [10.0] * 5,
+        'InvoiceDate': pd.to_datetime(['2023-01-01'] * 5),
+        'CustomerID': ['C1', 'C2', 'C3', 'C4', 'C5']
+    })
+    increment = pd.DataFrame({
+        'InvoiceNo': ['9'],
+        'StockCode': ['P1'],
+        'UnitPrice': [30.0],
+        'Quantity': [1],
+        'Total_GBP': [30.0],
+        'InvoiceDate': pd.to_datetime(['2023-01-02']),
+        'CustomerID': ['C6']
+    })
+
+    baseline = FraudBaseline()
+    FraudDetector(history, baseline=baseline).detect()
+    baseline.save(tmp_path)
+
+    # On its own the increment is its own product average; against history it is 3x
+    assert not FraudDetector(increment).detect()['Is_Fraud_Suspect'].iloc[0]
+    result = FraudDetector(increment, baseline=FraudBaseline.load(tmp_path)).detect()
+    assert result['Is_Fraud_Suspect'].iloc[0]
+
+def test_fraud_baseline_retracts_update_before_images(tmp_path):
+    import numpy as np
+    from src.transformation.fraud import FraudDetector, FraudBaseline
+
+    history = pd.DataFrame({
+        'InvoiceNo': ['1', '1', '2', '3'],
+        'StockCode': ['P1', 'P2', 'P1', 'P2'],
+        'UnitPrice': [10.0, 4.0, 12.0, 5.0],
+        'Quantity': [1, 2, 1, 3],
+        'InvoiceDate': pd.to_datetime(['2023-01-01', '2023-01-01', '2023-01-01', '2023-02-03']),
+        'CustomerID': ['C1', 'C1', 'C1', 'C2']
+    })
+    history['Total_GBP'] = history['Quantity'] * history['UnitPrice']
+
+    def state(baseline):
+        invoices = baseline.invoices.read(['2023-01', '2023-02'])
+        return (baseline.price_stats.sort_index(),
+                invoices.sort_values(['CustomerID', 'InvoiceNo']).reset_index(drop=True),
+                np.sort(baseline.values))
+
+    def replay_update(before, after):
+        # An UPDATE arrives as its after image (scored and folded) and its before image (retracted)
+        baseline = FraudBaseline.load(tmp_path)
+        FraudDetector(after, baseline=baseline).detect()
+        baseline.retract(before)
+        baseline.save(tmp_path)
+        return baseline
+
+    original = FraudBaseline()
+    original.fold(history)
+    original.save(tmp_path)
+    expected = state(FraudBaseline.load(tmp_path))
+
+    # Re-pricing a line of invoice '1' keeps the invoice counted and moves the product average
+    repriced = history.iloc[[1]].assign(UnitPrice=6.0, Total_GBP=12.0)
+    updated = state(replay_update(history.iloc[[1]], repriced))
+    assert updated[0].loc['P2', 'sum'] == 11.0
+    assert updated[1]['lines'].tolist() == [2, 1, 1]
+
+    # Reverting the update leaves the baseline as it was
+    for actual, original_part in zip(state(replay_update(repriced, history.iloc[[1]])), expected):
+        if isinstance(actual, np.ndarray):
+            np.testing.assert_array_equal(actual, original_part)
+        else:
+            pd.testing.assert_frame_equal(actual, original_part, check_dtype=False)
+
+def test_fraud_baseline_quartiles_exact_until_sketch_threshold(tmp_path, monkeypatch):
+    import numpy as np
+    from config.settings import settings
+    from src.transformation.fraud import FraudBaseline
+    monkeypatch.setattr(settings, 'FRAUD_SKETCH_MIN_ROWS', 100)
+
+    def batch(values, day):
+        return pd.DataFrame({
+            'InvoiceNo': [f"{day}-{i}" for i in range(len(values))],
+            'StockCode': ['P1'] * len(values),
+            'UnitPrice': [1.0] * len(values),
+            'Total_GBP': values,
+            'InvoiceDate': pd.to_datetime([f'2023-01-{day:02d}'] * len(values)),
+            'CustomerID': ['C1'] * len(values)
+        })
+
+    first, second = batch(np.arange(60.0), 1), batch(np.arange(60.0, 90.0), 2)
+    baseline = FraudBaseline()
+    baseline.fold(first)
+    baseline.save(tmp_path)
+    baseline = FraudBaseline.load(tmp_path)
+    baseline.fold(second)
+
+    # 90 rows: below the threshold the quartiles are those of the full history
+    q1, q3, _, _ = baseline.scores(second)
+    assert (q1, q3) == tuple(np.quantile(np.arange(90.0), [0.25, 0.75]))
+    assert baseline.value_sketch is None
+
+    baseline.fold(batch(np.arange(90.0, 120.0), 3))
+    baseline.save(tmp_path)
+    restored = FraudBaseline.load(tmp_path)
+    assert restored.values is None and restored.value_sketch.n == 120
+    assert not (tmp_path / "values.npy").exists()
+
+def test_copy_free_pipeline_shares_one_frame():
+    import tracemalloc
+    import numpy as np
+    from src.transformation.fraud import FraudDetector
+
+    def run_stages(copy):
+        rng = np.random.default_rng(0)
+        n = 100_000
+        tracemalloc.start()
+        df = pd.DataFrame({
+            'InvoiceNo': rng.integers(500000, 600000, n),
+            'StockCode': rng.integers(10000, 13000, n),
+            'Quantity': rng.integers(1, 50, n),
+            'InvoiceDate': pd.Timestamp('2011-01-01') + pd.to_timedelta(rng.integers(0, 3 * 10**7, n), unit='s'),
+            'UnitPrice': rng.random(n) * 10 + 0.1,
+            'CustomerID': rng.integers(10000, 60000, n)
+        })
+        dataset_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        out = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}, copy=copy).transform()
+        RFMSegmenter(out, copy=copy).generate_segments()
+        out = FraudDetector(out, copy=copy).detect()
+
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return out is df, (current - dataset_size) / dataset_size, (peak - dataset_size) / dataset_size
+
+    shared, retained, peak = run_stages(copy=False)
+    _, _, copy_peak = run_stages(copy=True)
+
+    # Every stage wrote into the input frame, which only grew by its new columns
+    assert shared
+    assert retained < 1.0
+    # Transient peaks come from groupby work, not from copies of the dataset
+    assert peak < copy_peak - 1.0
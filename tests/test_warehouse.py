@@ -0,0 +1,432 @@
+import pytest
+import pandas as pd
+import sqlalchemy
+from src.warehouse.loader import WarehouseLoader
+from src.warehouse.key_index import DimensionKeyIndex
+
+@pytest.fixture
+def pg_loader():
+    """WarehouseLoader against the configured PostgreSQL; skipped when it is not running"""
+    loader = WarehouseLoader()
+    try:
+        with loader.engine.connect():
+            pass
+    except Exception:
+        pytest.skip("PostgreSQL warehouse not reachable")
+    return loader
+
+def test_bulk_insert_falls_back_to_to_sql():
+    loader = WarehouseLoader()
+    loader.engine = sqlalchemy.create_engine("sqlite://")
+    df = pd.DataFrame({'product_key': ['A', 'B'], 'unit_price_gbp': [1.5, None]})
+
+    loader._bulk_insert(df, 'dim_product_test')
+    result = pd.read_sql("SELECT * FROM dim_product_test", loader.engine)
+    pd.testing.assert_frame_equal(result, df)
+
+def test_copy_insert_roundtrip(pg_loader):
+    df = pd.DataFrame({
+        'product_key': ['T1', 'T2', 'T3'],
+        'description': ['plain', 'comma, "quoted"', None],
+        'unit_price_gbp': [1.25, None, 3.0]
+    })
+    with pg_loader.engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TEMP TABLE IF NOT EXISTS copy_test (product_key TEXT, description TEXT, unit_price_gbp FLOAT)"))
+        pg_loader._bulk_insert(df, 'copy_test', connection=conn)
+        result = pd.read_sql("SELECT * FROM copy_test ORDER BY product_key", conn)
+    pd.testing.assert_frame_equal(result, df, check_dtype=False)
+
+def test_fact_row_keys_are_stable_and_unique(tmp_path):
+    pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+
+    df = pd.DataFrame({
+        'InvoiceNo': ['1001', '1001', '1001', '1002'],
+        'StockCode': ['A', 'A', 'B', 'A'],
+        'CustomerID': [7.0, 7.0, 7.0, 8.0],
+        'InvoiceDate': pd.to_datetime(['2011-01-01 10:00'] * 3 + ['2011-01-02 09:30']),
+        'Quantity': [1, 2, 1, 1],
+        'UnitPrice': [2.5, 2.5, 2.5, 2.5],
+        'Total_GBP': [2.5, 5.0, 2.5, 2.5]
+    }, index=[10, 20, 30, 40])
+    keys_of = lambda loader: loader.read_sql("SELECT quantity, product_key, invoice_no, row_key FROM fact_sales ORDER BY 1, 2, 3")
+
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    loader.init_db()
+    loader.load_facts(df)
+    keys = keys_of(loader)
+    assert keys['row_key'].is_unique and len(keys) == len(df)
+
+    # Keys depend on content, not on the frame's index or the rest of the batch
+    other = DuckDBLoader(tmp_path / "other.duckdb")
+    other.init_db()
+    other.load_facts(df.iloc[[3, 1]].reset_index(drop=True))
+    other.load_facts(df.iloc[[0, 2]])
+    pd.testing.assert_frame_equal(keys_of(other), keys)
+
+def legacy_fact_rows(df):
+    """fact_sales rows as loaded before row_key existed (appended, so a rerun doubled them)"""
+    rows = pd.DataFrame({
+        'invoice_no': df['InvoiceNo'].astype(str), 'invoice_date': df['InvoiceDate'],
+        'customer_key': df['CustomerID'].astype(str), 'product_key': df['StockCode'].astype(str),
+        'quantity': df['Quantity'], 'unit_price': df['UnitPrice'], 'total_gbp': df['Total_GBP'],
+        'total_usd': df['Total_USD'], 'total_eur': df['Total_EUR'], 'total_mad': df['Total_MAD'],
+        'is_fraud_suspect': False
+    })
+    return pd.concat([rows, rows.iloc[:50]], ignore_index=True)
+
+LEGACY_FACT_SALES_SQL = """
+    CREATE TABLE fact_sales (
+        sales_id {id_type} PRIMARY KEY, invoice_no VARCHAR(50), invoice_date TIMESTAMP,
+        customer_key VARCHAR(50), product_key VARCHAR(50), quantity INTEGER, unit_price FLOAT,
+        total_gbp FLOAT, total_usd FLOAT, total_eur FLOAT, total_mad FLOAT, is_fraud_suspect BOOLEAN
+    )
+"""
+
+def test_row_keys_backfill_a_legacy_fact_table(pg_scratch_loader):
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+
+    df = DataCleaner(generate_online_retail(2_000, seed=8)).clean()
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    loader = pg_scratch_loader
+    with loader.engine.begin() as conn:
+        conn.execute(sqlalchemy.text(LEGACY_FACT_SALES_SQL.format(id_type='SERIAL')))
+    legacy_fact_rows(df).to_sql('fact_sales', loader.engine, if_exists='append', index=False)
+
+    loader.init_db()
+    loader.load_facts(df)
+    facts = loader.read_sql("SELECT COUNT(*) AS n, COUNT(row_key) AS keyed, SUM(total_gbp) AS revenue FROM fact_sales").iloc[0]
+    assert facts['n'] == facts['keyed'] == len(df)
+    assert facts['revenue'] == pytest.approx(df['Total_GBP'].sum())
+    rollup = loader.read_sql("SELECT SUM(revenue_gbp) AS revenue FROM agg_daily_sales").iloc[0]
+    assert rollup['revenue'] == pytest.approx(df['Total_GBP'].sum())
+
+def test_duckdb_row_keys_backfill_a_legacy_fact_table(tmp_path):
+    duckdb = pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+
+    df = DataCleaner(generate_online_retail(2_000, seed=8)).clean()
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    legacy = legacy_fact_rows(df)
+    with duckdb.connect(str(tmp_path / "dw.duckdb")) as conn:
+        conn.execute(LEGACY_FACT_SALES_SQL.format(id_type='BIGINT'))
+        conn.register('legacy', legacy.assign(sales_id=range(1, len(legacy) + 1)))
+        conn.execute(f"INSERT INTO fact_sales ({', '.join(legacy.columns)}, sales_id) SELECT * FROM legacy")
+
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    loader.init_db()
+    loader.load_facts(df)
+    facts = loader.read_sql("SELECT COUNT(*) AS n, COUNT(row_key) AS keyed, SUM(total_gbp) AS revenue FROM fact_sales").iloc[0]
+    assert facts['n'] == facts['keyed'] == len(df)
+    assert facts['revenue'] == pytest.approx(df['Total_GBP'].sum())
+
+def test_dimension_key_index_diff():
+    index = DimensionKeyIndex('dim_product', 'product_key', ['description', 'unit_price_gbp'])
+    index.hashes = pd.Series(dtype='uint64', index=pd.Index([], dtype=object))
+    products = pd.DataFrame({
+        'product_key': ['A', 'B'],
+        'description': ['Mug', None],
+        'unit_price_gbp': [1.5, 2.0]
+    })
+    is_new, is_changed, hashes = index.diff(products)
+    assert is_new.all() and not is_changed.any()
+    index.update(products['product_key'], hashes)
+
+    batch = pd.DataFrame({
+        'product_key': ['A', 'B', 'C'],
+        'description': ['Mug', None, 'Lamp'],
+        'unit_price_gbp': [1.75, 2.0, 9.0]
+    })
+    is_new, is_changed, _ = index.diff(batch)
+    assert is_new.tolist() == [False, False, True]
+    assert is_changed.tolist() == [True, False, False]
+
+def test_dimension_key_index_snapshot_follows_load_token(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'dw.db'}")
+    pd.DataFrame({'product_key': ['A', 'B'], 'description': ['Mug', 'Lamp']}).to_sql('dim_product', engine, index=False)
+    path = tmp_path / "dim_product.parquet"
+
+    index = DimensionKeyIndex('dim_product', 'product_key', ['description'], path=path)
+    index.warm(engine, lambda: '1@2023-01-01T00:00:00')
+    index.save('1@2023-01-01T00:00:00')
+
+    # Changed behind the snapshot's back, with the same row count
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("UPDATE dim_product SET description = 'Vase' WHERE product_key = 'B'"))
+    changed = pd.DataFrame({'product_key': ['B'], 'description': ['Vase']})
+
+    trusted = DimensionKeyIndex('dim_product', 'product_key', ['description'], path=path)
+    trusted.warm(engine, lambda: '1@2023-01-01T00:00:00')
+    assert trusted.diff(changed)[1].all()
+    rebuilt = DimensionKeyIndex('dim_product', 'product_key', ['description'], path=path)
+    rebuilt.warm(engine, lambda: '2@2023-01-02T00:00:00')
+    assert not rebuilt.diff(changed)[1].any()
+
+def test_product_prices_follow_repricing_not_line_noise(pg_scratch_loader):
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner, decode_categoricals
+    from src.warehouse.loader import product_rows
+
+    df = decode_categoricals(DataCleaner(generate_online_retail(1_000, seed=2)).clean())
+    loader = pg_scratch_loader
+    loader.init_db()
+    loader.load_dimensions(df)
+    stored = lambda: loader.read_sql("SELECT product_key, description, unit_price_gbp FROM dim_product ORDER BY 1")
+    first = stored()
+
+    # The same lines in another order lead with other prices, but change no product
+    assert not loader.product_index.diff(product_rows(df.iloc[::-1]))[1].any()
+
+    # A later batch reprices and renames one product
+    product = df['StockCode'].value_counts().index[0]
+    repriced = df.copy()
+    sold = repriced['StockCode'] == product
+    repriced.loc[sold, 'UnitPrice'] += 1.0
+    repriced.loc[sold, 'Description'] = 'RENAMED'
+    loader.load_dimensions(repriced)
+    second = stored()
+
+    changed = second.loc[second['product_key'] == product].iloc[0]
+    before = first.loc[first['product_key'] == product].iloc[0]
+    assert changed['description'] == 'RENAMED'
+    assert changed['unit_price_gbp'] == pytest.approx(before['unit_price_gbp'] + 1.0)
+    others = second['product_key'] != product
+    pd.testing.assert_frame_equal(second[others], first[others])
+
+def test_duckdb_backend_loads_idempotently(tmp_path):
+    pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+    from src.transformation.rfm import RFMSegmenter
+
+    df = DataCleaner(generate_online_retail(5_000, seed=1)).clean()
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    rfm_df = RFMSegmenter(df).generate_segments()
+
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    loader.init_db()
+    for _ in range(2):
+        loader.load_dimensions(df, rfm_df)
+        loader.load_facts(df)
+
+    facts = loader.read_sql("SELECT COUNT(*) AS n, SUM(total_gbp) AS revenue FROM fact_sales")
+    assert facts['n'].iloc[0] == len(df)
+    assert facts['revenue'].iloc[0] == pytest.approx(df['Total_GBP'].sum())
+    assert loader.read_sql("SELECT COUNT(*) AS n FROM dim_customer")['n'].iloc[0] == len(rfm_df)
+
+    # A changed total is merged into the existing row
+    df.loc[df.index[0], 'Total_GBP'] += 1.0
+    loader.load_facts(df)
+    assert loader.read_sql("SELECT COUNT(*) AS n FROM fact_sales")['n'].iloc[0] == len(df)
+    by_country = loader.read_sql("SELECT * FROM v_sales_by_country")
+    assert by_country['revenue_gbp'].sum() == pytest.approx(df['Total_GBP'].sum())
+
+def test_invoice_lines_split_across_batches_keep_their_keys(tmp_path):
+    pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+
+    df = DataCleaner(generate_online_retail(200, seed=1)).clean()
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    # Two lines of one invoice for the same product and timestamp, loaded in separate batches
+    first = df.iloc[[0]]
+    second = first.assign(Quantity=first['Quantity'] + 1, Total_GBP=first['Total_GBP'] * 2)
+
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    loader.init_db()
+    loader.load_dimensions(df)
+    loader.load_facts(first)
+    loader.load_facts(second)
+    loader.load_facts(first)
+
+    lines = loader.read_sql("SELECT quantity FROM fact_sales ORDER BY quantity")
+    assert lines['quantity'].tolist() == [first['Quantity'].iloc[0], second['Quantity'].iloc[0]]
+
+def test_currencies_computed_on_read(tmp_path):
+    pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+
+    df = DataCleaner(generate_online_retail(2_000, seed=6)).clean()
+    history = pd.DataFrame({'date': pd.date_range('2010-01-01', '2012-12-31', freq='W'), 'USD': 1.2, 'EUR': 1.1, 'MAD': 12.0})
+    history['USD'] += range(len(history))
+    transformer = CurrencyTransformer(df, history, materialize=False)
+    df = transformer.transform()
+
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    loader.init_db()
+    loader.load_dimensions(df, fx_rates=transformer.rate_table())
+    loader.load_facts(df)
+
+    stored = loader.read_sql("SELECT COUNT(total_usd) AS n FROM fact_sales")
+    assert stored['n'].iloc[0] == 0
+    expected = CurrencyTransformer(df, history, materialize=True).transform()
+    totals = loader.read_sql("SELECT currency, SUM(total) AS total FROM v_fact_sales_fx GROUP BY currency").set_index('currency')['total']
+    assert sorted(totals.index) == ['EUR', 'GBP', 'MAD', 'USD']
+    for currency in totals.index:
+        assert totals[currency] == pytest.approx(expected[f'Total_{currency}'].sum())
+
+    # Another currency is a few fx_rates rows, not a schema change
+    jpy = transformer.rate_table().query("currency == 'USD'").assign(currency='JPY', rate=160.0)
+    loader.load_dimensions(df, fx_rates=jpy)
+    lines = loader.read_sql("SELECT COUNT(*) AS n, SUM(total) AS total FROM v_fact_sales_fx WHERE currency = 'JPY'").iloc[0]
+    assert lines['n'] == len(df)
+    assert lines['total'] == pytest.approx(expected['Total_GBP'].sum() * 160.0)
+
+def test_rollups_follow_incremental_loads(tmp_path):
+    pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+    from src.transformation.rfm import RFMSegmenter
+
+    df = DataCleaner(generate_online_retail(5_000, seed=2)).clean()
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    loader.init_db()
+    loader.load_dimensions(df, RFMSegmenter(df).generate_segments())
+
+    # Batches split mid-invoice, a retried batch and a changed line
+    loader.load_facts(df.iloc[:3_000])
+    loader.load_facts(df.iloc[2_000:])
+    loader.load_facts(df.iloc[2_000:])
+    df.loc[df.index[10], 'Total_GBP'] += 5.0
+    loader.load_facts(df.iloc[:100])
+
+    daily = loader.read_sql("""
+        SELECT CAST(invoice_date AS DATE) AS sale_date, SUM(total_gbp) AS revenue_gbp,
+               COUNT(*) AS line_count, COUNT(DISTINCT invoice_no) AS order_count
+        FROM fact_sales GROUP BY 1 ORDER BY 1
+    """)
+    rollup = loader.read_sql("""
+        SELECT sale_date, SUM(revenue_gbp) AS revenue_gbp, SUM(line_count) AS line_count,
+               SUM(order_count) AS order_count
+        FROM agg_daily_sales GROUP BY 1 ORDER BY 1
+    """)
+    pd.testing.assert_frame_equal(rollup, daily, check_dtype=False)
+
+    orders = loader.read_sql("SELECT invoice_no, SUM(total_gbp) AS total_gbp FROM fact_sales GROUP BY 1 ORDER BY 1")
+    rollup = loader.read_sql("SELECT invoice_no, total_gbp FROM agg_orders ORDER BY 1")
+    pd.testing.assert_frame_equal(rollup, orders, check_dtype=False)
+
+    segments = loader.read_sql("SELECT SUM(customer_count) AS n FROM agg_customer_segments")
+    assert segments['n'].iloc[0] == df['CustomerID'].nunique()
+
+def test_deletes_leave_facts_and_rollups(tmp_path):
+    pytest.importorskip("duckdb")
+    from src.warehouse.duckdb_loader import DuckDBLoader
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+    from src.transformation.rfm import RFMSegmenter
+
+    df = DataCleaner(generate_online_retail(5_000, seed=4)).clean()
+    df = df[~df.duplicated(['InvoiceNo', 'StockCode'], keep=False)]
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    loader = DuckDBLoader(tmp_path / "dw.duckdb")
+    loader.init_db()
+    loader.load_dimensions(df, RFMSegmenter(df).generate_segments())
+    loader.load_facts(df)
+
+    # Some lines of a few orders, and every line of one order
+    invoice = df['InvoiceNo'].iloc[0]
+    deleted = pd.concat([df[df['InvoiceNo'] == invoice], df.iloc[100:400:7]]).drop_duplicates()
+    assert loader.delete_facts(deleted) == len(deleted)
+    assert loader.delete_facts(deleted) == 0
+    kept = df.drop(deleted.index)
+
+    facts = loader.read_sql("SELECT COUNT(*) AS n, SUM(total_gbp) AS revenue FROM fact_sales").iloc[0]
+    assert facts['n'] == len(kept)
+    assert facts['revenue'] == pytest.approx(kept['Total_GBP'].sum())
+
+    daily = loader.read_sql("""
+        SELECT SUM(revenue_gbp) AS revenue, SUM(line_count) AS lines, SUM(order_count) AS orders,
+               MIN(line_count) AS min_lines
+        FROM agg_daily_sales
+    """).iloc[0]
+    assert daily['revenue'] == pytest.approx(kept['Total_GBP'].sum())
+    assert daily['lines'] == len(kept) and daily['min_lines'] > 0
+    assert daily['orders'] == kept['InvoiceNo'].nunique()
+    orders = loader.read_sql(f"SELECT COUNT(*) AS n FROM agg_orders WHERE invoice_no = '{invoice}'")
+    assert orders['n'].iloc[0] == 0
+
+@pytest.fixture
+def pg_scratch_loader(pg_loader):
+    """WarehouseLoader writing to a throwaway schema of the configured PostgreSQL"""
+    schema = "etl_test"
+    admin = sqlalchemy.create_engine(pg_loader.engine.url)
+    with admin.begin() as conn:
+        conn.execute(sqlalchemy.text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(sqlalchemy.text(f"CREATE SCHEMA {schema}"))
+
+    loader = WarehouseLoader()
+    loader.engine = sqlalchemy.create_engine(pg_loader.engine.url, connect_args={'options': f'-csearch_path={schema}'})
+    loader.session_factory.configure(bind=loader.engine)
+    loader.product_index.path = None
+    loader.date_index.path = None
+    yield loader
+
+    loader.engine.dispose()
+    with admin.begin() as conn:
+        conn.execute(sqlalchemy.text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+    admin.dispose()
+
+def test_fact_partitions_convert_prune_and_detach(pg_scratch_loader, monkeypatch):
+    from config.settings import settings
+    from src.ingestion.synthetic import generate_online_retail
+    from src.transformation.cleaner import DataCleaner
+    from src.transformation.currency import CurrencyTransformer
+    from src.warehouse.loader import fact_partition_name
+
+    df = DataCleaner(generate_online_retail(3_000, seed=5)).clean()
+    df = CurrencyTransformer(df, {'USD': 1.27, 'EUR': 1.16, 'MAD': 12.7}).transform()
+    loader = pg_scratch_loader
+    totals = lambda: loader.read_sql(
+        "SELECT (SELECT COUNT(*) FROM fact_sales) AS n, (SELECT SUM(total_gbp) FROM fact_sales) AS facts, "
+        "(SELECT SUM(revenue_gbp) FROM agg_daily_sales) AS rollup"
+    ).iloc[0]
+
+    # A single-table warehouse is converted in place once partitioning is switched on
+    loader.init_db()
+    loader.load_facts(df)
+    before = totals()
+    monkeypatch.setattr(settings, 'FACT_PARTITIONING', True)
+    loader.init_db()
+    assert loader._facts_partitioned()
+    assert list(totals()) == pytest.approx(list(before))
+
+    months = sorted(df['InvoiceDate'].dt.to_period('M').unique())
+    partitions = loader.read_sql("SELECT inhrelid::regclass::text AS name FROM pg_inherits WHERE inhparent = 'fact_sales'::regclass")
+    assert len(partitions) == len(months) > 2
+
+    # Reloads merge into the existing partitions; date filters only scan their month
+    loader.load_facts(df)
+    assert list(totals()) == pytest.approx(list(before))
+    month = months[1].to_timestamp()
+    plan = loader.read_sql(f"EXPLAIN SELECT SUM(total_gbp) FROM fact_sales WHERE invoice_date >= '{month:%Y-%m-%d}' AND invoice_date < '{month + pd.DateOffset(days=7):%Y-%m-%d}'")
+    plan = ' '.join(plan.iloc[:, 0])
+    assert fact_partition_name(month) in plan
+    assert fact_partition_name(months[0].to_timestamp()) not in plan
+
+    month_rows = df[df['InvoiceDate'].dt.to_period('M') == months[1]]
+    loader.detach_fact_partition(month)
+    detached = totals()
+    assert detached['n'] == before['n'] - len(month_rows)
+    assert detached['rollup'] == pytest.approx(detached['facts'])
+
+    loader.attach_fact_partition(month)
+    restored = totals()
+    assert restored['n'] == before['n']
+    assert restored['rollup'] == pytest.approx(before['facts'])